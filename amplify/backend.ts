@@ -2,7 +2,7 @@ import { defineBackend } from '@aws-amplify/backend';
 import { auth } from './auth/resource';
 import { storage } from './storage/resource';
 import { data, generateShortFunction } from './data/resource'
-import { GenerateShortStateMachine, VideoUploadStateMachine, UnifiedReasoningStateMachine } from './custom/resource';
+import { GenerateShortStateMachine, VideoUploadStateMachine, UnifiedReasoningStateMachine, BedrockCache, BedrockRateLimit, TranscriptLayer } from './custom/resource';
 import { BucketDeployment, Source } from 'aws-cdk-lib/aws-s3-deployment';
 import { CfnBucket } from 'aws-cdk-lib/aws-s3';
 import { EventBus, CfnRule } from 'aws-cdk-lib/aws-events'
@@ -40,6 +40,18 @@ const highlightTable = backend.data.resources.tables["Highlight"]
 const historyTable = backend.data.resources.tables["History"]
 const galleryTable = backend.data.resources.tables["Gallery"]
 
+// Shared cache of Bedrock responses
+const bedrockCacheStack = backend.createStack("BedrockCacheStack");
+const bedrockCache = new BedrockCache(bedrockCacheStack, "BedrockCache");
+
+// Shared Bedrock request and token budgets
+const bedrockRateLimitStack = backend.createStack("BedrockRateLimitStack");
+const bedrockRateLimit = new BedrockRateLimit(bedrockRateLimitStack, "BedrockRateLimit");
+
+// Shared transcript layer, one version for every stack's Lambdas
+const transcriptLayerStack = backend.createStack("TranscriptLayerStack");
+const transcriptLayer = new TranscriptLayer(transcriptLayerStack, "TranscriptLayer");
+
 // Create EventBridge resources first
 const eventStack = backend.createStack("EventBridgeStack");
 const eventBus = EventBus.fromEventBusName(eventStack, "EventBus", "default");
@@ -51,8 +63,11 @@ const unifiedReasoningStateMachine = new UnifiedReasoningStateMachine(
   "UnifiedReasoningStateMachine",
   {
     bucket: s3Bucket,
+    transcriptLayer: transcriptLayer.layer,
     historyTable: historyTable,
-    highlightTable: highlightTable
+    highlightTable: highlightTable,
+    cacheTable: bedrockCache.table,
+    rateLimitTable: bedrockRateLimit.table
   }
 );
 
@@ -108,6 +123,42 @@ new CfnRule(eventStack, "AppSyncRule", {
   ],
 });
 
+// Highlights saved by unified-reasoning while the response still streams
+new CfnRule(eventStack, "HighlightSavedRule", {
+  eventBusName: eventBus.eventBusName,
+  eventPattern: {
+    ["detail-type"]: ["HighlightSaved"],
+  },
+  targets: [
+    {
+      arn: backend.data.resources.cfnResources.cfnGraphqlApi.attrGraphQlEndpointArn,
+      id: "highlightSavedReceiver",
+      roleArn: eventBusRole.roleArn,
+      appSyncParameters: {
+        graphQlOperation: `
+        mutation Publish($videoId: String!, $stage: Int!, $highlight: String, $title: String) {
+          publish(videoId: $videoId, stage: $stage, highlight: $highlight, title: $title) {
+            videoId
+            stage
+            highlight
+            title
+          }
+        }`,
+      },
+      inputTransformer: {
+        inputPathsMap: {
+          videoId: "$.detail.videoId",
+          stage: "$.detail.stage",
+          highlight: "$.detail.highlight",
+          title: "$.detail.title",
+        },
+        // Unquoted placeholders are filled with JSON values, so quotes and backslashes in titles are escaped
+        inputTemplate: `{"videoId": <videoId>, "stage": <stage>, "highlight": <highlight>, "title": <title>}`,
+      },
+    },
+  ],
+});
+
 // Configure video upload handling
 const stepfunctionStack = backend.createStack("StepFunctionStack");
 const videoUploadStateMachine = new VideoUploadStateMachine(
@@ -115,8 +166,11 @@ const videoUploadStateMachine = new VideoUploadStateMachine(
   "VideoUploadStateMachine",
   {
     bucket: s3Bucket,
+    transcriptLayer: transcriptLayer.layer,
     historyTable: historyTable,
-    highlightTable: highlightTable
+    highlightTable: highlightTable,
+    cacheTable: bedrockCache.table,
+    rateLimitTable: bedrockRateLimit.table
   }
 );
 
@@ -0,0 +1,18 @@
+import { Construct } from 'constructs';
+import { AttributeType, BillingMode, Table } from 'aws-cdk-lib/aws-dynamodb';
+import { RemovalPolicy } from 'aws-cdk-lib/core';
+
+export class BedrockCache extends Construct {
+  public readonly table: Table;
+  constructor(scope: Construct, id: string) {
+    super(scope, id);
+
+    // Bedrock responses keyed by request hash; large ones point at bedrock-cache/ in the bucket
+    this.table = new Table(this, 'BedrockCacheTable', {
+      partitionKey: { name: 'key', type: AttributeType.STRING },
+      billingMode: BillingMode.PAY_PER_REQUEST,
+      timeToLiveAttribute: 'expiresAt',
+      removalPolicy: RemovalPolicy.DESTROY
+    });
+  }
+}
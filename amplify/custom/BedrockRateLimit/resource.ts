@@ -0,0 +1,17 @@
+import { Construct } from 'constructs';
+import { AttributeType, BillingMode, Table } from 'aws-cdk-lib/aws-dynamodb';
+import { RemovalPolicy } from 'aws-cdk-lib/core';
+
+export class BedrockRateLimit extends Construct {
+  public readonly table: Table;
+  constructor(scope: Construct, id: string) {
+    super(scope, id);
+
+    // One token-bucket item per Bedrock model, shared by every Lambda that calls it
+    this.table = new Table(this, 'BedrockRateLimitTable', {
+      partitionKey: { name: 'model', type: AttributeType.STRING },
+      billingMode: BillingMode.PAY_PER_REQUEST,
+      removalPolicy: RemovalPolicy.DESTROY
+    });
+  }
+}
@@ -1,20 +1,52 @@
-import { Code, Function, Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Architecture, Code, Function, Runtime, ILayerVersion, LayerVersion } from 'aws-cdk-lib/aws-lambda';
 import { Construct } from 'constructs';
 import { IBucket } from 'aws-cdk-lib/aws-s3';
 import { ITable } from 'aws-cdk-lib/aws-dynamodb';
 import { Duration } from 'aws-cdk-lib/core';
 import { Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
+import { execSync } from 'child_process';
 
 type ExtractTimeframeProps = {
   bucket: IBucket,
+  transcriptLayer: ILayerVersion,
   highlightTable: ITable,
 };
 
 export class ExtractTimeframe extends Construct {
   public readonly handler: Function;
+  public readonly batchHandler: Function;
   constructor(scope: Construct, id: string, props: ExtractTimeframeProps) {
     super(scope, id);
 
+    // NumPy for ALIGNMENT_SCORER=vectorized; it is not part of the python3.12 runtime.
+    // Built with a local pip from the manylinux wheels, or in the SAM build image without one
+    const numpyLayerDir = 'amplify/custom/lambda-layers/numpy';
+    const numpyLayer = new LayerVersion(this, 'NumpyLayer', {
+      code: Code.fromAsset(numpyLayerDir, {
+        bundling: {
+          image: Runtime.PYTHON_3_12.bundlingImage,
+          command: ['bash', '-c', 'pip install -r requirements.txt -t /asset-output/python'],
+          local: {
+            tryBundle(outputDir: string) {
+              try {
+                execSync(
+                  `python3 -m pip install -r ${numpyLayerDir}/requirements.txt -t ${outputDir}/python ` +
+                  '--platform manylinux2014_x86_64 --implementation cp --python-version 3.12 --only-binary=:all:',
+                  { stdio: 'inherit' }
+                );
+                return true;
+              } catch {
+                return false;
+              }
+            },
+          },
+        },
+      }),
+      compatibleRuntimes: [Runtime.PYTHON_3_12],
+      compatibleArchitectures: [Architecture.X86_64],
+      description: 'NumPy for the vectorized alignment scorer',
+    });
+
     // cdk consturct to create lambda function
     this.handler = new Function(this, 'ExtractTimeframe', {
       runtime: Runtime.PYTHON_3_12,
@@ -23,12 +55,38 @@ export class ExtractTimeframe extends Construct {
       environment: {
         BUCKET_NAME: props.bucket.bucketName,
         HIGHLIGHT_TABLE_NAME: props.highlightTable.tableName,
+        ALIGNMENT_SCORER: process.env.ALIGNMENT_SCORER ?? 'index',
+        ALIGNMENT_ORDER: process.env.ALIGNMENT_ORDER ?? 'joint',
+        ALIGNMENT_WORKERS: process.env.ALIGNMENT_WORKERS ?? '0',
+        ALIGNMENT_DEADLINE_MARGIN_MS: process.env.ALIGNMENT_DEADLINE_MARGIN_MS ?? '30000',
       },
       timeout: Duration.seconds(600),
+      layers: [props.transcriptLayer, numpyLayer],
+    });
+
+    // Aligns every highlight of a video in one invocation
+    this.batchHandler = new Function(this, 'ExtractTimeframeBatch', {
+      runtime: Runtime.PYTHON_3_12,
+      code: Code.fromAsset('amplify/custom/lambda-functions/extract-timeframe'),
+      handler: 'lambda_function.batch_lambda_handler',
+      environment: {
+        BUCKET_NAME: props.bucket.bucketName,
+        HIGHLIGHT_TABLE_NAME: props.highlightTable.tableName,
+        ALIGNMENT_SCORER: process.env.ALIGNMENT_SCORER ?? 'index',
+        ALIGNMENT_ORDER: process.env.ALIGNMENT_ORDER ?? 'joint',
+        ALIGNMENT_WORKERS: process.env.ALIGNMENT_WORKERS ?? '0',
+        ALIGNMENT_DEADLINE_MARGIN_MS: process.env.ALIGNMENT_DEADLINE_MARGIN_MS ?? '30000',
+      },
+      timeout: Duration.seconds(900),
+      layers: [props.transcriptLayer, numpyLayer],
+      // Two full vCPUs (1769 MB each), so ALIGNMENT_WORKERS=0 scores windows in two processes
+      memorySize: 3538
     });
 
     props.bucket.grantReadWrite(this.handler);
     props.highlightTable.grantReadWriteData(this.handler);
+    props.bucket.grantReadWrite(this.batchHandler);
+    props.highlightTable.grantReadWriteData(this.batchHandler);
     this.handler.addToRolePolicy(
       new PolicyStatement({
         effect: Effect.ALLOW,
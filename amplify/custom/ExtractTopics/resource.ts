@@ -1,14 +1,17 @@
-import { Code, Function, Runtime } from 'aws-cdk-lib/aws-lambda';
+import { Code, Function, Runtime, ILayerVersion } from 'aws-cdk-lib/aws-lambda';
 import { Construct } from 'constructs';
 import { IBucket } from 'aws-cdk-lib/aws-s3';
 import { ITable } from 'aws-cdk-lib/aws-dynamodb';
-import { Duration } from 'aws-cdk-lib/core';
+import { Duration, Stack } from 'aws-cdk-lib/core';
 import { Effect, PolicyStatement } from 'aws-cdk-lib/aws-iam';
 
 type ExtractTopicsProps = {
   bucket: IBucket,
+  transcriptLayer: ILayerVersion,
   historyTable: ITable,
   highlightTable: ITable,
+  cacheTable: ITable,
+  rateLimitTable: ITable,
 };
 
 export class ExtractTopics extends Construct {
@@ -25,15 +28,35 @@ export class ExtractTopics extends Construct {
         BUCKET_NAME: props.bucket.bucketName,
         HISTORY_TABLE_NAME: props.historyTable.tableName,
         HIGHLIGHT_TABLE_NAME: props.highlightTable.tableName,
-
+        TOPICS_MODE: process.env.TOPICS_MODE ?? 'auto',
+        TOPICS_CHUNK_CHARS: process.env.TOPICS_CHUNK_CHARS ?? '150000',
+        TOPICS_CHUNK_OVERLAP_CHARS: process.env.TOPICS_CHUNK_OVERLAP_CHARS ?? '8000',
+        TOPICS_CONCURRENCY: process.env.TOPICS_CONCURRENCY ?? '4',
+        SECTION_GROUP_SIZE: process.env.SECTION_GROUP_SIZE ?? '0',
+        BEDROCK_CACHE_TABLE_NAME: props.cacheTable.tableName,
+        BEDROCK_CACHE_TTL_SECONDS: process.env.BEDROCK_CACHE_TTL_SECONDS ?? '604800',
+        BEDROCK_CACHE_BYPASS: process.env.BEDROCK_CACHE_BYPASS ?? 'false',
+        BEDROCK_RATE_LIMIT_TABLE_NAME: props.rateLimitTable.tableName,
+        BEDROCK_RATE_LIMITS: process.env.BEDROCK_RATE_LIMITS ?? '{}',
+        BEDROCK_RATE_LIMIT_MAX_WAIT_SECONDS: process.env.BEDROCK_RATE_LIMIT_MAX_WAIT_SECONDS ?? '120',
+        BEDROCK_CALL_DEADLINE_SECONDS: process.env.BEDROCK_CALL_DEADLINE_SECONDS ?? '120',
+        BEDROCK_DEADLINE_TOKENS_PER_SECOND: process.env.BEDROCK_DEADLINE_TOKENS_PER_SECOND ?? '20',
+        BEDROCK_STREAM_IDLE_SECONDS: process.env.BEDROCK_STREAM_IDLE_SECONDS ?? '60',
+        BEDROCK_HEDGE: process.env.BEDROCK_HEDGE ?? 'true',
+        BEDROCK_HEDGE_MAX_OUTPUT_TOKENS: process.env.BEDROCK_HEDGE_MAX_OUTPUT_TOKENS ?? '8192',
+        // The stack's own region; a comma-separated list spreads calls over more regions
+        BEDROCK_REGIONS: process.env.BEDROCK_REGIONS ?? Stack.of(this).region,
       },
       timeout: Duration.seconds(600),
+      layers: [props.transcriptLayer],
       memorySize: 512
     });
 
     props.bucket.grantReadWrite(this.handler);
     props.historyTable.grantReadWriteData(this.handler);
     props.highlightTable.grantReadWriteData(this.handler);
+    props.cacheTable.grantReadWriteData(this.handler);
+    props.rateLimitTable.grantReadWriteData(this.handler);
     this.handler.addToRolePolicy(
       new PolicyStatement({
         effect: Effect.ALLOW,
@@ -0,0 +1,31 @@
+import { Code, Function, Runtime, ILayerVersion } from 'aws-cdk-lib/aws-lambda';
+import { Construct } from 'constructs';
+import { IBucket } from 'aws-cdk-lib/aws-s3';
+import { Duration } from 'aws-cdk-lib/core';
+
+type PrepareTranscriptProps = {
+  bucket: IBucket,
+  transcriptLayer: ILayerVersion,
+};
+
+export class PrepareTranscript extends Construct {
+  public readonly handler: Function;
+  constructor(scope: Construct, id: string, props: PrepareTranscriptProps) {
+    super(scope, id);
+
+    // cdk consturct to create lambda function
+    this.handler = new Function(this, 'PrepareTranscript', {
+      runtime: Runtime.PYTHON_3_12,
+      code: Code.fromAsset('amplify/custom/lambda-functions/prepare-transcript'),
+      handler: 'lambda_function.lambda_handler',
+      environment: {
+        BUCKET_NAME: props.bucket.bucketName,
+      },
+      timeout: Duration.seconds(300),
+      layers: [props.transcriptLayer],
+      memorySize: 1024
+    });
+
+    props.bucket.grantReadWrite(this.handler);
+  }
+}
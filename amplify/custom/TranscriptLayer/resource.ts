@@ -0,0 +1,16 @@
+import { Construct } from 'constructs';
+import { Code, LayerVersion, Runtime } from 'aws-cdk-lib/aws-lambda';
+
+export class TranscriptLayer extends Construct {
+  public readonly layer: LayerVersion;
+  constructor(scope: Construct, id: string) {
+    super(scope, id);
+
+    // One version of the shared transcript modules for every Python Lambda that imports them
+    this.layer = new LayerVersion(this, 'TranscriptLayer', {
+      code: Code.fromAsset('amplify/custom/lambda-layers/transcript'),
+      compatibleRuntimes: [Runtime.PYTHON_3_12],
+      description: 'Shared struct-of-arrays transcript model',
+    });
+  }
+}
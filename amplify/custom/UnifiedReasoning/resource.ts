@@ -3,12 +3,15 @@ import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as iam from 'aws-cdk-lib/aws-iam';
 import { IBucket } from 'aws-cdk-lib/aws-s3';
 import { ITable } from 'aws-cdk-lib/aws-dynamodb';
-import { Duration } from 'aws-cdk-lib/core';
+import { Duration, Stack } from 'aws-cdk-lib/core';
 
 type UnifiedReasoningProps = {
   bucket: IBucket;
+  transcriptLayer: lambda.ILayerVersion;
   historyTable: ITable;
   highlightTable: ITable;
+  cacheTable: ITable;
+  rateLimitTable: ITable;
 };
 
 export class UnifiedReasoning extends Construct {
@@ -24,10 +27,44 @@ export class UnifiedReasoning extends Construct {
       code: lambda.Code.fromAsset('amplify/custom/lambda-functions/unified-reasoning'),
       timeout: Duration.minutes(15),
       memorySize: 1024,
+      layers: [props.transcriptLayer],
       environment: {
         BUCKET_NAME: props.bucket.bucketName,
         HISTORY_TABLE_NAME: props.historyTable.tableName,
-        HIGHLIGHT_TABLE_NAME: props.highlightTable.tableName
+        HIGHLIGHT_TABLE_NAME: props.highlightTable.tableName,
+        REASONING_MODE: process.env.REASONING_MODE ?? 'auto',
+        REASONING_CHUNK_CHARS: process.env.REASONING_CHUNK_CHARS ?? '150000',
+        REASONING_CHUNK_OVERLAP_CHARS: process.env.REASONING_CHUNK_OVERLAP_CHARS ?? '8000',
+        REASONING_CONCURRENCY: process.env.REASONING_CONCURRENCY ?? '4',
+        REASONING_STREAM: process.env.REASONING_STREAM ?? 'true',
+        REASONING_ROUTING: process.env.REASONING_ROUTING ?? 'off',
+        REASONING_MODELS: process.env.REASONING_MODELS ?? '',
+        REASONING_THINKING_MIN_TOKENS: process.env.REASONING_THINKING_MIN_TOKENS ?? '12000',
+        REASONING_THINKING_BASE: process.env.REASONING_THINKING_BASE ?? '2000',
+        REASONING_THINKING_PER_1K_TOKENS: process.env.REASONING_THINKING_PER_1K_TOKENS ?? '600',
+        REASONING_THINKING_PER_SHORT_MINUTE: process.env.REASONING_THINKING_PER_SHORT_MINUTE ?? '1000',
+        REASONING_THINKING_MIN_BUDGET: process.env.REASONING_THINKING_MIN_BUDGET ?? '4000',
+        REASONING_THINKING_MAX_BUDGET: process.env.REASONING_THINKING_MAX_BUDGET ?? '60000',
+        REASONING_ROUTING_SLACK: process.env.REASONING_ROUTING_SLACK ?? '1.5',
+        REASONING_CASCADE: process.env.REASONING_CASCADE ?? 'off',
+        REASONING_CASCADE_MODEL: process.env.REASONING_CASCADE_MODEL ?? 'us.amazon.nova-lite-v1:0',
+        REASONING_CASCADE_MIN_CHARS: process.env.REASONING_CASCADE_MIN_CHARS ?? '150000',
+        REASONING_CASCADE_OVERSAMPLE: process.env.REASONING_CASCADE_OVERSAMPLE ?? '3',
+        REASONING_CASCADE_MARGIN_CUES: process.env.REASONING_CASCADE_MARGIN_CUES ?? '10',
+        REASONING_CASCADE_MAX_SHARE: process.env.REASONING_CASCADE_MAX_SHARE ?? '0.6',
+        BEDROCK_CACHE_TABLE_NAME: props.cacheTable.tableName,
+        BEDROCK_CACHE_TTL_SECONDS: process.env.BEDROCK_CACHE_TTL_SECONDS ?? '604800',
+        BEDROCK_CACHE_BYPASS: process.env.BEDROCK_CACHE_BYPASS ?? 'false',
+        BEDROCK_RATE_LIMIT_TABLE_NAME: props.rateLimitTable.tableName,
+        BEDROCK_RATE_LIMITS: process.env.BEDROCK_RATE_LIMITS ?? '{}',
+        BEDROCK_RATE_LIMIT_MAX_WAIT_SECONDS: process.env.BEDROCK_RATE_LIMIT_MAX_WAIT_SECONDS ?? '120',
+        BEDROCK_CALL_DEADLINE_SECONDS: process.env.BEDROCK_CALL_DEADLINE_SECONDS ?? '120',
+        BEDROCK_DEADLINE_TOKENS_PER_SECOND: process.env.BEDROCK_DEADLINE_TOKENS_PER_SECOND ?? '20',
+        BEDROCK_STREAM_IDLE_SECONDS: process.env.BEDROCK_STREAM_IDLE_SECONDS ?? '60',
+        BEDROCK_HEDGE: process.env.BEDROCK_HEDGE ?? 'true',
+        BEDROCK_HEDGE_MAX_OUTPUT_TOKENS: process.env.BEDROCK_HEDGE_MAX_OUTPUT_TOKENS ?? '8192',
+        // The stack's own region; a comma-separated list spreads calls over more regions
+        BEDROCK_REGIONS: process.env.BEDROCK_REGIONS ?? Stack.of(this).region,
       }
     });
 
@@ -35,6 +72,8 @@ export class UnifiedReasoning extends Construct {
     props.bucket.grantReadWrite(this.handler);
     props.historyTable.grantReadWriteData(this.handler);
     props.highlightTable.grantReadWriteData(this.handler);
+    props.cacheTable.grantReadWriteData(this.handler);
+    props.rateLimitTable.grantReadWriteData(this.handler);
 
     // Add Bedrock permissions
     this.handler.addToRolePolicy(new iam.PolicyStatement({
@@ -46,5 +85,12 @@ export class UnifiedReasoning extends Construct {
       ],
       resources: ['*']
     }));
+
+    // HighlightSaved events for highlights saved while the response streams
+    this.handler.addToRolePolicy(new iam.PolicyStatement({
+      effect: iam.Effect.ALLOW,
+      actions: ['events:PutEvents'],
+      resources: ['*']
+    }));
   }
 }
@@ -0,0 +1,171 @@
+"""Benchmark the extract-timeframe alignment strategies on synthetic transcripts.
+
+For every transcript length and language, highlight scripts are generated
+from known transcript spans and aligned with each strategy. Reported per
+strategy: wall time, peak traced memory, mean boundary error in seconds (how
+far the returned start/end times are from the true span) and the share of
+segments not found.
+
+    python amplify/custom/benchmarks/alignment/run_benchmark.py
+    python amplify/custom/benchmarks/alignment/run_benchmark.py --durations 10m,1h --languages ko \\
+        --strategies index/joint,local/independent --noise 0.2 --json results.json
+
+Needs the extract-timeframe dependencies (boto3; numpy for the vectorized
+scorer). `--write-dir` also saves the generated Transcript.json files.
+"""
+import argparse
+import gc
+import io
+import json
+import os
+import sys
+import time
+import tracemalloc
+from random import Random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'lambda-functions', 'extract-timeframe'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda-layers', 'transcript', 'python'))
+
+# lambda_function reads these at import time; nothing is sent to AWS
+os.environ.setdefault('BUCKET_NAME', 'alignment-benchmark')
+os.environ.setdefault('HIGHLIGHT_TABLE_NAME', 'alignment-benchmark')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
+
+import lambda_function  # noqa: E402
+from transcript_model import Transcript  # noqa: E402
+from transcript_stream import read_transcribe  # noqa: E402
+
+from synthetic_transcripts import make_highlight, make_transcript  # noqa: E402
+
+DURATIONS = {'10m': 600, '1h': 3600, '4h': 14400}
+DEFAULT_STRATEGIES = 'index/joint,index/independent,vectorized/independent,local/independent'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--durations', default='10m,1h,4h', help=f"comma-separated, from {', '.join(DURATIONS)}")
+    parser.add_argument('--languages', default='en,ko', help='comma-separated, from en, ko')
+    parser.add_argument('--strategies', default=DEFAULT_STRATEGIES, help='comma-separated scorer/order pairs')
+    parser.add_argument('--highlights', type=int, default=5, help='highlight scripts per transcript')
+    parser.add_argument('--segments', type=int, default=3, help='[...] segments per highlight')
+    parser.add_argument('--noise', type=float, default=0.1, help='share of script words paraphrased')
+    parser.add_argument('--workers', type=int, default=1, help='ALIGNMENT_WORKERS for the run')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--write-dir', help='save each generated Transcript.json here')
+    parser.add_argument('--json', help='write the result rows to this file')
+    return parser.parse_args()
+
+
+def measure(function):
+    """Run `function` and return (result, seconds, peak traced bytes)."""
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        result = function()
+    finally:
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return result, elapsed, peak
+
+
+def boundary_errors(timeframes, truth):
+    """Mean start/end error per true segment, or None when no frame overlaps it."""
+    errors = []
+    for true_start, true_end in truth:
+        best, best_overlap = None, 0
+        for start, end in timeframes:
+            overlap = min(end, true_end) - max(start, true_start)
+            if overlap > best_overlap:
+                best, best_overlap = (start, end), overlap
+        if best is None:
+            errors.append(None)
+        else:
+            errors.append((abs(best[0] - true_start) + abs(best[1] - true_end)) / 2)
+    return errors
+
+
+def run_strategy(strategy, transcript, highlights):
+    scorer, order = strategy.split('/')
+    lambda_function.ALIGNMENT_SCORER = scorer
+    lambda_function.ALIGNMENT_ORDER = order
+
+    def align_all():
+        get_index = lambda_function.IndexLoader(transcript)
+        try:
+            return [
+                lambda_function.find_timeframes_for_script(
+                    lambda_function.preprocess_highlight_script(script), transcript, get_index
+                )
+                for script, _ in highlights
+            ]
+        finally:
+            get_index.close()
+
+    results, elapsed, peak = measure(align_all)
+    errors = []
+    for timeframes, (_, truth) in zip(results, highlights):
+        errors.extend(boundary_errors(timeframes, truth))
+    found = [e for e in errors if e is not None]
+    return {
+        'strategy': strategy,
+        'seconds': elapsed,
+        'peak_mb': peak / 2**20,
+        'boundary_error_s': sum(found) / len(found) if found else None,
+        'missed': (len(errors) - len(found)) / len(errors) if errors else 0,
+    }
+
+
+def main():
+    args = parse_args()
+    lambda_function.ALIGNMENT_WORKERS = args.workers
+    lambda_function.logger.setLevel('WARNING')
+    rows = []
+
+    header = f"{'transcript':<12}{'strategy':<26}{'time (s)':>10}{'peak (MB)':>11}{'error (s)':>11}{'missed':>8}"
+    print(header)
+    print('-' * len(header))
+
+    for duration_name in args.durations.split(','):
+        for language in args.languages.split(','):
+            name = f'{language}-{duration_name}'
+            transcript_json, words = make_transcript(DURATIONS[duration_name], language, args.seed)
+            raw = json.dumps(transcript_json, ensure_ascii=False)
+            if args.write_dir:
+                os.makedirs(args.write_dir, exist_ok=True)
+                with open(os.path.join(args.write_dir, f'{name}.json'), 'w', encoding='utf-8') as f:
+                    f.write(raw)
+
+            transcript, elapsed, peak = measure(lambda: Transcript.from_transcribe(json.loads(raw)))
+            print(f"{name:<12}{'(parse Transcript.json)':<26}{elapsed:>10.2f}{peak / 2**20:>11.1f}")
+            rows.append({'transcript': name, 'strategy': 'parse', 'seconds': elapsed, 'peak_mb': peak / 2**20,
+                         'items': len(transcript), 'json_mb': len(raw.encode('utf-8')) / 2**20})
+            data = raw.encode('utf-8')
+            del raw, transcript_json
+            _, elapsed, peak = measure(lambda: read_transcribe(io.BytesIO(data)))
+            print(f"{name:<12}{'(stream Transcript.json)':<26}{elapsed:>10.2f}{peak / 2**20:>11.1f}")
+            rows.append({'transcript': name, 'strategy': 'stream', 'seconds': elapsed, 'peak_mb': peak / 2**20})
+            del data
+
+            rng = Random(args.seed)
+            highlights = [
+                make_highlight(words, rng, args.segments, noise=args.noise, language=language)
+                for _ in range(args.highlights)
+            ]
+            for strategy in args.strategies.split(','):
+                row = run_strategy(strategy, transcript, highlights)
+                row['transcript'] = name
+                rows.append(row)
+                error = f"{row['boundary_error_s']:.2f}" if row['boundary_error_s'] is not None else '-'
+                print(f"{name:<12}{strategy:<26}{row['seconds']:>10.2f}{row['peak_mb']:>11.1f}"
+                      f"{error:>11}{row['missed']:>8.0%}")
+
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
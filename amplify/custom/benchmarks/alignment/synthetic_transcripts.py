@@ -0,0 +1,229 @@
+"""Synthetic Amazon Transcribe output and LLM-style highlight scripts.
+
+Transcripts follow the `Transcript.json` layout of a job run with
+`ShowSpeakerLabels`: `results.transcripts`, `results.items` (pronunciation and
+punctuation items, with speaker labels), `results.speaker_labels` and
+`results.audio_segments`. Words are drawn from a Zipf-distributed vocabulary
+so common words repeat the way they do in real speech.
+"""
+import random
+
+# Spoken words per second
+SPEECH_RATE = {'en': 2.6, 'ko': 2.1}
+
+SENTENCE_WORDS = (6, 22)
+SPEAKER_TURN_SENTENCES = (2, 8)
+
+ENGLISH_COMMON = (
+    "the a of and to in is that it was for on are as with they at be this from have or by "
+    "one had not but what all were when we there can an your which their said if do will each "
+    "about how up out them then she many some so these would other into has more her two like "
+    "him see time could no make than first been its who now people my made over did down only "
+    "way find use may water long little very after words called just where most know really "
+    "think going right actually because video model data cloud service customer team build"
+).split()
+
+ENGLISH_SYLLABLES = (
+    "ba be bi bo bu ca ce co cu da de di do du fa fe fi fo ga ge go la le li lo lu ma me mi mo "
+    "na ne ni no pa pe pi po ra re ri ro sa se si so ta te ti to va ve vi wa we ya"
+).split()
+
+KOREAN_COMMON = (
+    "그리고 그래서 이제 저희가 여러분 오늘 이렇게 그냥 정말 진짜 이거 저거 우리 하는 있는 없는 "
+    "것은 것이 거죠 합니다 했습니다 있습니다 됩니다 그런데 하지만 만약 데이터 서비스 고객 모델 "
+    "클라우드 영상 시간 사람 생각 이야기 부분 방법 경우 문제 결과 처음 다음 마지막"
+).split()
+
+HANGUL_ONSETS = 19
+HANGUL_VOWELS = 21
+HANGUL_CODAS = 28
+
+SCRIPT_FILLERS = {
+    'en': ['so', 'basically', 'well', 'you know', 'and'],
+    'ko': ['그래서', '사실', '음', '그러니까', '그리고'],
+}
+
+
+def _english_word(rng):
+    return ''.join(rng.choice(ENGLISH_SYLLABLES) for _ in range(rng.randint(2, 4)))
+
+
+def _korean_word(rng):
+    syllables = []
+    for _ in range(rng.randint(2, 4)):
+        code = (rng.randrange(HANGUL_ONSETS) * HANGUL_VOWELS + rng.randrange(HANGUL_VOWELS)) * HANGUL_CODAS
+        code += rng.choice((0, 0, rng.randrange(HANGUL_CODAS)))
+        syllables.append(chr(0xAC00 + code))
+    return ''.join(syllables)
+
+
+def vocabulary(language, size, seed=0):
+    """Common words first, then generated ones; rank r is drawn with weight 1/r."""
+    rng = random.Random(seed)
+    common, make_word = (ENGLISH_COMMON, _english_word) if language == 'en' else (KOREAN_COMMON, _korean_word)
+    words = list(common)
+    seen = set(words)
+    while len(words) < size:
+        word = make_word(rng)
+        if word not in seen:
+            seen.add(word)
+            words.append(word)
+    return words
+
+
+def _format_time(seconds):
+    return f"{seconds:.3f}"
+
+
+def make_transcript(duration_seconds, language='en', seed=0, speakers=2, vocabulary_size=20000):
+    """Return (transcript_json, words) for `duration_seconds` of speech.
+
+    `words` lists (content, start_time, end_time) for every pronunciation
+    item, in order, for building scripts and checking alignments.
+    """
+    rng = random.Random(seed)
+    vocab = vocabulary(language, vocabulary_size, seed)
+    weights = [1 / rank for rank in range(1, len(vocab) + 1)]
+    rate = SPEECH_RATE[language]
+
+    items = []
+    words = []
+    speaker_segments = []
+    audio_segments = []
+    sentences = []
+    now = 0.0
+    speaker = 0
+    turn_left = rng.randint(*SPEAKER_TURN_SENTENCES)
+
+    while now < duration_seconds:
+        length = rng.randint(*SENTENCE_WORDS)
+        sentence_words = rng.choices(vocab, weights=weights, k=length)
+        if language == 'en':
+            sentence_words[0] = sentence_words[0].capitalize()
+
+        sentence_start = now
+        first_item = len(items)
+        for k, content in enumerate(sentence_words):
+            duration = max(0.12, rng.gauss(1 / rate, 0.08))
+            start, end = now, now + duration
+            items.append({
+                'id': len(items),
+                'type': 'pronunciation',
+                'alternatives': [{'confidence': f"{rng.uniform(0.8, 1):.3f}", 'content': content}],
+                'start_time': _format_time(start),
+                'end_time': _format_time(end),
+                'speaker_label': f'spk_{speaker}',
+            })
+            words.append((content, round(start, 3), round(end, 3)))
+            now = end + rng.uniform(0.0, 0.08)
+            if k < length - 1 and rng.random() < 0.08:
+                items.append(_punctuation(len(items), ',', speaker))
+        items.append(_punctuation(len(items), rng.choice('..?!') if language == 'en' else '.', speaker))
+
+        text = ' '.join(sentence_words)
+        sentences.append(text)
+        audio_segments.append({
+            'id': len(audio_segments),
+            'transcript': text,
+            'start_time': _format_time(sentence_start),
+            'end_time': _format_time(now),
+            'speaker_label': f'spk_{speaker}',
+            'items': list(range(first_item, len(items))),
+        })
+        speaker_segments.append({
+            'start_time': _format_time(sentence_start),
+            'end_time': _format_time(now),
+            'speaker_label': f'spk_{speaker}',
+            'items': [
+                {'start_time': item['start_time'], 'end_time': item['end_time'], 'speaker_label': f'spk_{speaker}'}
+                for item in items[first_item:] if item['type'] == 'pronunciation'
+            ],
+        })
+
+        now += rng.uniform(0.2, 0.9)
+        turn_left -= 1
+        if turn_left == 0:
+            speaker = (speaker + 1) % speakers
+            turn_left = rng.randint(*SPEAKER_TURN_SENTENCES)
+
+    transcript_text = ' '.join(_with_punctuation(items))
+    transcript_json = {
+        'jobName': f'synthetic-{language}-{int(duration_seconds)}s-{seed}',
+        'accountId': '000000000000',
+        'status': 'COMPLETED',
+        'results': {
+            'transcripts': [{'transcript': transcript_text}],
+            'speaker_labels': {'channel_label': 'ch_0', 'speakers': speakers, 'segments': speaker_segments},
+            'items': items,
+            'audio_segments': audio_segments,
+        },
+    }
+    return transcript_json, words
+
+
+def _punctuation(item_id, mark, speaker):
+    return {
+        'id': item_id,
+        'type': 'punctuation',
+        'alternatives': [{'confidence': '0.0', 'content': mark}],
+        'speaker_label': f'spk_{speaker}',
+    }
+
+
+def _with_punctuation(items):
+    out = []
+    for item in items:
+        content = item['alternatives'][0]['content']
+        if item['type'] == 'punctuation' and out:
+            out[-1] += content
+        else:
+            out.append(content)
+    return out
+
+
+def paraphrase(words, noise, rng, language='en'):
+    """Apply LLM-style edits to roughly `noise` of the words.
+
+    Edits drop words, swap in a filler, swap neighbours, insert a filler or
+    append punctuation, the kinds of drift a model adds when quoting.
+    """
+    out = []
+    k = 0
+    while k < len(words):
+        word = words[k]
+        if rng.random() >= noise:
+            out.append(word)
+            k += 1
+            continue
+        edit = rng.random()
+        if edit < 0.3:
+            pass  # dropped
+        elif edit < 0.5:
+            out.append(rng.choice(SCRIPT_FILLERS[language]))
+        elif edit < 0.7 and k + 1 < len(words):
+            out.extend([words[k + 1], word])
+            k += 1
+        elif edit < 0.85:
+            out.extend([rng.choice(SCRIPT_FILLERS[language]), word])
+        else:
+            out.append(word + rng.choice(',.'))
+        k += 1
+    return out
+
+
+def make_highlight(words, rng, segments=3, segment_words=(15, 45), noise=0.1, language='en'):
+    """An in-order highlight script of `segments` parts cut with `[...]`.
+
+    Returns (script, truth) where truth holds the (start_time, end_time) of
+    the transcript words each segment was taken from.
+    """
+    span = len(words) // segments
+    parts = []
+    truth = []
+    for s in range(segments):
+        length = min(rng.randint(*segment_words), span - 1)
+        first = rng.randrange(s * span, (s + 1) * span - length)
+        chosen = words[first:first + length]
+        parts.append(' '.join(paraphrase([content for content, _, _ in chosen], noise, rng, language)))
+        truth.append((chosen[0][1], chosen[-1][2]))
+    return ' [...] '.join(parts), truth
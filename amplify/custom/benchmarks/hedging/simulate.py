@@ -0,0 +1,114 @@
+"""Simulate Bedrock tail latency with and without hedged requests.
+
+A stub Converse API draws every call's latency from a distribution: a
+lognormal body plus a share of stuck calls that take `--stuck-factor` times
+the median. Calls go through `HedgedClient` with hedging off (deadline
+only) and on. Time runs `--speed` times faster than the wall clock.
+Reported per mode, in simulated seconds: latency p50, p95, p99 and max,
+calls that hit the deadline, and duplicate requests as a share of calls.
+
+    python amplify/custom/benchmarks/hedging/simulate.py
+    python amplify/custom/benchmarks/hedging/simulate.py --median 20 --sigma 0.3 \\
+        --stuck 0.05 --stuck-factor 30 --deadline 240 --calls 300
+
+Needs botocore for ClientError; nothing is sent to AWS.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'lambda-layers', 'transcript', 'python'))
+
+from bedrock_hedging import BedrockDeadlineExceeded, HedgedClient  # noqa: E402
+
+MODEL = 'simulated-model'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--calls', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=5, help='calls in flight at once')
+    parser.add_argument('--median', type=float, default=10.0, help='median latency in seconds')
+    parser.add_argument('--sigma', type=float, default=0.25, help='lognormal sigma of the body')
+    parser.add_argument('--stuck', type=float, default=0.03, help='share of calls that get stuck')
+    parser.add_argument('--stuck-factor', type=float, default=40.0, help='stuck latency over the median')
+    parser.add_argument('--deadline', type=float, default=240.0, help='per-call deadline in seconds')
+    parser.add_argument('--speed', type=float, default=50.0, help='simulated seconds per wall second')
+    parser.add_argument('--modes', default='off,hedge', help='comma-separated, from off, hedge')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+class LatencyStub:
+    """Converse API whose latency follows the distribution from the arguments."""
+
+    def __init__(self, args):
+        self.args = args
+        self.random = Random(args.seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def converse(self, **request):
+        with self._lock:
+            self.requests += 1
+            if self.random.random() < self.args.stuck:
+                latency = self.args.median * self.args.stuck_factor
+            else:
+                latency = self.random.lognormvariate(0, self.args.sigma) * self.args.median
+        time.sleep(latency / self.args.speed)
+        return {'output': {'message': {'content': [{'text': 'ok'}]}}, 'usage': {}}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(int(q * len(ordered)), len(ordered) - 1)]
+
+
+def run(mode, args):
+    stub = LatencyStub(args)
+    # A fixed deadline; the stub's latency does not depend on the output limit
+    client = HedgedClient(stub, deadline=args.deadline / args.speed, hedge=mode == 'hedge',
+                          max_workers=args.workers * 2, tokens_per_second=0)
+    request = {'modelId': MODEL, 'messages': [], 'inferenceConfig': {'maxTokens': 4096}}
+
+    def call(_):
+        start = time.monotonic()
+        try:
+            client.converse(**request)
+            failed = False
+        except BedrockDeadlineExceeded:
+            failed = True
+        return (time.monotonic() - start) * args.speed, failed
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        results = list(executor.map(call, range(args.calls)))
+    client._executor.shutdown(wait=False, cancel_futures=True)
+
+    latencies = [latency for latency, _ in results]
+    return {
+        'mode': mode,
+        'p50': percentile(latencies, 0.5),
+        'p95': percentile(latencies, 0.95),
+        'p99': percentile(latencies, 0.99),
+        'max': max(latencies),
+        'deadline': sum(failed for _, failed in results),
+        'extra': (stub.requests - args.calls) / args.calls,
+    }
+
+
+def main():
+    args = parse_args()
+    print(f"{'mode':<6} {'p50':>7} {'p95':>7} {'p99':>7} {'max':>7} {'deadline':>8} {'extra':>6}")
+    for mode in args.modes.split(','):
+        row = run(mode, args)
+        print(f"{row['mode']:<6} {row['p50']:>7.1f} {row['p95']:>7.1f} {row['p99']:>7.1f} {row['max']:>7.1f} "
+              f"{row['deadline']:>8} {row['extra']:>6.1%}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,161 @@
+"""Simulate concurrent Lambdas calling a throttling Bedrock with and without the rate limiter.
+
+A stub Converse API enforces a request and token quota per minute and raises
+ThrottlingException beyond it. Worker threads stand in for the Lambdas of a
+Step Functions Map state; with the limiter they share one `LocalBucketStore`
+the way the deployed functions share the DynamoDB table. Time runs `--speed`
+times faster than the wall clock. Reported per mode: calls completed,
+throttled attempts, simulated minutes and completed calls per minute.
+
+    python amplify/custom/benchmarks/rate_limit/simulate.py
+    python amplify/custom/benchmarks/rate_limit/simulate.py --workers 10 --quota-rpm 20 \\
+        --budget-rpm 50 --calls 8 --speed 120
+
+Needs botocore for ClientError; nothing is sent to AWS.
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from random import Random
+
+ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(ROOT, 'lambda-layers', 'transcript', 'python'))
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bedrock_limiter import LocalBucketStore, RateLimitedClient, RateLimiter  # noqa: E402
+
+MODEL = 'simulated-model'
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--workers', type=int, default=5, help='concurrent Lambdas (Map maxConcurrency)')
+    parser.add_argument('--calls', type=int, default=6, help='Converse calls per worker')
+    parser.add_argument('--quota-rpm', type=float, default=10, help='requests per minute Bedrock accepts')
+    parser.add_argument('--quota-tpm', type=float, default=200000, help='tokens per minute Bedrock accepts')
+    parser.add_argument('--budget-rpm', type=float, default=30,
+                        help='limiter request budget; above the quota to exercise AIMD')
+    parser.add_argument('--budget-tpm', type=float, default=400000, help='limiter token budget')
+    parser.add_argument('--prompt-chars', type=int, default=40000)
+    parser.add_argument('--max-tokens', type=int, default=4096)
+    parser.add_argument('--latency', type=float, default=8.0, help='simulated seconds per call')
+    parser.add_argument('--speed', type=float, default=60.0, help='simulated seconds per wall second')
+    parser.add_argument('--modes', default='none,limiter', help='comma-separated, from none, limiter')
+    parser.add_argument('--seed', type=int, default=0)
+    return parser.parse_args()
+
+
+class SimulatedClock:
+    def __init__(self, speed):
+        self.speed = speed
+        self.start = time.time()
+
+    def now(self):
+        return (time.time() - self.start) * self.speed
+
+    def sleep(self, seconds):
+        time.sleep(max(seconds, 0) / self.speed)
+
+
+class QuotaStub:
+    """Converse API that throttles beyond a sliding one-minute request and token quota."""
+
+    def __init__(self, clock, rpm, tpm, latency, seed):
+        self.clock = clock
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = latency
+        self.random = Random(seed)
+        self.recent = []  # (time, tokens) of accepted calls
+        self.throttles = 0
+        self._lock = threading.Lock()
+
+    def converse(self, **request):
+        text = request['messages'][0]['content'][0]['text']
+        tokens = len(text) // 4 + request['inferenceConfig']['maxTokens']
+        with self._lock:
+            now = self.clock.now()
+            self.recent = [(at, used) for at, used in self.recent if at > now - 60]
+            if len(self.recent) + 1 > self.rpm or sum(used for _, used in self.recent) + tokens > self.tpm:
+                self.throttles += 1
+                raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'Too many requests'}},
+                                  'Converse')
+            self.recent.append((now, tokens))
+            latency = self.latency * self.random.uniform(0.7, 1.3)
+        self.clock.sleep(latency)
+        output = request['inferenceConfig']['maxTokens'] // 4
+        return {
+            'output': {'message': {'content': [{'text': 'ok'}]}},
+            'usage': {'inputTokens': len(text) // 4, 'outputTokens': output},
+        }
+
+
+def direct_call(stub, clock, request, retries=6):
+    """What a Lambda does without the limiter: boto3-style exponential backoff only."""
+    for attempt in range(retries + 1):
+        try:
+            return stub.converse(**request)
+        except ClientError:
+            if attempt == retries:
+                raise
+            clock.sleep(min(2 ** attempt, 30))
+
+
+def run(mode, args):
+    clock = SimulatedClock(args.speed)
+    stub = QuotaStub(clock, args.quota_rpm, args.quota_tpm, args.latency, args.seed)
+    limiter = RateLimiter(
+        LocalBucketStore(),
+        limits={MODEL: {'requestsPerMinute': args.budget_rpm, 'tokensPerMinute': args.budget_tpm}},
+        max_wait=600, clock=clock.now, sleep=clock.sleep,
+    )
+    client = RateLimitedClient(stub, limiter)
+    request = {
+        'modelId': MODEL,
+        'messages': [{'role': 'user', 'content': [{'text': 'x' * args.prompt_chars}]}],
+        'inferenceConfig': {'maxTokens': args.max_tokens},
+    }
+
+    def worker(_):
+        done = 0
+        for _ in range(args.calls):
+            try:
+                if mode == 'limiter':
+                    client.converse(**request)
+                else:
+                    direct_call(stub, clock, request)
+                done += 1
+            except ClientError:
+                pass
+        return done
+
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        completed = sum(executor.map(worker, range(args.workers)))
+    minutes = clock.now() / 60
+    state, _ = limiter.store.read(MODEL)
+    return {
+        'mode': mode,
+        'completed': completed,
+        'failed': args.workers * args.calls - completed,
+        'throttled': stub.throttles,
+        'minutes': minutes,
+        'perMinute': completed / minutes if minutes else 0.0,
+        'share': min(1.0, state.factor) if state else 1.0,
+    }
+
+
+def main():
+    args = parse_args()
+    print(f"{'mode':<8} {'completed':>9} {'failed':>6} {'throttled':>9} {'minutes':>8} {'calls/min':>9} {'share':>6}")
+    for mode in args.modes.split(','):
+        row = run(mode, args)
+        print(f"{row['mode']:<8} {row['completed']:>9} {row['failed']:>6} {row['throttled']:>9} "
+              f"{row['minutes']:>8.1f} {row['perMinute']:>9.1f} {row['share']:>6.2f}")
+
+
+if __name__ == '__main__':
+    main()
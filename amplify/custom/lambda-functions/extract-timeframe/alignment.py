@@ -0,0 +1,386 @@
+import difflib
+import logging
+import math
+import time
+from collections import Counter, defaultdict
+
+from joint_alignment import best_disjoint
+from local_alignment import find_best_span, span_candidates
+from parallel_alignment import score_starts
+
+try:
+    import numpy as np
+except ImportError:  # numpy is only needed for the vectorized scorer
+    np = None
+
+logger = logging.getLogger()
+
+NGRAM_SIZE = 3
+
+# Windows always rescored exactly by the vectorized scorer
+VECTORIZED_TOP_K = 32
+
+# Alternative placements kept per segment for joint alignment
+CANDIDATES_PER_SEGMENT = 5
+# Alternatives scoring more than this below a segment's best window are not collected
+CANDIDATE_RATIO_MARGIN = 0.05
+
+# Cascade stages of `scoring_stages`, weakest first; None means no stage finished
+STAGES = (None, 'exact', 'anchored', 'full')
+
+# Windows scored between two deadline checks
+DEADLINE_CHECK_WINDOWS = 512
+
+
+class TranscriptIndex:
+    """Inverted index over the pronunciation words of a `Transcript`.
+
+    Tokens are lowercased and whitespace-split exactly like the original
+    scan split a joined window, so a window is simply a slice of `tokens`.
+    """
+
+    def __init__(self, transcript):
+        self.item_count = len(transcript)
+        self.tokens = []
+        self.token_items = []
+        self.offsets = [0] * (self.item_count + 1)
+
+        folded = [content.lower().split() for content in transcript.vocab]
+        previous = 0
+        for token_id, item in zip(transcript.pronunciation_ids, transcript.pronunciation_items):
+            words = folded[token_id]
+            for i in range(previous, item + 1):
+                self.offsets[i] = len(self.tokens)
+            self.tokens.extend(words)
+            self.token_items.extend([item] * len(words))
+            previous = item + 1
+        for i in range(previous, self.item_count + 1):
+            self.offsets[i] = len(self.tokens)
+
+        self._arrays = None
+        # Optional `parallel_alignment.WorkerPool` used by `score_windows`
+        self.pool = None
+        self.ngram_size = NGRAM_SIZE
+        self.unigrams = defaultdict(list)
+        self.ngrams = defaultdict(list)
+        for k, token in enumerate(self.tokens):
+            self.unigrams[token].append(k)
+        for k in range(len(self.tokens) - NGRAM_SIZE + 1):
+            self.ngrams[tuple(self.tokens[k:k + NGRAM_SIZE])].append(k)
+
+    def arrays(self):
+        """(word ids, token ids, item offsets) as NumPy arrays for the vectorized scorer."""
+        if self._arrays is None:
+            word_ids = {token: token_id for token_id, token in enumerate(self.unigrams)}
+            token_ids = np.fromiter((word_ids[t] for t in self.tokens), dtype=np.int32, count=len(self.tokens))
+            self._arrays = word_ids, token_ids, np.asarray(self.offsets, dtype=np.int64)
+        return self._arrays
+
+    def window_end(self, start, window_size):
+        return min(start + window_size, self.item_count)
+
+    def window_tokens(self, start, window_size):
+        return self.tokens[self.offsets[start]:self.offsets[self.window_end(start, window_size)]]
+
+    def window_starts(self, first_token, last_token, window_size):
+        """Item positions whose window contains tokens first_token..last_token."""
+        lo = max(0, self.token_items[last_token] - window_size + 1)
+        return range(lo, self.token_items[first_token] + 1)
+
+
+def min_matches_for_ratio(segment_length, ratio):
+    """Smallest matched-word count M for which 2M / (n + M) can reach `ratio`.
+
+    A window holds at least M words, so SequenceMatcher.ratio() <= 2M / (n + M).
+    """
+    return max(1, math.ceil(ratio * segment_length / (2 - ratio) - 1e-9))
+
+
+class Deadline:
+    """Time budget shared by the segments aligned in one invocation.
+
+    `at` is a `time.monotonic()` value (None for no limit). Each cascade
+    records the last stage it completed in `stages`.
+    """
+
+    def __init__(self, at=None):
+        self.at = at
+        self.stages = []
+
+    @classmethod
+    def from_context(cls, context, margin_ms):
+        """Deadline `margin_ms` before the Lambda invocation times out."""
+        if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+            return cls()
+        remaining_ms = context.get_remaining_time_in_millis() - margin_ms
+        return cls(time.monotonic() + max(remaining_ms, 0) / 1000)
+
+    def expired(self):
+        return self.at is not None and time.monotonic() >= self.at
+
+    def quality(self, stages=None):
+        """The weakest of `stages` (all recorded stages by default)."""
+        stages = self.stages if stages is None else stages
+        return min(stages, key=STAGES.index, default=STAGES[-1])
+
+
+def exact_match_tokens(index, segment_words):
+    """Token positions where `segment_words` occurs verbatim."""
+    n = len(segment_words)
+    if n == 0:
+        return []
+    if n >= NGRAM_SIZE:
+        postings = index.ngrams.get(tuple(segment_words[:NGRAM_SIZE]), ())
+    else:
+        postings = index.unigrams.get(segment_words[0], ())
+    return [pos for pos in postings if index.tokens[pos:pos + n] == segment_words]
+
+
+def scoring_stages(index, segment_words, window_size, threshold, scores, min_start=0, limit=1,
+                   margin=0, deadline=None):
+    """Score the windows starting at or after `min_start` that can reach `threshold`.
+
+    A cascade filling the {start: ratio} map `scores` and yielding the name of
+    each stage once it is complete:
+
+    - 'exact': windows holding the segment verbatim;
+    - 'anchored': windows sharing a trigram with the segment;
+    - 'full': the remaining windows, narrowed with a prefix filter on the
+      rarest segment words to those that could still tie or beat both the
+      weakest of the best `limit` disjoint windows so far and the best ratio
+      less `margin`. `limit=1` keeps only windows that can tie the best.
+
+    Once `deadline` expires the cascade stops after the 'exact' stage, or
+    without yielding the unfinished stage; the windows it did score stay in
+    `scores`.
+    """
+    matcher = difflib.SequenceMatcher(None)
+    matcher.set_seq1(segment_words)
+
+    def score(starts, check_deadline=True):
+        pending = sorted(j for j in set(starts).difference(scores) if j >= min_start)
+        check_deadline = check_deadline and deadline is not None
+        step = DEADLINE_CHECK_WINDOWS if check_deadline else max(len(pending), 1)
+        for k in range(0, len(pending), step):
+            if check_deadline and deadline.expired():
+                return False
+            chunk = pending[k:k + step]
+            if index.pool is not None:
+                scores.update(index.pool.score(segment_words, window_size, chunk, matcher))
+            else:
+                scores.update(score_starts(index, segment_words, window_size, chunk, matcher))
+        return True
+
+    exact = []
+    for pos in exact_match_tokens(index, segment_words):
+        exact.extend(index.window_starts(pos, pos + len(segment_words) - 1, window_size))
+    # Verbatim matches are few and cheap, so they are scored even past the deadline
+    score(exact, check_deadline=False)
+    yield 'exact'
+
+    anchors = []
+    for k in range(len(segment_words) - NGRAM_SIZE + 1):
+        for pos in index.ngrams.get(tuple(segment_words[k:k + NGRAM_SIZE]), ()):
+            anchors.extend(index.window_starts(pos, pos + NGRAM_SIZE - 1, window_size))
+    if not score(anchors):
+        return
+    yield 'anchored'
+
+    best = best_disjoint([(ratio, j, index.window_end(j, window_size)) for j, ratio in scores.items()],
+                         threshold, limit)
+    floor = max(best[-1][0] if len(best) == limit else 0, best[0][0] - margin if best else 0)
+    need = min_matches_for_ratio(len(segment_words), max(threshold, floor))
+
+    # Any window reaching `need` matches must contain a word outside the most
+    # frequent segment words whose combined multiplicity stays below `need`.
+    counts = Counter(w for w in segment_words if w in index.unigrams)
+    if sum(counts.values()) >= need:
+        common_budget = 0
+        rare_words = []
+        for word in sorted(counts, key=lambda w: (-len(index.unigrams[w]), w)):
+            if common_budget + counts[word] < need:
+                common_budget += counts[word]
+            else:
+                rare_words.append(word)
+
+        candidates = []
+        for word in rare_words:
+            for pos in index.unigrams[word]:
+                candidates.extend(index.window_starts(pos, pos, window_size))
+        if not score(candidates):
+            return
+    yield 'full'
+
+
+def score_windows(index, segment_words, window_size, threshold, min_start=0, limit=1, margin=0, deadline=None):
+    """Run the `scoring_stages` cascade as far as `deadline` allows.
+
+    Returns {start: ratio}; once every stage ran this covers each window that
+    can reach `threshold` and be among the best `limit` disjoint windows
+    within `margin` of the best. The last completed stage is recorded on
+    `deadline`.
+    """
+    scores = {}
+    stage = None
+    for stage in scoring_stages(index, segment_words, window_size, threshold, scores, min_start, limit, margin,
+                                deadline):
+        pass
+    if deadline is not None:
+        deadline.stages.append(stage)
+        if stage != 'full':
+            logger.warning(f"Alignment deadline reached, keeping the best window after stage {stage}")
+    return scores
+
+
+def find_best_window(index, segment_words, window_size, threshold, deadline=None):
+    """Return (ratio, start, end, window_words) of the best matching item window.
+
+    `end` is exclusive, so the window covers items start..end-1.
+
+    Gives the same window as scoring every start position in order (highest
+    ratio, earliest start on ties) whenever that ratio reaches `threshold`.
+    With a `deadline` the best window scored before it expired is returned.
+    """
+    if index.item_count == 0 or window_size <= 0:
+        return 0, 0, 0, []
+
+    scores = score_windows(index, segment_words, window_size, threshold, deadline=deadline)
+    if not scores:
+        return 0, 0, 0, []
+
+    best_start = min(scores, key=lambda j: (-scores[j], j))
+    return scores[best_start], best_start, index.window_end(best_start, window_size), index.window_tokens(best_start, window_size)
+
+
+def window_candidates(index, segment_words, window_size, threshold, min_start=0, limit=CANDIDATES_PER_SEGMENT,
+                      deadline=None):
+    """Up to `limit` non-overlapping windows above `threshold`, best first.
+
+    Only windows within CANDIDATE_RATIO_MARGIN of the best are kept, so the
+    scan can skip windows that could not make the cut. Returns a list of
+    (ratio, start, end) with `end` exclusive.
+    """
+    if index.item_count == 0 or window_size <= 0:
+        return []
+
+    scores = score_windows(index, segment_words, window_size, threshold, min_start, limit, CANDIDATE_RATIO_MARGIN,
+                           deadline)
+    return best_disjoint([(ratio, j, index.window_end(j, window_size)) for j, ratio in scores.items()],
+                         threshold, limit)
+
+
+def window_bounds(index, segment_words, window_size):
+    """Upper bound of every window's ratio from its bag-of-words overlap with the segment."""
+    word_ids, token_ids, offsets = index.arrays()
+    starts = np.arange(index.item_count)
+    lo = offsets[starts]
+    hi = offsets[np.minimum(starts + window_size, index.item_count)]
+
+    overlap = np.zeros(index.item_count, dtype=np.int64)
+    for word, count in Counter(segment_words).items():
+        word_id = word_ids.get(word)
+        if word_id is None:
+            continue
+        cumulative = np.concatenate(([0], np.cumsum(token_ids == word_id)))
+        overlap += np.minimum(cumulative[hi] - cumulative[lo], count)
+
+    return 2 * overlap / (len(segment_words) + (hi - lo))
+
+
+def find_best_window_vectorized(index, segment_words, window_size, threshold, deadline=None, top_k=VECTORIZED_TOP_K):
+    """Same contract as `find_best_window`, scored with NumPy; `deadline` is not enforced.
+
+    Bag-of-words overlap bounds SequenceMatcher's matched words, so
+    2 * overlap / (n + len(window)) bounds each window's ratio. The bounds of
+    all windows come from per-word cumulative counts; windows are then rescored
+    exactly in decreasing bound order, the top `top_k` always and the rest
+    only while their bound can still tie or beat the best ratio found.
+    """
+    if index.item_count == 0 or window_size <= 0:
+        return 0, 0, 0, []
+
+    bounds = window_bounds(index, segment_words, window_size)
+    # Stable sort keeps earlier windows first among equal bounds
+    order = np.argsort(-bounds, kind='stable')
+
+    matcher = difflib.SequenceMatcher(None)
+    matcher.set_seq1(segment_words)
+    best_ratio, best_start = 0, 0
+    for rank, j in enumerate(order.tolist()):
+        if rank >= top_k and bounds[j] < max(best_ratio, threshold):
+            break
+        matcher.set_seq2(index.window_tokens(j, window_size))
+        ratio = matcher.ratio()
+        if ratio > best_ratio or (ratio == best_ratio and j < best_start):
+            best_ratio, best_start = ratio, j
+
+    return best_ratio, best_start, index.window_end(best_start, window_size), index.window_tokens(best_start, window_size)
+
+
+def window_candidates_vectorized(index, segment_words, window_size, threshold, min_start=0,
+                                 limit=CANDIDATES_PER_SEGMENT, deadline=None):
+    """Same contract as `window_candidates`, scored with NumPy; `deadline` is not enforced.
+
+    Windows are rescored exactly in decreasing bound order while their bound
+    is above `threshold` and could still displace the weakest of the
+    `limit` candidates chosen so far.
+    """
+    if index.item_count == 0 or window_size <= 0:
+        return []
+
+    bounds = window_bounds(index, segment_words, window_size)
+    order = np.argsort(-bounds, kind='stable')
+
+    matcher = difflib.SequenceMatcher(None)
+    matcher.set_seq1(segment_words)
+    scored = []
+    chosen = []
+    floor = threshold
+    for j in order.tolist():
+        if bounds[j] <= floor:
+            break
+        if j < min_start:
+            continue
+        matcher.set_seq2(index.window_tokens(j, window_size))
+        ratio = matcher.ratio()
+        scored.append((ratio, j, index.window_end(j, window_size)))
+        if ratio > floor:
+            chosen = best_disjoint(scored, threshold, limit)
+            floor = chosen[-1][0] if len(chosen) == limit else threshold
+    return chosen
+
+
+SCORERS = {
+    'index': find_best_window,
+    'vectorized': find_best_window_vectorized,
+    'local': find_best_span,
+}
+
+# Candidate generators for joint alignment, one per scorer
+CANDIDATE_SCORERS = {
+    'index': window_candidates,
+    'vectorized': window_candidates_vectorized,
+    'local': span_candidates,
+}
+
+
+def get_scorer(name):
+    """Look up a window scorer by name, falling back to the index scorer."""
+    if name == 'vectorized' and np is None:
+        logger.warning("The vectorized scorer needs numpy, using the index scorer instead")
+        return find_best_window
+    if name not in SCORERS:
+        logger.warning(f"Unknown window scorer {name!r}, using the index scorer instead")
+        return find_best_window
+    return SCORERS[name]
+
+
+def get_candidate_scorer(name):
+    """Candidate generator of the scorer `name` for joint alignment, with the fallbacks of `get_scorer`."""
+    if name == 'vectorized' and np is None:
+        logger.warning("The vectorized scorer needs numpy, using the index scorer instead")
+        return window_candidates
+    if name not in CANDIDATE_SCORERS:
+        logger.warning(f"Unknown window scorer {name!r}, using the index scorer instead")
+        return window_candidates
+    return CANDIDATE_SCORERS[name]
@@ -0,0 +1,100 @@
+"""Per-segment alignment results kept between extract-timeframe runs.
+
+`videos/{uuid}/Alignment.json` maps a hash of each normalized `[...]` segment
+(plus the alignment settings it was scored with) to its result, and is only
+valid for the transcript artifact ETag it records. Re-aligning an edited
+highlight then only scores the segments whose text changed. Writes are
+conditional on the object's S3 ETag, so overlapping runs merge their
+entries instead of dropping each other's.
+"""
+import hashlib
+import json
+import logging
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+CACHE_VERSION = 2
+
+
+def cache_key(uuid):
+    return f'videos/{uuid}/Alignment.json'
+
+
+def segment_key(segment_words, *settings):
+    """Hash of the normalized segment text and the settings that shape its result."""
+    payload = json.dumps([' '.join(segment_words), *settings], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class AlignmentCache:
+    def __init__(self, etag, entries=None, object_etag=None):
+        self.etag = etag
+        self.entries = entries or {}
+        # S3 ETag of the Alignment.json read, the condition of the next write
+        self.object_etag = object_etag
+        self.added = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def load(cls, s3, bucket, uuid, etag):
+        """Read the cache of a video; entries of another transcript ETag are dropped."""
+        try:
+            response = s3.get_object(Bucket=bucket, Key=cache_key(uuid))
+            object_etag = response['ETag']
+            data = json.loads(response['Body'].read().decode('utf-8'))
+        except ClientError as e:
+            if e.response['Error']['Code'] not in ('NoSuchKey', '404'):
+                logger.warning(f"Could not read alignment cache for UUID {uuid}: {str(e)}")
+            return cls(etag)
+        except ValueError as e:
+            logger.warning(f"Discarding unreadable alignment cache for UUID {uuid}: {str(e)}")
+            return cls(etag, object_etag=object_etag)
+
+        if data.get('version') != CACHE_VERSION or data.get('etag') != etag:
+            logger.info(f"Alignment cache for UUID {uuid} is stale, starting a new one")
+            return cls(etag, object_etag=object_etag)
+        return cls(etag, data.get('segments'), object_etag)
+
+    def get(self, key):
+        """Cached result for `key`, or None on a miss."""
+        if key in self.entries:
+            self.hits += 1
+            return self.entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, key, value):
+        self.entries[key] = value
+        self.added[key] = value
+
+    def save(self, s3, bucket, uuid, attempts=4):
+        """Write the entries added by this run.
+
+        Runs of the same video may overlap, so the object is only replaced if
+        it is still the one loaded; otherwise it is read again and the new
+        entries are merged into it.
+        """
+        logger.info(f"Alignment cache for UUID {uuid}: {self.hits} hits, {self.misses} misses")
+        if not self.added:
+            return
+        for _ in range(attempts):
+            body = json.dumps({'version': CACHE_VERSION, 'etag': self.etag, 'segments': self.entries})
+            condition = {'IfMatch': self.object_etag} if self.object_etag else {'IfNoneMatch': '*'}
+            try:
+                response = s3.put_object(Bucket=bucket, Key=cache_key(uuid), Body=body.encode('utf-8'),
+                                         ContentType='application/json', **condition)
+            except ClientError as e:
+                if e.response['Error']['Code'] not in ('PreconditionFailed', 'ConditionalRequestConflict'):
+                    logger.warning(f"Could not write alignment cache for UUID {uuid}: {str(e)}")
+                    return
+                current = AlignmentCache.load(s3, bucket, uuid, self.etag)
+                self.entries = {**current.entries, **self.added}
+                self.object_etag = current.object_etag
+                continue
+            self.object_etag = response['ETag']
+            self.added = {}
+            return
+        logger.warning(f"Could not write alignment cache for UUID {uuid}: kept changing")
@@ -0,0 +1,62 @@
+def best_disjoint(candidates, threshold, limit):
+    """Up to `limit` non-overlapping (ratio, start, end) candidates above `threshold`, best first.
+
+    Ties go to the earlier start; `end` is exclusive.
+    """
+    chosen = []
+    for ratio, start, end in sorted(candidates, key=lambda c: (-c[0], c[1])):
+        if ratio <= threshold or len(chosen) == limit:
+            break
+        if all(end <= chosen_start or start >= chosen_end for _, chosen_start, chosen_end in chosen):
+            chosen.append((ratio, start, end))
+    return chosen
+
+
+def align_segments_in_order(segments_words, find_candidates):
+    """Place all `[...]` segments of a highlight in chronological order.
+
+    Each segment gets a few candidate windows, searched only after the
+    earliest candidate of the segment before it. A dynamic program then picks
+    one candidate per segment (or skips a segment that has none fitting) so
+    that each placement starts at or after the end of the one before,
+    preferring the most matched segments, then the highest total ratio.
+    Returns [(segment_index, ratio, start, end)] in segment order, `end`
+    exclusive.
+
+    `find_candidates(segment_words, min_start)` returns the candidates of one
+    segment as (ratio, start, end) tuples, best first.
+    """
+    candidates = []
+    min_start = 0
+    for words in segments_words:
+        found = [tuple(candidate) for candidate in find_candidates(words, min_start)]
+        candidates.append(found)
+        if found:
+            min_start = min(start for _, start, _ in found) + 1
+
+    # Each state is (matched, total_ratio, -start, segment, candidate, previous state)
+    states = []
+    for i, found in enumerate(candidates):
+        new_states = []
+        for c, (ratio, start, end) in enumerate(found):
+            best_previous = None
+            for state in states:
+                _, _, _, p_segment, p_candidate, _ = state
+                _, _, p_end = candidates[p_segment][p_candidate]
+                if p_end <= start and (best_previous is None or state[:3] > best_previous[:3]):
+                    best_previous = state
+            matched, total = (best_previous[0], best_previous[1]) if best_previous else (0, 0)
+            new_states.append((matched + 1, total + ratio, -start, i, c, best_previous))
+        states.extend(new_states)
+
+    if not states:
+        return []
+
+    state = max(states, key=lambda s: s[:3])
+    placements = []
+    while state:
+        _, _, _, i, c, state_previous = state
+        ratio, start, end = candidates[i][c]
+        placements.append((i, ratio, start, end))
+        state = state_previous
+    return placements[::-1]
@@ -1,9 +1,15 @@
 import boto3
+from boto3.dynamodb.conditions import Key
 import json
 import os
 import logging
 from datetime import datetime
-import difflib
+
+from alignment import CANDIDATES_PER_SEGMENT, Deadline, TranscriptIndex, get_candidate_scorer, get_scorer
+from alignment_cache import AlignmentCache, segment_key
+from joint_alignment import align_segments_in_order
+from parallel_alignment import WorkerPool
+from transcript_artifact import load_transcript, loaded_etag
 
 # Set up logging
 logger = logging.getLogger()
@@ -17,71 +23,79 @@ dynamodb = boto3.resource('dynamodb')
 BUCKET_NAME = os.environ["BUCKET_NAME"]
 HIGHLIGHT_TABLE_NAME = os.environ["HIGHLIGHT_TABLE_NAME"]
 
-import difflib
-
-def string_similarity(s1, s2):
-    # Keep spaces, only lowercase
-    s1 = s1.lower().strip()
-    s2 = s2.lower().strip()
-    
-    # Use more sophisticated tokenization
-    words1 = s1.split()
-    words2 = s2.split()
-    
-    # Use sequence matcher on words
-    matcher = difflib.SequenceMatcher(None, words1, words2)
-    return matcher.ratio()
-
-def extract_full_transcript(json_content):
-    return " ".join([item['alternatives'][0]['content'] for item in json_content['results']['items'] if item['type'] == 'pronunciation'])
-
-def extract_words_with_timestamp(json_content):
-    return json_content['results']['items']
-
-def find_timeframes_for_script(highlight_script, json_content):
-    logger.debug("Starting find_timeframes_for_script")
-    logger.debug(f"Input highlight script: {highlight_script}")
-    
-    words_with_timestamp = json_content['results']['items']
-    logger.debug(f"Total words in transcript: {len(words_with_timestamp)}")
-    
-    segments = [seg.strip() for seg in highlight_script.split("[...]") if seg.strip()]
-    logger.debug(f"Split segments: {segments}")
-    logger.debug(f"Number of segments: {len(segments)}")
-    
-    timeframes = []
+# Minimum SequenceMatcher ratio for a segment to be accepted
+MATCH_THRESHOLD = 0.70
+
+# Window scorer: 'index' (n-gram anchored), 'vectorized' (NumPy, needs numpy)
+# or 'local' (variable-length banded local alignment)
+ALIGNMENT_SCORER = os.environ.get("ALIGNMENT_SCORER", "index")
+
+# Segment placement: 'joint' (in chronological order) or 'independent'. All three
+# scorers support both; only 'index' stops at the alignment deadline
+ALIGNMENT_ORDER = os.environ.get("ALIGNMENT_ORDER", "joint")
+
+# Window scoring processes: 0 follows the vCPUs of the Lambda memory size, 1 scores in this process
+ALIGNMENT_WORKERS = int(os.environ.get("ALIGNMENT_WORKERS", "0"))
+
+# Time kept for writing results when alignment has to stop before the Lambda timeout
+ALIGNMENT_DEADLINE_MARGIN_MS = int(os.environ.get("ALIGNMENT_DEADLINE_MARGIN_MS", "30000"))
+
+class IndexLoader:
+    """Builds the TranscriptIndex, and its alignment workers, on first use only."""
+
+    def __init__(self, transcript):
+        self.transcript = transcript
+        self.index = None
+
+    def __call__(self):
+        if self.index is None:
+            self.index = TranscriptIndex(self.transcript)
+            if ALIGNMENT_WORKERS != 1:
+                self.index.pool = WorkerPool(self.index, ALIGNMENT_WORKERS)
+        return self.index
+
+    def close(self):
+        if self.index is not None and self.index.pool is not None:
+            self.index.pool.close()
+
+def cached(alignment_cache, key, compute, deadline=None):
+    """Look `key` up in the alignment cache; results cut short by the deadline are not stored."""
+    if alignment_cache is None:
+        return compute()
+    value = alignment_cache.get(key)
+    if value is None:
+        first_stage = len(deadline.stages) if deadline else 0
+        value = compute()
+        if deadline is None or deadline.quality(deadline.stages[first_stage:]) == 'full':
+            alignment_cache.put(key, value)
+    return value
+
+def match_segments_independently(transcript, get_index, segments, alignment_cache=None, deadline=None):
+    """Match each segment against the whole transcript on its own.
+
+    Returns [(segment_index, ratio, start, end)] for segments above the threshold.
+    """
+    find_best_window = get_scorer(ALIGNMENT_SCORER)
+    item_count = len(transcript)
+    matches = []
 
     for i, segment in enumerate(segments):
         logger.debug(f"\nProcessing segment {i+1}/{len(segments)}: {segment}")
         cleaned_segment = segment.lower()
-        best_match_ratio = 0
-        best_match_start = 0
-        best_match_end = 0
-        best_matching_window = ""
+        segment_words = cleaned_segment.strip().split()
 
         # Calculate window size and convert to integer
         base_window_size = len(cleaned_segment.split())
-        window_size = min(int(base_window_size * 1.1), len(words_with_timestamp))
+        window_size = min(int(base_window_size * 1.1), item_count)
         logger.debug(f"Base window size: {base_window_size}, Adjusted window size: {window_size}")
 
-        for j in range(len(words_with_timestamp)):
-            # Ensure we don't exceed array bounds
-            current_window_size = min(window_size, len(words_with_timestamp) - j)
-            
-            window = ' '.join(item['alternatives'][0]['content'] 
-                            for item in words_with_timestamp[j:j+current_window_size] 
-                            if item['type'] == 'pronunciation')
-            
-            match_ratio = string_similarity(cleaned_segment, window)
-            
-            if match_ratio > best_match_ratio:
-                best_match_ratio = match_ratio
-                best_match_start = j
-                best_match_end = j + current_window_size
-                best_matching_window = window
-                logger.debug(f"New best match found at position {j}:")
-                logger.debug(f"Window: {window}")
-                logger.debug(f"Match ratio: {match_ratio}")
+        def score_segment():
+            ratio, start, end, _ = find_best_window(get_index(), segment_words, window_size, MATCH_THRESHOLD, deadline)
+            return [ratio, start, end]
+
+        key = segment_key(segment_words, 'independent', ALIGNMENT_SCORER, MATCH_THRESHOLD, window_size)
+        best_match_ratio, best_match_start, best_match_end = cached(alignment_cache, key, score_segment, deadline)
+        best_matching_window = ' '.join(transcript.content(k) for k in range(best_match_start, best_match_end)).lower()
 
         logger.debug(f"\nFinal best match for segment {i+1}:")
         logger.debug(f"Original segment: {cleaned_segment}")
@@ -89,37 +103,91 @@ def find_timeframes_for_script(highlight_script, json_content):
         logger.debug(f"Best match ratio: {best_match_ratio}")
         logger.debug(f"Best match indices: {best_match_start} to {best_match_end}")
 
-        if best_match_ratio > 0.70:
-            start_index = best_match_start
-            end_index = best_match_end - 1 
-
-            # Debug original indices
-            logger.debug(f"Initial indices - start: {start_index}, end: {end_index}")
-
-            while start_index < end_index and words_with_timestamp[start_index]['type'] != 'pronunciation':
-                start_index += 1
-                logger.debug(f"Adjusted start index to: {start_index}")
-            
-            while end_index > start_index and words_with_timestamp[end_index]['type'] != 'pronunciation':
-                end_index -= 1
-                logger.debug(f"Adjusted end index to: {end_index}")
-            
-            start_time = float(words_with_timestamp[start_index]['start_time'])
-            end_time = float(words_with_timestamp[end_index]['end_time'])
-            
-            timeframes.append((start_time, end_time, i))
-            
-            logger.debug(f"Final timeframe for segment {i+1}:")
-            logger.debug(f"Start time: {start_time}")
-            logger.debug(f"End time: {end_time}")
-            logger.debug(f"Start word: {words_with_timestamp[start_index]['alternatives'][0]['content']}")
-            logger.debug(f"End word: {words_with_timestamp[end_index]['alternatives'][0]['content']}")
+        if best_match_ratio > MATCH_THRESHOLD:
+            matches.append((i, best_match_ratio, best_match_start, best_match_end))
         else:
             logger.warning(f"No good match found for segment {i+1}")
             logger.warning(f"Segment text: {cleaned_segment}")
             logger.warning(f"Best match ratio found: {best_match_ratio}")
             logger.warning(f"Best matching window: {best_matching_window}")
 
+    return matches
+
+def find_timeframes_for_script(highlight_script, transcript, get_index=None, alignment_cache=None, deadline=None):
+    logger.debug("Starting find_timeframes_for_script")
+    logger.debug(f"Input highlight script: {highlight_script}")
+    
+    item_count = len(transcript)
+    logger.debug(f"Total words in transcript: {item_count}")
+
+    if get_index is None:
+        get_index = IndexLoader(transcript)
+        try:
+            return find_timeframes_for_script(highlight_script, transcript, get_index, alignment_cache, deadline)
+        finally:
+            get_index.close()
+    
+    segments = [seg.strip() for seg in highlight_script.split("[...]") if seg.strip()]
+    logger.debug(f"Split segments: {segments}")
+    logger.debug(f"Number of segments: {len(segments)}")
+
+    if ALIGNMENT_ORDER == 'joint':
+        candidate_scorer = get_candidate_scorer(ALIGNMENT_SCORER)
+
+        def find_candidates(segment_words, min_start):
+            window_size = min(int(len(segment_words) * 1.1), item_count)
+
+            def search(first_start):
+                return candidate_scorer(get_index(), segment_words, window_size, MATCH_THRESHOLD, first_start,
+                                        limit=CANDIDATES_PER_SEGMENT, deadline=deadline)
+
+            # Cached without `min_start`, which moves with the previous segment's candidates,
+            # so editing one segment does not invalidate the ones after it
+            key = segment_key(segment_words, 'joint', ALIGNMENT_SCORER, MATCH_THRESHOLD, window_size)
+            found = cached(alignment_cache, key, lambda: search(0), deadline)
+            later = [candidate for candidate in found if candidate[1] >= min_start]
+            if found and not later:
+                # Every candidate lies before the previous segment: search after it instead
+                later = search(min_start)
+            return later
+
+        matches = align_segments_in_order([segment.lower().split() for segment in segments], find_candidates)
+        matched_segments = {i for i, _, _, _ in matches}
+        for i, segment in enumerate(segments):
+            if i not in matched_segments:
+                logger.warning(f"No good match found for segment {i+1}")
+                logger.warning(f"Segment text: {segment.lower()}")
+    else:
+        matches = match_segments_independently(transcript, get_index, segments, alignment_cache, deadline)
+    
+    timeframes = []
+
+    for i, best_match_ratio, best_match_start, best_match_end in matches:
+        start_index = best_match_start
+        end_index = best_match_end - 1 
+
+        # Debug original indices
+        logger.debug(f"Initial indices for segment {i+1} - start: {start_index}, end: {end_index}, ratio: {best_match_ratio}")
+
+        while start_index < end_index and not transcript.is_pronunciation(start_index):
+            start_index += 1
+            logger.debug(f"Adjusted start index to: {start_index}")
+        
+        while end_index > start_index and not transcript.is_pronunciation(end_index):
+            end_index -= 1
+            logger.debug(f"Adjusted end index to: {end_index}")
+        
+        start_time = transcript.start_times[start_index]
+        end_time = transcript.end_times[end_index]
+        
+        timeframes.append((start_time, end_time, i))
+        
+        logger.debug(f"Final timeframe for segment {i+1}:")
+        logger.debug(f"Start time: {start_time}")
+        logger.debug(f"End time: {end_time}")
+        logger.debug(f"Start word: {transcript.content(start_index)}")
+        logger.debug(f"End word: {transcript.content(end_index)}")
+
     logger.debug("\nAll timeframes before sorting:")
     logger.debug(timeframes)
 
@@ -154,14 +222,9 @@ def find_timeframes_for_script(highlight_script, json_content):
 
     return final_timeframes
 
-def preprocess_text(text):
-    return ' '.join(text.lower().split())
-
 def extract_scripts_with_timestamps(uuid):
     try:
-        json_object = s3.get_object(Bucket=BUCKET_NAME, Key=f'videos/{uuid}/Transcript.json')
-        json_content = json.load(json_object['Body'])
-        return json_content
+        return load_transcript(s3, BUCKET_NAME, uuid)
     except KeyError as e:
         logger.error(f"Unexpected JSON structure in transcript for UUID {uuid}: {str(e)}")
         raise
@@ -182,6 +245,113 @@ def preprocess_highlight_script(highlight_script):
     chunks = [chunk.strip() for chunk in highlight_script.split("[...]") if chunk.strip()]
     return " [...] ".join(chunks)
 
+def align_highlight(uuid, index, item, transcript, get_index=None, alignment_cache=None, deadline=None):
+    """Align one Highlight item and return the result consumed by HighlightExtractMap.
+
+    `quality` names the weakest alignment stage reached before the deadline:
+    'full' unless the cascade had to stop early.
+    """
+    deadline = deadline or Deadline()
+    raw_file_path = f's3://{BUCKET_NAME}/videos/{uuid}/RAW.mp4'
+    output_destination = f's3://{BUCKET_NAME}/videos/{uuid}/FHD/{index}-FHD'
+
+    highlight_script = preprocess_highlight_script(item.get("Text", ""))
+    logger.debug(f"Preprocessed highlight script: {highlight_script}")
+
+    first_stage = len(deadline.stages)
+    timeframes = find_timeframes_for_script(highlight_script, transcript, get_index, alignment_cache, deadline)
+    quality = deadline.quality(deadline.stages[first_stage:]) or 'none'
+    logger.info(f"Found {len(timeframes)} timeframes for UUID: {uuid}, Index: {index}, Quality: {quality}")
+    
+    if not timeframes:
+        logger.warning(f"No timeframes found for UUID: {uuid}, Index: {index}")
+        return {
+            'statusCode': 400,
+            'body': 'Error on extracting timeframe',
+            'success': 'false',
+            'index': index,
+            'duration': 0,
+            'timeframes': [],
+            'raw_file_path': raw_file_path,
+            'output_destination': output_destination, 
+            'uuid': uuid,
+            'quality': quality
+        }
+    
+    total_duration = int((sum(end - start for start, end in timeframes)))
+    
+    formatted_timeframes = [
+        {
+            "StartTimecode": convert_seconds_to_timecode(start),
+            "EndTimecode": convert_seconds_to_timecode(end)
+        }
+        for start, end in timeframes
+    ]
+
+    logger.info(f"Formatted timeframes for UUID: {uuid}, Index: {index}: {formatted_timeframes}, Duration: {total_duration}")
+
+    return {
+        'statusCode': 200,
+        'body': 'Extracted Timeline',
+        'success': 'true',
+        'index': index,
+        'duration': total_duration,
+        'uuid': uuid,
+        'timeframes': formatted_timeframes,
+        'output_destination': output_destination,
+        'raw_file_path': raw_file_path,
+        'quality': quality
+    }
+
+def error_result(uuid, index, error):
+    return {
+        'statusCode': 500,
+        'body': f'Error processing request: {str(error)}',
+        'success': 'false',
+        'index': index,
+        'uuid': uuid,
+        'duration': 0,
+        'timeframes': [],
+        'output_destination': f's3://{BUCKET_NAME}/videos/{uuid}/FHD/{index}-FHD',
+        'raw_file_path': f's3://{BUCKET_NAME}/videos/{uuid}/RAW.mp4'
+    }
+
+def get_highlight_items(shorts_table, uuid, indexes=None):
+    """Fetch the Highlight items of a video, either all of them or only `indexes`."""
+    if indexes is None:
+        items = []
+        query = {'KeyConditionExpression': Key('VideoName').eq(uuid)}
+        while True:
+            response = shorts_table.query(**query)
+            items.extend(response['Items'])
+            if 'LastEvaluatedKey' not in response:
+                break
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    else:
+        items = []
+        keys = [{'VideoName': uuid, 'Index': index} for index in indexes]
+        for chunk_start in range(0, len(keys), 100):
+            request = {HIGHLIGHT_TABLE_NAME: {'Keys': keys[chunk_start:chunk_start + 100]}}
+            while request:
+                response = dynamodb.batch_get_item(RequestItems=request)
+                items.extend(response['Responses'].get(HIGHLIGHT_TABLE_NAME, []))
+                request = response.get('UnprocessedKeys')
+
+    return {item['Index']: item for item in items}
+
+def save_timeframes(shorts_table, uuid, index, result):
+    """Store the alignment of one highlight, leaving the rest of its item (title, edits from the UI) alone."""
+    shorts_table.update_item(
+        Key={'VideoName': uuid, 'Index': index},
+        UpdateExpression='SET #dur = :durVal, #tf = :tfVal, #q = :qVal',
+        ExpressionAttributeNames={'#dur': 'duration', '#tf': 'timeframes', '#q': 'quality'},
+        ExpressionAttributeValues={
+            ':durVal': result['duration'],
+            ':tfVal': str(result['timeframes']),
+            ':qVal': result['quality']
+        }
+    )
+
 def lambda_handler(event, context):
     try:
         uuid = event['uuid']
@@ -191,81 +361,85 @@ def lambda_handler(event, context):
 
         shorts_table = dynamodb.Table(HIGHLIGHT_TABLE_NAME)
 
-        raw_file_path = f's3://{BUCKET_NAME}/videos/{uuid}/RAW.mp4'
-        output_destination = f's3://{BUCKET_NAME}/videos/{uuid}/FHD/{index}-FHD'
-
         response = shorts_table.get_item(Key={'VideoName': uuid, 'Index': index})
         item = response.get('Item')
         if not item:
             logger.error(f"Item not found in DynamoDB for UUID: {uuid}, Index: {index}")
             raise ValueError("Item not found in DynamoDB")
 
-        highlight_script = preprocess_highlight_script(item.get("Text", ""))
-        logger.debug(f"Preprocessed highlight script: {highlight_script}")
-
-        json_content = extract_scripts_with_timestamps(uuid)
+        transcript = extract_scripts_with_timestamps(uuid)
         logger.debug(f"Extracted transcript content for UUID: {uuid}")
 
-        timeframes = find_timeframes_for_script(highlight_script, json_content)
-        logger.info(f"Found {len(timeframes)} timeframes for UUID: {uuid}, Index: {index}")
-        
-        if not timeframes:
-            logger.warning(f"No timeframes found for UUID: {uuid}, Index: {index}")
-            return {
-                'statusCode': 400,
-                'body': 'Error on extracting timeframe',
-                'success': 'false',
-                'index': index,
-                'duration': 0,
-                'timeframes': [],
-                'raw_file_path': raw_file_path,
-                'output_destination': output_destination, 
-                'uuid': uuid
-            }
-        
-        total_duration = int((sum(end - start for start, end in timeframes)))
-        
-        formatted_timeframes = [
-            {
-                "StartTimecode": convert_seconds_to_timecode(start),
-                "EndTimecode": convert_seconds_to_timecode(end)
-            }
-            for start, end in timeframes
-        ]
-
-        logger.info(f"Formatted timeframes for UUID: {uuid}, Index: {index}: {formatted_timeframes}, Duration: {total_duration}")
-
-        shorts_table.update_item(
-            Key={'VideoName': uuid, 'Index': index},
-            UpdateExpression='SET #dur = :durVal, #tf = :tfVal',
-            ExpressionAttributeNames={'#dur': 'duration', '#tf': 'timeframes'},
-            ExpressionAttributeValues={':durVal': total_duration, ':tfVal': str(formatted_timeframes)}
-        )
+        deadline = Deadline.from_context(context, ALIGNMENT_DEADLINE_MARGIN_MS)
+        alignment_cache = AlignmentCache.load(s3, BUCKET_NAME, uuid, loaded_etag(uuid))
+        result = align_highlight(uuid, index, item, transcript, alignment_cache=alignment_cache, deadline=deadline)
+        alignment_cache.save(s3, BUCKET_NAME, uuid)
+        if result['statusCode'] != 200:
+            return result
+
+        save_timeframes(shorts_table, uuid, index, result)
 
         logger.info(f"Successfully processed request for UUID: {uuid}, Index: {index}")
 
-        return {
-            'statusCode': 200,
-            'body': 'Extracted Timeline',
-            'success': 'true',
-            'index': index,
-            'duration': total_duration,
-            'uuid': uuid,
-            'timeframes': formatted_timeframes,
-            'output_destination': output_destination,
-            'raw_file_path': raw_file_path
-        }
+        return result
 
     except Exception as e:
         logger.error(f"An error occurred for UUID: {uuid if 'uuid' in locals() else 'unknown'}, Index: {index if 'index' in locals() else 'unknown'}: {str(e)}", exc_info=True)
-        return {
-            'statusCode': 500,
-            'body': f'Error processing request: {str(e)}',
-            'success': 'false',
-            'index': index if 'index' in locals() else 'unknown',
-            'uuid': uuid if 'uuid' in locals() else 'unknown',
-            'duration': 0,
-            'timeframes': [],
-            'output_destination': output_destination,
-            'raw_file_path': raw_file_path
-        }
\ No newline at end of file
+        return error_result(uuid if 'uuid' in locals() else 'unknown', index if 'index' in locals() else 'unknown', e)
+
+def batch_lambda_handler(event, context):
+    """Align several highlights of one video with a single transcript load.
+
+    Takes `uuid` and optionally `indexes` (all highlights of the video when
+    omitted) and returns the per-index results of `lambda_handler` in `results`.
+    """
+    uuid = event['uuid']
+    indexes = event.get('indexes')
+    if indexes is not None:
+        indexes = [str(index) for index in indexes]
+
+    logger.info(f"Processing batch request for UUID: {uuid}, Indexes: {indexes if indexes is not None else 'all'}")
+
+    shorts_table = dynamodb.Table(HIGHLIGHT_TABLE_NAME)
+    items = get_highlight_items(shorts_table, uuid, indexes)
+    if indexes is None:
+        indexes = sorted(items, key=int)
+
+    transcript = extract_scripts_with_timestamps(uuid)
+    deadline = Deadline.from_context(context, ALIGNMENT_DEADLINE_MARGIN_MS)
+    get_index = IndexLoader(transcript)
+    alignment_cache = AlignmentCache.load(s3, BUCKET_NAME, uuid, loaded_etag(uuid))
+
+    results = []
+    updated = []
+    try:
+        for index in indexes:
+            try:
+                item = items.get(index)
+                if not item:
+                    logger.error(f"Item not found in DynamoDB for UUID: {uuid}, Index: {index}")
+                    raise ValueError("Item not found in DynamoDB")
+
+                result = align_highlight(uuid, index, item, transcript, get_index, alignment_cache, deadline)
+                if result['statusCode'] == 200:
+                    updated.append((index, result))
+            except Exception as e:
+                logger.error(f"An error occurred for UUID: {uuid}, Index: {index}: {str(e)}", exc_info=True)
+                result = error_result(uuid, index, e)
+            results.append(result)
+    finally:
+        get_index.close()
+
+    alignment_cache.save(s3, BUCKET_NAME, uuid)
+
+    # Per-attribute updates, so edits the UI made to these items meanwhile are kept
+    for index, result in updated:
+        save_timeframes(shorts_table, uuid, index, result)
+
+    logger.info(f"Successfully processed {len(updated)}/{len(indexes)} highlights for UUID: {uuid}")
+
+    return {
+        'statusCode': 200,
+        'uuid': uuid,
+        'results': results
+    }
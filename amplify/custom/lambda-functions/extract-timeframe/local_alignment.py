@@ -0,0 +1,157 @@
+import difflib
+from collections import Counter
+
+from joint_alignment import best_disjoint
+
+# Smith-Waterman scores for word-level alignment
+MATCH_SCORE = 2
+MISMATCH_SCORE = -1
+GAP_SCORE = -1
+
+# Half-width of the diagonal band, as a share of the segment length
+BAND_RATIO = 0.25
+MIN_BAND = 8
+
+# Candidate regions aligned per segment, in decreasing anchor votes
+MAX_REGIONS = 64
+
+
+def banded_local_alignment(segment_words, tokens, diagonal, band, score_to_beat=0):
+    """Best local alignment of `segment_words` inside a diagonal band of `tokens`.
+
+    Cell (i, j) pairs segment word i with token j and is only computed when
+    j - i lies within `band` of `diagonal`. Rows are abandoned as soon as no
+    alignment can score above `score_to_beat`. Returns (score, first_token,
+    last_token), or None when nothing beats `score_to_beat`.
+    """
+    n = len(segment_words)
+    width = 2 * band + 1
+    token_count = len(tokens)
+    previous = [0] * (width + 1)
+    previous_start = [0] * (width + 1)
+    best = None
+
+    for i in range(n):
+        word = segment_words[i]
+        current = [0] * (width + 1)
+        current_start = [0] * (width + 1)
+        first_column = i + diagonal - band
+        row_best = 0
+
+        for k in range(width):
+            j = first_column + k
+            if j < 0 or j >= token_count:
+                continue
+
+            # Diagonal predecessor shares k; the cell above is k + 1 in the previous row
+            score = previous[k] + (MATCH_SCORE if tokens[j] == word else MISMATCH_SCORE)
+            start = previous_start[k] if previous[k] > 0 else j
+            if previous[k + 1] + GAP_SCORE > score:
+                score = previous[k + 1] + GAP_SCORE
+                start = previous_start[k + 1]
+            if k > 0 and current[k - 1] + GAP_SCORE > score:
+                score = current[k - 1] + GAP_SCORE
+                start = current_start[k - 1]
+            if score <= 0:
+                continue
+
+            current[k] = score
+            current_start[k] = start
+            row_best = max(row_best, score)
+            if score > score_to_beat:
+                score_to_beat = score
+                best = (score, start, j)
+
+        # Early abandon: every remaining word matching cannot lift any path above the best
+        if max(row_best, 0) + MATCH_SCORE * (n - i - 1) < score_to_beat:
+            break
+        previous, previous_start = current, current_start
+
+    return best
+
+
+def candidate_diagonals(index, segment_words, band):
+    """Diagonals (token position - segment position) voted for by shared n-grams."""
+    votes = Counter()
+    size = index.ngram_size
+    for p in range(len(segment_words) - size + 1):
+        for t in index.ngrams.get(tuple(segment_words[p:p + size]), ()):
+            votes[(t - p) // band] += 1
+
+    if not votes:
+        # Short or heavily paraphrased segments: fall back to the rarest single words
+        positions = {}
+        for p, word in enumerate(segment_words):
+            positions.setdefault(word, p)
+        for word in sorted(positions, key=lambda w: len(index.unigrams.get(w, ()))):
+            postings = index.unigrams.get(word, ())
+            for t in postings:
+                votes[(t - positions[word]) // band] += 1
+            if sum(votes.values()) >= MAX_REGIONS * 4:
+                break
+
+    buckets = sorted(votes, key=lambda b: (-votes[b], b))[:MAX_REGIONS]
+    return [bucket * band + band // 2 for bucket in buckets]
+
+
+def find_best_span(index, segment_words, window_size, threshold, deadline=None):
+    """Variable-length scorer for `get_scorer`: returns (ratio, start, end, words).
+
+    Runs a banded local alignment around each anchored region and reports the
+    best span's SequenceMatcher ratio, so it is judged against the same
+    threshold as the fixed-window scorers. `window_size` is unused and
+    `deadline` is not enforced.
+    """
+    if index.item_count == 0 or not segment_words or not index.tokens:
+        return 0, 0, 0, []
+
+    base_band = max(MIN_BAND, int(len(segment_words) * BAND_RATIO))
+    # Regions are bucketed by `base_band`, so widen the band to cover a whole bucket
+    band = base_band + base_band // 2
+
+    best = None
+    for diagonal in candidate_diagonals(index, segment_words, base_band):
+        found = banded_local_alignment(segment_words, index.tokens, diagonal, band,
+                                       best[0] if best else 0)
+        if found:
+            best = found
+
+    if best is None:
+        return 0, 0, 0, []
+
+    _, first_token, last_token = best
+    words = index.tokens[first_token:last_token + 1]
+    ratio = difflib.SequenceMatcher(None, segment_words, words).ratio()
+    start = index.token_items[first_token]
+    end = index.token_items[last_token] + 1
+    return ratio, start, end, words
+
+
+def span_candidates(index, segment_words, window_size, threshold, min_start=0, limit=5, deadline=None):
+    """Candidate generator for joint alignment: up to `limit` disjoint spans at or after `min_start`.
+
+    Every anchored region is aligned on its own (no pruning against the
+    best region), best first as (ratio, start, end) with `end` exclusive.
+    `window_size` is unused and `deadline` is not enforced.
+    """
+    if index.item_count == 0 or not segment_words or not index.tokens or min_start >= index.item_count:
+        return []
+
+    base_band = max(MIN_BAND, int(len(segment_words) * BAND_RATIO))
+    band = base_band + base_band // 2
+    first_token = index.offsets[min_start]
+    tokens = index.tokens[first_token:]
+
+    spans = []
+    for diagonal in candidate_diagonals(index, segment_words, base_band):
+        # Regions that end before `min_start` cannot hold a candidate
+        if diagonal + len(segment_words) + band < first_token:
+            continue
+        found = banded_local_alignment(segment_words, tokens, diagonal - first_token, band)
+        if not found:
+            continue
+        _, first, last = found
+        words = index.tokens[first_token + first:first_token + last + 1]
+        ratio = difflib.SequenceMatcher(None, segment_words, words).ratio()
+        spans.append((ratio, index.token_items[first_token + first], index.token_items[first_token + last] + 1))
+    return best_disjoint(spans, threshold, limit)
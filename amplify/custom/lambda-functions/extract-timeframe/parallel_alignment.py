@@ -0,0 +1,116 @@
+"""Multi-core window scoring for long transcripts.
+
+Lambda has no /dev/shm, so `multiprocessing.Pool` and its queues cannot be
+used; workers are plain forked `Process`es talking over `Pipe`s. They are
+forked after the `TranscriptIndex` is built and inherit it copy-on-write,
+so only segment words and start positions cross the pipes.
+"""
+import difflib
+import logging
+import multiprocessing
+import os
+
+logger = logging.getLogger()
+
+# Fewer windows than this are scored in the calling process
+PARALLEL_MIN_WINDOWS = 256
+
+# Lambda allocates CPU in proportion to memory, one full vCPU per 1769 MB;
+# os.cpu_count() reports 2 cores however little of them the function gets
+MB_PER_VCPU = 1769
+
+
+def available_cpus():
+    """Full vCPUs this function can use: from its Lambda memory size, else os.cpu_count()."""
+    count = os.cpu_count() or 1
+    memory = os.environ.get('AWS_LAMBDA_FUNCTION_MEMORY_SIZE')
+    if memory:
+        count = min(count, int(memory) // MB_PER_VCPU)
+    return max(count, 1)
+
+
+def score_starts(index, segment_words, window_size, starts, matcher=None):
+    """SequenceMatcher ratio of the window at each of `starts`: {start: ratio}."""
+    if matcher is None:
+        matcher = difflib.SequenceMatcher(None)
+        matcher.set_seq1(segment_words)
+    scores = {}
+    for j in starts:
+        matcher.set_seq2(index.window_tokens(j, window_size))
+        scores[j] = matcher.ratio()
+    return scores
+
+
+def _worker(conn, index):
+    while True:
+        task = conn.recv()
+        if task is None:
+            break
+        segment_words, window_size, starts = task
+        conn.send(score_starts(index, segment_words, window_size, starts))
+    conn.close()
+
+
+class WorkerPool:
+    """Scores window shards of one `TranscriptIndex` across forked processes.
+
+    With one worker (or when processes cannot be started) everything runs in
+    the calling process. Results do not depend on the worker count.
+    """
+
+    def __init__(self, index, workers=0):
+        self.index = index
+        self.connections = []
+        self.processes = []
+
+        count = workers or available_cpus()
+        if count < 2:
+            return
+        try:
+            context = multiprocessing.get_context('fork')
+            for _ in range(count):
+                parent_conn, child_conn = context.Pipe()
+                process = context.Process(target=_worker, args=(child_conn, index), daemon=True)
+                process.start()
+                child_conn.close()
+                self.connections.append(parent_conn)
+                self.processes.append(process)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not start alignment workers, scoring in one process: {str(e)}")
+            self.close()
+            return
+        logger.info(f"Started {count} alignment workers")
+
+    def score(self, segment_words, window_size, starts, matcher=None):
+        """Same result as `score_starts`, sharded over the workers when worthwhile."""
+        if not self.connections or len(starts) < PARALLEL_MIN_WINDOWS:
+            return score_starts(self.index, segment_words, window_size, starts, matcher)
+
+        # Contiguous shards keep neighbouring windows, and their shared tokens, on one worker
+        shard_size = -(-len(starts) // len(self.connections))
+        shards = [starts[k:k + shard_size] for k in range(0, len(starts), shard_size)]
+        try:
+            for conn, shard in zip(self.connections, shards):
+                conn.send((segment_words, window_size, shard))
+            scores = {}
+            for conn, _ in zip(self.connections, shards):
+                scores.update(conn.recv())
+            return scores
+        except (OSError, EOFError) as e:
+            logger.warning(f"Alignment worker failed, scoring in one process: {str(e)}")
+            self.close()
+            return score_starts(self.index, segment_words, window_size, starts, matcher)
+
+    def close(self):
+        for conn in self.connections:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=1)
+            if process.is_alive():
+                process.terminate()
+        self.connections = []
+        self.processes = []
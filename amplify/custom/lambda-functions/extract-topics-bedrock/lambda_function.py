@@ -3,21 +3,47 @@ import boto3
 import botocore
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bedrock_cache import BedrockCache
+from bedrock_hedging import HedgedClient
+from bedrock_limiter import RateLimitedClient, RateLimiter
+from bedrock_regions import BEDROCK_REGIONS, RegionPoolClient
+from transcript_artifact import load_transcript
+from transcript_windows import text_windows
 
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
-)
+# One client per region of BEDROCK_REGIONS; calls are spread over them (bedrock_regions)
+bedrock_regions = RegionPoolClient({
+    region: boto3.client(
+        service_name='bedrock-runtime',
+        region_name=region,
+        config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
+    )
+    for region in BEDROCK_REGIONS
+})
+# Calls wait for the model's shared request and token budget (bedrock_limiter) and
+# get a deadline, a hedged duplicate when slow and a circuit breaker (bedrock_hedging);
+# duplicates are charged to the same limiter
+limiter = RateLimiter.from_env(dynamodb)
+bedrock = RateLimitedClient(HedgedClient(bedrock_regions, limiter=limiter), limiter)
+
+# 'auto' splits scripts longer than CHUNK_CHARS into windows; 'single' and 'chunked' force one mode
+TOPICS_MODE = os.environ.get("TOPICS_MODE", "auto")
+CHUNK_CHARS = int(os.environ.get("TOPICS_CHUNK_CHARS", "150000"))
+CHUNK_OVERLAP_CHARS = int(os.environ.get("TOPICS_CHUNK_OVERLAP_CHARS", "8000"))
+# Windows sent to Bedrock at the same time in chunked mode
+CHUNK_CONCURRENCY = int(os.environ.get("TOPICS_CONCURRENCY", "4"))
+
+# Topics per process-topics request: 0 puts all topics in one request, 1 sends one request per topic
+SECTION_GROUP_SIZE = int(os.environ.get("SECTION_GROUP_SIZE", "0"))
 
 def lambda_handler(event, context):
     bucket_name = os.environ["BUCKET_NAME"]
     table_name = os.environ["HISTORY_TABLE_NAME"]
 
     uuid = event['uuid']
-    source_file_key = f"videos/{uuid}/Transcript.json"
 
     history = dynamodb.Table(table_name)
     video_history = history.get_item(Key={'id': uuid})
@@ -25,29 +51,114 @@ def lambda_handler(event, context):
     theme = video_history['Item'].get('theme', 'general')
     num_videos = video_history['Item'].get('numberOfVideos', 5)
     
-    response = s3.get_object(Bucket=bucket_name, Key=source_file_key)
-    transcript_json = json.load(response['Body'])
-    script = transcript_json['results']['transcripts'][0]['transcript']
+    transcript = load_transcript(s3, bucket_name, uuid)
+    script = transcript.text
 
-    topics = get_topics_from_transcript(script, modelID, theme, num_videos)
+    # `bypassCache` in the event forces fresh Bedrock responses
+    cache = BedrockCache.from_env(dynamodb, s3, bypass=event.get('bypassCache', False))
+    topics = get_topics_from_transcript(script, modelID, theme, num_videos, cache)
+    cache.log_metrics('extract-topics')
+    bedrock.log_metrics('extract-topics')
+    bedrock_regions.log_metrics('extract-topics')
 
     return {
         'statusCode': 200,
         'topics': topics,
+        'topicGroups': group_topics(topics, SECTION_GROUP_SIZE),
         'uuid': uuid,
         'modelID': modelID,
         'owner': video_history["Item"]["owner"],
-        'script': script
+        'script': script,
+        'bedrockCache': cache.stats()
     }
 
-def get_topics_from_transcript(script, modelID, theme='general', num_videos=5):
-    prompt = f"""
+def group_topics(topics, group_size):
+    """Topics as lists of {"index", "topic"} items for the ProcessTopicsMap, `group_size` per list."""
+    items = [{"index": index, "topic": topic} for index, topic in enumerate(topics)]
+    if group_size <= 0:
+        return [items] if items else []
+    return [items[first:first + group_size] for first in range(0, len(items), group_size)]
+
+def get_topics_from_transcript(script, modelID, theme='general', num_videos=5, cache=None):
+    """Extract topics in one call, or map-reduced over sentence windows for long scripts."""
+    try:
+        if TOPICS_MODE == 'chunked' or (TOPICS_MODE == 'auto' and len(script) > CHUNK_CHARS):
+            return get_topics_in_chunks(script, modelID, theme, num_videos, cache)
+
+        topics = invoke_topics(build_topics_prompt(script, theme, num_videos), modelID, theme, cache)
+        return topics["Topics"]
+
+    except Exception as e:
+        print(f"Error in get_topics_from_transcript: {str(e)}")
+        raise e
+
+def get_topics_in_chunks(script, modelID, theme, num_videos, cache=None):
+    """Collect scored candidate topics per window concurrently, then pick the final ones in one small call."""
+    windows = text_windows(script, CHUNK_CHARS, CHUNK_OVERLAP_CHARS)
+    print(f"Extracting topics from {len(windows)} windows")
+
+    def extract(part):
+        prompt = build_topics_prompt(windows[part], theme, num_videos, part=(part + 1, len(windows)))
+        return invoke_topics(prompt, modelID, theme, cache)["Topics"]
+
+    candidates = []
+    with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_CONCURRENCY, len(windows)))) as executor:
+        futures = {executor.submit(extract, part): part for part in range(len(windows))}
+        for future in as_completed(futures):
+            part = futures[future]
+            try:
+                for topic in future.result():
+                    if isinstance(topic, dict) and topic.get("topic"):
+                        candidates.append({"part": part + 1, "topic": topic["topic"], "score": topic.get("score", 0)})
+            except Exception as e:
+                print(f"Window {part + 1}/{len(windows)} failed: {str(e)}")
+
+    if not candidates:
+        raise Exception("No topics found in any transcript window")
+    candidates.sort(key=lambda c: c["part"])
+
+    try:
+        return invoke_topics(build_ranking_prompt(candidates, theme, num_videos), modelID, theme, cache)["Topics"]
+    except Exception as e:
+        print(f"Ranking call failed, merging topics locally: {str(e)}")
+        return merge_topics(candidates, num_videos)
+
+def merge_topics(candidates, num_videos):
+    """Best-scored distinct topics, back in the order of their windows."""
+    chosen = []
+    seen = set()
+    for candidate in sorted(candidates, key=lambda c: -float(c["score"] or 0)):
+        key = " ".join(candidate["topic"].lower().split())
+        if key not in seen:
+            seen.add(key)
+            chosen.append(candidate)
+        if len(chosen) == num_videos:
+            break
+    return [c["topic"] for c in sorted(chosen, key=lambda c: c["part"])]
+
+def build_topics_prompt(script, theme, num_videos, part=None):
+    """Topic extraction prompt; `part` is (index, count) of a window in chunked mode."""
+    if part:
+        index, count = part
+        scope = f"""This is part {index} of {count} of a longer transcript; other parts are handled separately.
+    Extract up to {num_videos} candidate topics from this part only and rate each one."""
+        topic_format = f"""{{"topic": "Topic1", "score": 1-10 rating of engagement and theme fit}},
+        ...
+        {{"topic": "Topic{num_videos}", "score": 1-10}}"""
+    else:
+        scope = f"Aim for exactly {num_videos} topics that best match the {theme} theme. If not enough content matches the theme, provide as many as possible."
+        topic_format = f""""Topic1",
+        "Topic2",
+        ...
+        "Topic{num_videos}","""
+
+    return f"""
     Below is a transcript of a video.
     <script> {script} </script>
 
     Extract distinct segments/topics that could work as standalone short-form content from the script, focusing on the theme: {theme}. Follow these guidelines:
 
-    1. Aim for exactly {num_videos} topics that best match the {theme} theme. If not enough content matches the theme, provide as many as possible.
+    1. {scope}
     2. Each topic should be:
     - Self-contained (can be understood without full context)
     - Engaging as a standalone clip
@@ -64,17 +175,42 @@ def get_topics_from_transcript(script, modelID, theme='general', num_videos=5):
     Present the extracted topics in this JSON format:
     <JSON>
     {{
+    "Topics": [
+        {topic_format}
+    ]
+    }}
+    </JSON>
+    Respond only with the JSON structure above, filled with the extracted topics.
+    """
+
+def build_ranking_prompt(candidates, theme, num_videos):
+    """Small final prompt choosing `num_videos` topics among the window candidates."""
+    listing = "\n".join(f"{c['part']}|{c['score']}|{c['topic']}" for c in candidates)
+    return f"""
+    Below are candidate short-form topics found in consecutive parts of one video transcript,
+    one per line as "part|score|topic". Neighbouring parts overlap, so the same topic may appear twice.
+    <candidates>
+    {listing}
+    </candidates>
+
+    Choose exactly {num_videos} distinct topics (or all distinct ones if there are fewer) that best match the theme: {theme}.
+    Prefer higher scores, drop duplicates, keep each chosen topic's wording and keep the chronological order of the parts.
+    If the theme is 'general', prefer diverse topics covering different aspects.
+
+    Present the chosen topics in this JSON format:
+    <JSON>
+    {{
     "Topics": [
         "Topic1",
-        "Topic2",
         ...
-        "Topic{num_videos}",
     ]
     }}
     </JSON>
-    Respond only with the JSON structure above, filled with the extracted topics.
+    Respond only with the JSON structure above.
     """
 
+def invoke_topics(prompt, modelID, theme, cache=None):
+    """Send a topics prompt, through `cache` when given, and return the JSON object of the response."""
     # 메시지 구조 설정
     messages = [
         {
@@ -93,25 +229,28 @@ def get_topics_from_transcript(script, modelID, theme='general', num_videos=5):
         "topP": 0.9
     }
 
-    try:
-        # Bedrock API 호출
-        response = bedrock.converse(
-            modelId=modelID,
-            messages=messages,
-            system=system_prompts,
-            inferenceConfig=inference_config
-        )
-
-        # 응답에서 텍스트 추출
-        rawTopics = response['output']['message']['content'][0]['text']
-
-        # JSON 부분만 추출
-        firstIndex = rawTopics.find('{')
-        endIndex = rawTopics.rfind('}')
-        
-        topics = json.loads(rawTopics[firstIndex:endIndex+1])
-        return topics["Topics"]
-    
-    except Exception as e:
-        print(f"Error in get_topics_from_transcript: {str(e)}")
-        raise e
+    request = {
+        "modelId": modelID,
+        "messages": messages,
+        "system": system_prompts,
+        "inferenceConfig": inference_config
+    }
+
+    # Bedrock API 호출
+    if cache is not None:
+        return cache.converse(bedrock, parse_topics, **request)
+    return parse_topics(bedrock.converse(**request))
+
+def parse_topics(response):
+    """Topics JSON of a Converse response; raises on an answer without a Topics list."""
+    # 응답에서 텍스트 추출
+    rawTopics = response['output']['message']['content'][0]['text']
+
+    # JSON 부분만 추출
+    firstIndex = rawTopics.find('{')
+    endIndex = rawTopics.rfind('}')
+
+    topics = json.loads(rawTopics[firstIndex:endIndex+1])
+    if not isinstance(topics.get("Topics"), list):
+        raise ValueError(f"No Topics list in model response: {rawTopics}")
+    return topics
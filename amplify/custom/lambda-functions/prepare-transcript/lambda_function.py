@@ -0,0 +1,26 @@
+import boto3
+import os
+import logging
+
+from transcript_artifact import publish_transcript
+
+# Set up logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+s3 = boto3.client('s3')
+
+def lambda_handler(event, context):
+    bucket_name = os.environ["BUCKET_NAME"]
+    uuid = event['uuid']
+
+    logger.info(f"Preparing transcript artifact for UUID: {uuid}")
+    etag, transcript = publish_transcript(s3, bucket_name, uuid)
+
+    return {
+        'statusCode': 200,
+        'uuid': uuid,
+        'etag': etag,
+        'items': len(transcript),
+        'cues': len(transcript.cue_texts)
+    }
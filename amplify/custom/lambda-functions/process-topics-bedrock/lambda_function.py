@@ -3,22 +3,56 @@ import json
 import boto3
 import botocore
 import os
-import time
 
+from bedrock_cache import BedrockCache
+from bedrock_hedging import HedgedClient
+from bedrock_limiter import RateLimitedClient, RateLimiter
+from bedrock_regions import BEDROCK_REGIONS, RegionPoolClient
+from prompt_cache import TokenUsage, prompt_content
+from transcript_retrieval import SentenceIndex
+
+s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
-bedrock = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
-)
+# One client per region of BEDROCK_REGIONS; calls are spread over them (bedrock_regions)
+bedrock_regions = RegionPoolClient({
+    region: boto3.client(
+        service_name='bedrock-runtime',
+        region_name=region,
+        config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
+    )
+    for region in BEDROCK_REGIONS
+})
+# Calls wait for the model's shared request and token budget (bedrock_limiter) and
+# get a deadline, a hedged duplicate when slow and a circuit breaker (bedrock_hedging);
+# duplicates are charged to the same limiter
+limiter = RateLimiter.from_env(dynamodb)
+bedrock = RateLimitedClient(HedgedClient(bedrock_regions, limiter=limiter), limiter)
+
+# Output token limit of a batched section-extraction call
+SECTION_BATCH_MAX_TOKENS = int(os.environ.get("SECTION_BATCH_MAX_TOKENS", "8192"))
+
+# 'bm25' sends only the transcript regions of a request's topics, 'off' always sends the full script.
+# A group and its per-topic retries share one excerpt, so they share the cached prompt prefix too;
+# 'off' only pays off with prompt caching when many small groups (SECTION_GROUP_SIZE) re-read
+# one full script
+RETRIEVAL_MODE = os.environ.get("RETRIEVAL_MODE", "bm25")
+# Scripts up to this length are always sent whole
+RETRIEVAL_MIN_SCRIPT_CHARS = int(os.environ.get("RETRIEVAL_MIN_SCRIPT_CHARS", "20000"))
+# Size of the retrieved region per topic, plus margin sentences on both sides
+RETRIEVAL_REGION_CHARS = int(os.environ.get("RETRIEVAL_REGION_CHARS", "12000"))
+RETRIEVAL_MARGIN_SENTENCES = int(os.environ.get("RETRIEVAL_MARGIN_SENTENCES", "5"))
+# Minimum share of a topic's BM25 score inside its region; below it the full script is sent
+RETRIEVAL_MIN_CONFIDENCE = float(os.environ.get("RETRIEVAL_MIN_CONFIDENCE", "0.3"))
+
+# Sentence indexes of the videos this container saw last: uuid -> (script length, index)
+_indexes = {}
+INDEX_ENTRIES = 4
 
 def lambda_handler(event, context):
-    topic = event['topic']
     topics = event['topics']
     uuid = event['uuid']
     modelID = event['modelID']
     owner = event['owner']
-    index = event['index']
     script = event['script']
 
     # Get video parameters from DynamoDB
@@ -27,19 +61,95 @@ def lambda_handler(event, context):
     theme = video_history['Item'].get('theme', 'general')
     video_length = video_history['Item'].get('videoLength', 60)
 
-    extracted_highlight = process_topic(topic, topics, script, uuid, modelID, owner, index, theme, video_length)
+    # `bypassCache` in the event forces fresh Bedrock responses
+    cache = BedrockCache.from_env(dynamodb, s3, bypass=event.get('bypassCache', False))
+    usage = TokenUsage()
+    # A `group` of {"index", "topic"} items is extracted in one call (see topicGroups of extract-topics)
+    if 'group' in event:
+        processed = process_topic_group(event['group'], topics, script, uuid, modelID, owner, theme, video_length, cache, usage)
+    else:
+        processed = [process_topic(event['topic'], topics, script, uuid, modelID, owner, event['index'], theme, video_length, cache, usage)]
+    cache.log_metrics('process-topics')
+    bedrock.log_metrics('process-topics')
+    bedrock_regions.log_metrics('process-topics')
+    usage.log_metrics('process-topics')
 
     return { 
         'statusCode': 200,
-        'processed_topic': extracted_highlight,
+        'processed_topic': processed[0] if len(processed) == 1 else None,
+        'processed_topics': processed,
         'body': json.dumps('Finished Highlight Extraction!')
     }
 
-def process_topic(topic, topics, script, uuid, modelID, owner, index, theme, video_length):
+def process_topic(topic, topics, script, uuid, modelID, owner, index, theme, video_length, cache=None, usage=None):
+    topic_text, excerpt = topic_script(script, uuid, [topic])
+    section_text = extract_and_process_section(topic, topics, topic_text, modelID, theme, video_length, cache, usage, excerpt)
+    return save_highlight(topic, section_text, uuid, owner, index, video_length)
+
+def process_topic_group(group, topics, script, uuid, modelID, owner, theme, video_length, cache=None, usage=None):
+    """Extract the sections of several topics in one request and save one Highlight item per topic."""
+    # The per-topic retries reuse the group's text, so their prompts share its cached prefix
+    group_text, excerpt = topic_script(script, uuid, [item['topic'] for item in group])
+    if len(group) == 1:
+        sections = {}
+    else:
+        sections = extract_sections(group, topics, group_text, modelID, theme, video_length, cache, usage, excerpt)
+
+    payloads = []
+    for item in group:
+        section_text = sections.get(int(item['index']))
+        if section_text is None:
+            # Missing from the batched answer: ask for this topic on its own
+            section_text = extract_and_process_section(item['topic'], topics, group_text, modelID, theme, video_length, cache, usage, excerpt)
+        payloads.append(save_highlight(item['topic'], section_text, uuid, owner, item['index'], video_length))
+    return payloads
+
+def sentence_index(uuid, script):
+    """BM25 index over the script sentences, built once per video and container."""
+    cached = _indexes.get(uuid)
+    if cached and cached[0] == len(script):
+        return cached[1]
+    index = SentenceIndex.from_text(script)
+    if len(_indexes) >= INDEX_ENTRIES:
+        _indexes.pop(next(iter(_indexes)))
+    _indexes[uuid] = (len(script), index)
+    return index
+
+def topic_script(script, uuid, topic_list):
+    """(text, excerpt): the script regions the topics come from, or the full script when unsure.
+
+    Regions of several topics are merged and joined by blank lines; `excerpt`
+    tells the prompt builders that the script is not complete.
+    """
+    if RETRIEVAL_MODE != 'bm25' or len(script) <= RETRIEVAL_MIN_SCRIPT_CHARS:
+        return script, False
+
+    index = sentence_index(uuid, script)
+    regions = []
+    for topic in topic_list:
+        region, confidence = index.best_region(topic, RETRIEVAL_REGION_CHARS, RETRIEVAL_MARGIN_SENTENCES)
+        print(f"Retrieved sentences {region} for topic '{topic}' with confidence {confidence:.2f}")
+        if region is None or confidence < RETRIEVAL_MIN_CONFIDENCE:
+            print(f"Low retrieval confidence for topic '{topic}', sending the full script")
+            return script, False
+        regions.append(region)
+
+    merged = []
+    for first, end in sorted(regions):
+        if merged and first <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((first, end))
+    text = "\n\n".join(index.text(first, end) for first, end in merged)
+
+    if len(text) >= len(script) * 0.8:
+        return script, False
+    print(f"Sending {len(text)} of {len(script)} script characters")
+    return text, True
+
+def save_highlight(topic, section_text, uuid, owner, index, video_length):
     shorts = dynamodb.Table(os.environ["HIGHLIGHT_TABLE_NAME"])
-    
-    section_text = extract_and_process_section(topic, topics, script, modelID, theme, video_length)
-    
+
     timestamp = datetime.datetime.now(datetime.UTC).isoformat()[:-6]+"Z"
     
     highlight = {
@@ -63,18 +173,31 @@ def process_topic(topic, topics, script, uuid, modelID, owner, index, theme, vid
     
     return payload
 
-def extract_and_process_section(topic, topics, script, modelID, theme, video_length):
-    # Calculate word count range based on video length (assuming ~2 words per second)
-    min_words = max(20, int(float(video_length) * 1.5))  # Minimum 20 words
-    max_words = int(float(video_length) * 2.5)  # Allow for natural speech variations
+def script_prefix(script, topics, theme, video_length, excerpt=False):
+    """Prompt prefix shared by the section requests of a group: script, topics, theme and duration.
 
-    prompt = f"""
+    The single-topic and batched prompts both start with it, so the per-topic
+    retries of a batched call read it from Bedrock's prompt cache; the
+    instructions and target topics come after it.
+    """
+    # Retrieved excerpts are marked so the model does not treat them as the whole video
+    script_note = " (only the parts relevant to the target topics, separated by blank lines)" if excerpt else ""
+    return f"""
 INPUT FORMAT:
-Original video script: <script> {script} </script>
+Original video script{script_note}: <script> {script} </script>
 Available topics: <agendas> {topics} </agendas>
-Target topic: <Topic> {topic} </Topic>
 Theme focus: <Theme> {theme} </Theme>
 Target duration: {video_length} seconds
+"""
+
+def extract_and_process_section(topic, topics, script, modelID, theme, video_length, cache=None, usage=None, excerpt=False):
+    # Calculate word count range based on video length (assuming ~2 words per second)
+    min_words = max(20, int(float(video_length) * 1.5))  # Minimum 20 words
+    max_words = int(float(video_length) * 2.5)  # Allow for natural speech variations
+
+    # The shared prefix is cached by Bedrock; instructions and the target topic follow it
+    prefix = script_prefix(script, topics, theme, video_length, excerpt)
+    suffix = f"""Target topic: given at the end in <Topic>
 
 TASK:
 Extract sentences from the script that best represent the target topic, suitable for a short-form video clip.
@@ -133,13 +256,15 @@ IMPORTANT:
 - Ensure selections can stand alone without context
 - Keep natural speech patterns intact
 - Prioritize content that aligns with the specified theme
+
+Target topic: <Topic> {topic} </Topic>
 """
 
     # 메시지 구조 설정
     messages = [
         {
             "role": "user",
-            "content": [{"text": prompt}]
+            "content": prompt_content(prefix, suffix, modelID)
         }
     ]
 
@@ -153,28 +278,175 @@ IMPORTANT:
         "topP": 0
     }
 
-    try:
-        response = bedrock.converse(
-            modelId=modelID,
-            messages=messages,
-            system=system_prompts,
-            inferenceConfig=inference_config
-        )
-
-        if modelID == "anthropic.claude-3-sonnet-20240229-v1:0":
-            time.sleep(60)
-        
-        response_text = response['output']['message']['content'][0]['text']
-        
-        print(response_text)
+    request = {
+        "modelId": modelID,
+        "messages": messages,
+        "system": system_prompts,
+        "inferenceConfig": inference_config
+    }
 
+    def parse(response_text):
         firstIndex = response_text.find('{')
         endIndex = response_text.rfind('}')
-        
+
         chunk = json.loads(response_text[firstIndex:endIndex+1])
-        
+        if not isinstance(chunk.get('text'), str):
+            raise ValueError("No section text in model response")
         return chunk['text']
+
+    try:
+        return converse_parsed(request, parse, cache, usage)
     
     except Exception as e:
         print(f"Error in extract_and_process_section: {str(e)}")
         return ""
+
+def extract_sections(group, topics, script, modelID, theme, video_length, cache=None, usage=None, excerpt=False):
+    """Sections of all topics in `group` from one request, as {topic index: text}.
+
+    Topics the response leaves out are missing from the result; on any error
+    the result is empty and callers fall back to one request per topic.
+    """
+    min_words = max(20, int(float(video_length) * 1.5))  # Minimum 20 words
+    max_words = int(float(video_length) * 2.5)  # Allow for natural speech variations
+    targets = "\n".join(f"{item['index']}: {item['topic']}" for item in group)
+
+    # Same cached prefix as extract_and_process_section; instructions and the target topics follow it
+    prefix = script_prefix(script, topics, theme, video_length, excerpt)
+    suffix = f"""Target topics: given at the end in <Topics>, one per line as "id: topic"
+
+TASK:
+For each target topic, extract sentences from the script that best represent it, suitable for a short-form video clip.
+Focus on content that aligns with the specified theme: {theme}
+
+CONSTRAINTS:
+1. Length: Select content that would take {video_length} seconds to speak (approximately {min_words}-{max_words} words) per topic
+2. Theme Alignment: Content should strongly relate to the {theme} theme when possible
+3. Relevance: Content must directly relate to its target topic
+4. Coherence: Selections must make sense as standalone clips
+5. Uniqueness: Selections for different topics should not overlap
+6. Authenticity: Preserve exact original text, including errors or informal language
+7. Language: Maintain the original language (English/Korean/Japanese/etc.)
+
+OUTPUT FORMAT:
+<thought>
+- Selection rationale and theme alignment per topic
+- Coherence verification
+- Overlap check between topics
+- Estimated speaking duration
+</thought>
+
+<JSON>
+{{
+"sections": [
+    {{
+    "id": target topic id,
+    "VideoTitle": "Clear, engaging title (max 8 words)",
+    "text": "Selected content with [...] indicating cuts"
+    }},
+    ...
+]
+}}
+</JSON>
+
+EXAMPLE:
+<script>
+The pyramids of Egypt are ancient monumental structures. Most were built during the Old and Middle Kingdom periods. The most famous Egyptian pyramids are those found at Giza, on the outskirts of Cairo. Several of the Giza pyramids are counted among the largest structures ever built. The Pyramid of Khufu is the largest Egyptian pyramid. It is the only one to remain largely intact. Egyptologists believe that the pyramids were built as tombs for the country's pharaohs and their consorts during the Old and Middle Kingdom periods.
+</script>
+<Topics>
+0: Egyptian Pyramids
+1: The Giza Pyramids
+</Topics>
+<Theme>historical</Theme>
+<JSON>
+{{
+"sections": [
+    {{
+    "id": 0,
+    "VideoTitle": "Why Egypt Built Its Pyramids",
+    "text": "The pyramids of Egypt are ancient monumental structures. Most were built during the Old and Middle Kingdom periods. [...] Egyptologists believe that the pyramids were built as tombs for the country's pharaohs and their consorts during the Old and Middle Kingdom periods."
+    }},
+    {{
+    "id": 1,
+    "VideoTitle": "Giza: The Largest Pyramids Ever Built",
+    "text": "The most famous Egyptian pyramids are those found at Giza, on the outskirts of Cairo. Several of the Giza pyramids are counted among the largest structures ever built. The Pyramid of Khufu is the largest Egyptian pyramid. It is the only one to remain largely intact."
+    }}
+]
+}}
+</JSON>
+
+IMPORTANT:
+- Return exactly one section for every target topic id
+- Always preserve exact wording for timestamp matching
+- Use [...] only between non-consecutive selections
+- Don't correct or modify original text
+- Ensure selections can stand alone without context
+- Prioritize content that aligns with the specified theme
+
+Target topics: <Topics>
+{targets}
+</Topics>
+"""
+
+    messages = [
+        {
+            "role": "user",
+            "content": prompt_content(prefix, suffix, modelID)
+        }
+    ]
+
+    system_prompts = [{"text": f"You are an AI assistant that extracts {theme}-focused sections from video transcripts."}]
+
+    inference_config = {
+        "temperature": 0,
+        "maxTokens": SECTION_BATCH_MAX_TOKENS,
+        "topP": 0
+    }
+
+    request = {
+        "modelId": modelID,
+        "messages": messages,
+        "system": system_prompts,
+        "inferenceConfig": inference_config
+    }
+
+    def parse(response_text):
+        # The <thought> part of a long answer may contain braces of its own
+        firstIndex = response_text.find('{', max(response_text.find('<JSON>'), 0))
+        endIndex = response_text.rfind('}')
+
+        result = json.loads(response_text[firstIndex:endIndex+1])
+        if not isinstance(result.get('sections'), list):
+            raise ValueError("No sections list in model response")
+        return result
+
+    try:
+        result = converse_parsed(request, parse, cache, usage)
+
+        wanted = {int(item['index']) for item in group}
+        sections = {}
+        for section in result['sections']:
+            if int(section['id']) in wanted and section.get('text'):
+                sections[int(section['id'])] = section['text']
+        print(f"Batched extraction returned {len(sections)} of {len(group)} sections")
+        return sections
+
+    except Exception as e:
+        print(f"Error in extract_sections: {str(e)}")
+        return {}
+
+def converse_parsed(request, parse, cache=None, usage=None):
+    """Send a Converse request, through `cache` when given, and return `parse` of the response text.
+
+    Only answers `parse` accepts are cached; it raises on the others.
+    """
+    def parse_response(response):
+        if usage is not None:
+            usage.add(response)
+        response_text = response['output']['message']['content'][0]['text']
+        print(response_text)
+        return parse(response_text)
+
+    if cache is not None:
+        return cache.converse(bedrock, parse_response, **request)
+    return parse_response(bedrock.converse(**request))
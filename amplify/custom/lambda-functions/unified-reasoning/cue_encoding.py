@@ -0,0 +1,132 @@
+"""Compact cue-ID encoding of the VTT transcript for the reasoning prompt.
+
+Each cue becomes one `id|time|text` line, and the model answers with cue-ID
+ranges instead of copying transcript text and float timestamps back. Text and
+timeframes of each highlight are rebuilt here from the same cues.
+"""
+
+
+def format_time(seconds):
+    """mm:ss, or h:mm:ss past the first hour."""
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{seconds:02d}"
+    return f"{minutes:02d}:{seconds:02d}"
+
+
+def cue_text(segment):
+    lines = segment['text']
+    # parse_vtt keeps the numeric identifier of the following cue as a last line
+    if len(lines) > 1 and lines[-1].isdigit():
+        lines = lines[:-1]
+    return " ".join(" ".join(lines).split())
+
+
+def format_cue_lines(vtt_segments):
+    """One `id|start time|text` line per cue, ids counting from 0."""
+    return [
+        f"{cue_id}|{format_time(segment['start'])}|{cue_text(segment)}"
+        for cue_id, segment in enumerate(vtt_segments)
+    ]
+
+
+def parse_cue_ranges(ranges, cue_count):
+    """Validated (first, last) cue-ID pairs in chronological order, overlaps merged."""
+    parsed = []
+    for cue_range in ranges:
+        if isinstance(cue_range, int):
+            cue_range = [cue_range, cue_range]
+        first, last = int(cue_range[0]), int(cue_range[-1])
+        if first > last:
+            first, last = last, first
+        first, last = max(first, 0), min(last, cue_count - 1)
+        if first <= last:
+            parsed.append((first, last))
+
+    merged = []
+    for first, last in sorted(parsed):
+        if merged and first <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], last))
+        else:
+            merged.append((first, last))
+    return merged
+
+
+def range_end(vtt_segments, last):
+    """End time of a range ending at cue `last`: the next cue's start, as the prompt states.
+
+    The listing only shows start times, so this is the end the model sizes
+    its ranges by; the final cue of the transcript ends at its own end time.
+    """
+    if last + 1 < len(vtt_segments):
+        return vtt_segments[last + 1]['start']
+    return vtt_segments[last]['end']
+
+
+def rebuild_highlight(highlight, vtt_segments):
+    """Turn a model highlight of cue ranges into the `title`/`text`/`timeframes` shape.
+
+    Returns None when none of its ranges points at a cue.
+    """
+    ranges = parse_cue_ranges(highlight.get('cues', []), len(vtt_segments))
+    if not ranges:
+        return None
+    texts = [
+        " ".join(cue_text(segment) for segment in vtt_segments[first:last + 1])
+        for first, last in ranges
+    ]
+    return {
+        'title': highlight.get('title', ''),
+        'text': " [...] ".join(texts),
+        'timeframes': [[vtt_segments[first]['start'], range_end(vtt_segments, last)] for first, last in ranges],
+        'cues': [list(cue_range) for cue_range in ranges],
+        'score': _score(highlight.get('score')),
+    }
+
+
+def _score(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def overlaps(highlight, other):
+    return any(
+        first <= other_last and other_first <= last
+        for first, last in highlight['cues']
+        for other_first, other_last in other['cues']
+    )
+
+
+def merge_candidates(candidates, num_videos):
+    """The `num_videos` best-scored candidates whose cue ranges do not overlap, in order.
+
+    Ties go to the earlier highlight, so duplicates found in two overlapping
+    windows collapse into one.
+    """
+    chosen = []
+    for candidate in sorted(candidates, key=lambda h: (-h['score'], h['cues'][0][0])):
+        if len(chosen) == num_videos:
+            break
+        if not any(overlaps(candidate, other) for other in chosen):
+            chosen.append(candidate)
+    return sorted(chosen, key=lambda h: h['cues'][0][0])
+
+
+def expand_regions(ranges, cue_count, margin):
+    """Cue ranges widened by `margin` cues on both sides and merged, in order."""
+    return parse_cue_ranges([[first - margin, last + margin] for first, last in ranges], cue_count)
+
+
+def excerpt_listing(cue_lines, regions):
+    """Cue lines of `regions` only; a `...` line marks each skipped stretch."""
+    parts = []
+    for first, last in regions:
+        if first > 0 and (not parts or parts[-1] != "..."):
+            parts.append("...")
+        parts.extend(cue_lines[first:last + 1])
+        if last < len(cue_lines) - 1:
+            parts.append("...")
+    return "\n".join(parts)
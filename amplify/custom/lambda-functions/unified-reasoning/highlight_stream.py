@@ -0,0 +1,85 @@
+"""Incremental parser for the `highlights` array of a streamed reasoning response.
+
+Text deltas are fed as they arrive; every highlight object is returned as
+soon as its closing brace is seen, without waiting for the rest of the
+response. Anything before the `"highlights": [` key (the <thought> section)
+is ignored.
+"""
+import json
+import re
+
+HIGHLIGHTS_ARRAY = re.compile(r'"highlights"\s*:\s*\[')
+
+
+class HighlightStreamParser:
+    def __init__(self):
+        self.buffer = ''
+        self.position = None  # scan position once inside the array
+        self.depth = 0
+        self.object_start = None
+        self.in_string = False
+        self.escaped = False
+        self.closed = False
+
+    def feed(self, text):
+        """Add a text delta and return the highlight dicts it completed."""
+        if self.closed:
+            return []
+        self.buffer += text
+
+        if self.position is None:
+            match = HIGHLIGHTS_ARRAY.search(self.buffer)
+            if match is None:
+                # Keep enough of the tail to match a key split across deltas
+                self.buffer = self.buffer[-64:]
+                return []
+            self.buffer = self.buffer[match.end():]
+            self.position = 0
+
+        highlights = []
+        buffer = self.buffer
+        index = self.position
+        while index < len(buffer):
+            char = buffer[index]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == '\\':
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in '{[':
+                if self.depth == 0 and char == '{':
+                    self.object_start = index
+                self.depth += 1
+            elif char in '}]':
+                if self.depth == 0:
+                    # End of the highlights array
+                    self.closed = True
+                    break
+                self.depth -= 1
+                if self.depth == 0 and char == '}':
+                    highlight = self._decode(buffer[self.object_start:index + 1])
+                    if highlight is not None:
+                        highlights.append(highlight)
+                    self.object_start = None
+            index += 1
+
+        # Drop text that no open object refers to any more
+        keep = self.object_start if self.object_start is not None else index
+        self.buffer = buffer[keep:]
+        self.position = index - keep
+        if self.object_start is not None:
+            self.object_start = 0
+        return highlights
+
+    @staticmethod
+    def _decode(text):
+        try:
+            highlight = json.loads(text)
+        except json.JSONDecodeError:
+            print(f"Skipping unparsable streamed highlight: {text}")
+            return None
+        return highlight if isinstance(highlight, dict) else None
@@ -2,18 +2,92 @@ import json
 import boto3
 import botocore
 import os
+import time
 import datetime
 from decimal import Decimal
 from datetime import datetime
 
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from bedrock_cache import BedrockCache, request_key
+from bedrock_hedging import HedgedClient
+from bedrock_limiter import RateLimitedClient, RateLimiter
+from bedrock_regions import BEDROCK_REGIONS, RegionPoolClient
+from cue_encoding import (excerpt_listing, expand_regions, format_cue_lines, merge_candidates,
+                          parse_cue_ranges, rebuild_highlight)
+from highlight_stream import HighlightStreamParser
+from model_adapters import ModelRouter, ThinkingBudget, estimate_tokens, get_adapter
+from transcript_artifact import load_transcript
+from transcript_windows import window_ranges
+
 # Initialize AWS clients
 s3 = boto3.client('s3')
 dynamodb = boto3.resource('dynamodb')
-bedrock_runtime = boto3.client(
-    service_name='bedrock-runtime',
-    region_name='us-west-2',
-    config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
+events = boto3.client('events')
+# One client per region of BEDROCK_REGIONS; calls are spread over them (bedrock_regions)
+bedrock_regions = RegionPoolClient({
+    region: boto3.client(
+        service_name='bedrock-runtime',
+        region_name=region,
+        config=botocore.config.Config(connect_timeout=1000, read_timeout=1000)
+    )
+    for region in BEDROCK_REGIONS
+})
+# Calls wait for the model's shared request and token budget (bedrock_limiter) and
+# get a deadline, a hedged duplicate when slow and a circuit breaker (bedrock_hedging);
+# duplicates are charged to the same limiter
+limiter = RateLimiter.from_env(dynamodb)
+bedrock_runtime = RateLimitedClient(HedgedClient(bedrock_regions, limiter=limiter), limiter)
+
+# 'auto' splits transcripts whose cue listing exceeds CHUNK_CHARS into windows;
+# 'single' and 'chunked' force one mode
+REASONING_MODE = os.environ.get("REASONING_MODE", "auto")
+CHUNK_CHARS = int(os.environ.get("REASONING_CHUNK_CHARS", "150000"))
+CHUNK_OVERLAP_CHARS = int(os.environ.get("REASONING_CHUNK_OVERLAP_CHARS", "8000"))
+# Windows sent to Bedrock at the same time in chunked mode
+CHUNK_CONCURRENCY = int(os.environ.get("REASONING_CONCURRENCY", "4"))
+
+# Stream single-call responses and save each highlight as soon as it is complete
+REASONING_STREAM = os.environ.get("REASONING_STREAM", "true").lower() == "true"
+
+# Stage the UI shows while highlights are being found (see UnifiedReasoningStateMachine)
+REASONING_STAGE = 1
+
+# Opt-in: 'auto' drops thinking for short transcripts and may move a prompt to a faster
+# adequate model of REASONING_MODELS; 'off' always runs the requested model with full thinking
+REASONING_ROUTING = os.environ.get("REASONING_ROUTING", "off")
+# Models besides the requested one that prompts may be routed to; none by default
+REASONING_MODELS = [
+    model_id.strip()
+    for model_id in os.environ.get("REASONING_MODELS", "").split(",")
+    if model_id.strip()
+]
+# Prompts of at least this many estimated tokens go to a model that reasons
+THINKING_MIN_TOKENS = int(os.environ.get("REASONING_THINKING_MIN_TOKENS", "12000"))
+# Thinking budget: base + per 1k prompt tokens + per minute of shorts requested, within bounds
+THINKING_BUDGET = ThinkingBudget(
+    base=int(os.environ.get("REASONING_THINKING_BASE", "2000")),
+    per_1k_tokens=float(os.environ.get("REASONING_THINKING_PER_1K_TOKENS", "600")),
+    per_short_minute=float(os.environ.get("REASONING_THINKING_PER_SHORT_MINUTE", "1000")),
+    minimum=int(os.environ.get("REASONING_THINKING_MIN_BUDGET", "4000")),
+    maximum=int(os.environ.get("REASONING_THINKING_MAX_BUDGET", "60000")),
 )
+# The requested model is kept while its estimate is within this factor of the fastest
+ROUTING_SLACK = float(os.environ.get("REASONING_ROUTING_SLACK", "1.5"))
+
+router = ModelRouter(REASONING_MODELS, THINKING_MIN_TOKENS, THINKING_BUDGET, ROUTING_SLACK)
+
+# Opt-in, as it changes which highlights are picked: 'auto' lets a cheap model pre-select
+# candidate regions of cue listings over CASCADE_MIN_CHARS (by default those that would
+# otherwise be map-reduced), so the reasoning model only reads those; 'on' always does
+REASONING_CASCADE = os.environ.get("REASONING_CASCADE", "off")
+CASCADE_MODEL = os.environ.get("REASONING_CASCADE_MODEL", "us.amazon.nova-lite-v1:0")
+CASCADE_MIN_CHARS = int(os.environ.get("REASONING_CASCADE_MIN_CHARS", "150000"))
+# Candidates asked for per requested highlight (at least 10), and context cues kept around each
+CASCADE_OVERSAMPLE = int(os.environ.get("REASONING_CASCADE_OVERSAMPLE", "3"))
+CASCADE_MARGIN_CUES = int(os.environ.get("REASONING_CASCADE_MARGIN_CUES", "10"))
+# Above this share of the transcript the candidate regions save too little; the full listing is sent
+CASCADE_MAX_SHARE = float(os.environ.get("REASONING_CASCADE_MAX_SHARE", "0.6"))
 
 def lambda_handler(event, context):
     bucket_name = os.environ["BUCKET_NAME"]
@@ -21,7 +95,6 @@ def lambda_handler(event, context):
     highlight_table_name = os.environ["HIGHLIGHT_TABLE_NAME"]
 
     uuid = event['uuid']
-    source_file_key = f"videos/{uuid}/Transcript.vtt"  # Try English VTT first
 
     history = dynamodb.Table(history_table_name)
     video_history = history.get_item(Key={'id': uuid})
@@ -31,88 +104,328 @@ def lambda_handler(event, context):
     num_videos = int(video_history['Item'].get('numberOfVideos', 5))
     video_length = video_history['Item'].get('videoLength', 60)
     
-    # Try to get VTT file (first try English, then Korean)
-    response = s3.get_object(Bucket=bucket_name, Key=source_file_key)
-
-    vtt_content = response['Body'].read().decode('utf-8')
-    script, vtt_segments = parse_vtt(vtt_content)
-
-    # Unified reasoning 수행
-    highlights = unified_reasoning(script, modelID, vtt_segments, theme, num_videos, video_length)
+    # Preprocessed transcript with the Transcript.vtt cues
+    transcript = load_transcript(s3, bucket_name, uuid, with_cues=True)
+    script = transcript.text
+    vtt_segments = transcript.segments()
 
     # 하이라이트 저장
     results = []
     timestamp = datetime.now().isoformat()[:-6]+"Z"
     shorts = dynamodb.Table(highlight_table_name)
 
-    for idx, highlight in enumerate(highlights):
-        # Calculate duration and format timeframes
-        total_duration = Decimal(str(sum(end - start for start, end in highlight['timeframes'])))
-        formatted_timeframes = [
-            {
-                "StartTimecode": convert_seconds_to_timecode(start),
-                "EndTimecode": convert_seconds_to_timecode(end)
-            }
-            for start, end in highlight['timeframes']
-        ]
+    def save_highlight(highlight):
+        idx = len(results)
+        results.append(put_highlight(shorts, uuid, idx, highlight, owner, theme, timestamp))
+        publish_highlight(uuid, idx, highlight['title'])
 
-        # Save highlight
-        highlight_item = {
-            "Text": highlight['text'],
-            "Question": highlight['title'],
-            "Index": str(idx),
-            "VideoName": uuid,
-            "createdAt": timestamp,
-            "updatedAt": timestamp,
-            "owner": owner,
-            "duration": total_duration,
-            "timeframes": str(formatted_timeframes),
-            "theme": theme
-        }
-        shorts.put_item(Item=highlight_item)
+    # `bypassCache` in the event forces fresh Bedrock responses
+    cache = BedrockCache.from_env(dynamodb, s3, bypass=event.get('bypassCache', False))
 
-        results.append({
-            'index': str(idx),
-            'title': highlight['title'],
-            'duration': total_duration,
-            'timeframes': formatted_timeframes
-        })
+    # Unified reasoning 수행
+    unified_reasoning(script, modelID, vtt_segments, theme, num_videos, video_length,
+                      on_highlight=save_highlight, cache=cache)
+    cache.log_metrics('unified-reasoning')
+    bedrock_runtime.log_metrics('unified-reasoning')
+    bedrock_regions.log_metrics('unified-reasoning')
 
     return {
         'statusCode': 200,
         'body': results
     }
 
-def unified_reasoning(script, modelID, vtt_segments, theme, num_videos, video_length):
-    # Create a mapping of text to timestamps
-    text_to_segments = {}
-    for segment in vtt_segments:
-        text = " ".join(segment['text'])
-        if text:
-            text_to_segments[text] = (segment['start'], segment['end'])
+def put_highlight(shorts, uuid, idx, highlight, owner, theme, timestamp):
+    """Write one highlight to the Highlight table and return its state machine entry."""
+    # Calculate duration and format timeframes
+    total_duration = Decimal(str(sum(end - start for start, end in highlight['timeframes'])))
+    formatted_timeframes = [
+        {
+            "StartTimecode": convert_seconds_to_timecode(start),
+            "EndTimecode": convert_seconds_to_timecode(end)
+        }
+        for start, end in highlight['timeframes']
+    ]
+
+    # Save highlight
+    highlight_item = {
+        "Text": highlight['text'],
+        "Question": highlight['title'],
+        "Index": str(idx),
+        "VideoName": uuid,
+        "createdAt": timestamp,
+        "updatedAt": timestamp,
+        "owner": owner,
+        "duration": total_duration,
+        "timeframes": str(formatted_timeframes),
+        "theme": theme
+    }
+    shorts.put_item(Item=highlight_item)
+
+    return {
+        'index': str(idx),
+        'title': highlight['title'],
+        'duration': total_duration,
+        'timeframes': formatted_timeframes
+    }
+
+def publish_highlight(uuid, idx, title):
+    """HighlightSaved event for a saved highlight; AppSync passes it on, so the UI lists it before reasoning ends."""
+    try:
+        events.put_events(Entries=[{
+            "Source": "custom.aws-shorts",
+            "DetailType": "HighlightSaved",
+            "Detail": json.dumps({
+                "videoId": uuid,
+                "stage": REASONING_STAGE,
+                "highlight": str(idx),
+                "title": title
+            })
+        }])
+    except Exception as e:
+        # The highlight is saved either way; the event only speeds up the UI
+        print(f"Failed to publish highlight {idx} event: {str(e)}")
+
+def unified_reasoning(script, modelID, vtt_segments, theme, num_videos, video_length, on_highlight=None, cache=None):
+    """Pick `num_videos` highlights, in one call or map-reduced over cue windows.
+
+    With the cascade a cheap model first proposes candidate regions and the
+    single call only sees those. `on_highlight` is called with each final
+    highlight in order: while the response streams in single mode, after the
+    merge in chunked mode.
+    """
+    cue_lines = format_cue_lines(vtt_segments)
+    listing_chars = sum(len(line) + 1 for line in cue_lines)
+
+    try:
+        excerpt, report = None, None
+        cascade = REASONING_CASCADE == 'on' or (REASONING_CASCADE == 'auto' and listing_chars > CASCADE_MIN_CHARS)
+        if cascade:
+            excerpt, report = candidate_excerpt(cue_lines, theme, num_videos, video_length, cache)
+
+        chunked = excerpt is None and (REASONING_MODE == 'chunked' or (REASONING_MODE == 'auto' and listing_chars > CHUNK_CHARS))
+        path = 'cascade' if excerpt is not None else 'chunked' if chunked else 'single'
+        print(f"Reasoning path: {path} for {listing_chars} listing characters"
+              f"{' (candidate pass skipped)' if cascade and excerpt is None else ''}")
+        if chunked:
+            highlights = chunked_reasoning(modelID, vtt_segments, cue_lines, theme, num_videos, video_length, cache)
+        else:
+            prompt = build_prompt(excerpt or "\n".join(cue_lines), theme, num_videos, video_length,
+                                  excerpt=excerpt is not None)
+            start = time.monotonic()
+            streamed = REASONING_STREAM and on_highlight
+            if streamed:
+                highlights = stream_reasoning(modelID, prompt, theme, vtt_segments, num_videos, video_length,
+                                              on_highlight, cache)
+            else:
+                highlights = invoke_reasoning(modelID, prompt, theme, num_videos, video_length, vtt_segments, cache)
+                highlights = highlights[:num_videos]  # Ensure we only return the requested number of videos
+            if report is not None:
+                full_prompt = build_prompt("\n".join(cue_lines), theme, num_videos, video_length)
+                log_cascade(report, modelID, full_prompt, prompt, num_videos, video_length, time.monotonic() - start)
+            if streamed:
+                return highlights
+
+        if on_highlight:
+            for highlight in highlights:
+                on_highlight(highlight)
+        return highlights
+    except Exception as e:
+        print(f"Error in unified_reasoning: {str(e)}")
+        raise
+
+def chunked_reasoning(modelID, vtt_segments, cue_lines, theme, num_videos, video_length, cache=None):
+    """Extract candidates from overlapping cue windows concurrently, then merge them locally.
+
+    Cue ids stay global across windows, so candidates from different windows
+    can be compared directly; the best-scored non-overlapping ones are kept.
+    """
+    windows = window_ranges([len(line) + 1 for line in cue_lines], CHUNK_CHARS, CHUNK_OVERLAP_CHARS)
+    print(f"Chunked reasoning over {len(cue_lines)} cues in {len(windows)} windows")
+
+    def extract(part):
+        first, end = windows[part]
+        prompt = build_prompt(
+            "\n".join(cue_lines[first:end]), theme, num_videos, video_length,
+            part=(part + 1, len(windows), first, end - 1)
+        )
+        return invoke_reasoning(modelID, prompt, theme, num_videos, video_length, vtt_segments, cache)
+
+    candidates = []
+    failures = 0
+    with ThreadPoolExecutor(max_workers=max(1, min(CHUNK_CONCURRENCY, len(windows)))) as executor:
+        futures = {executor.submit(extract, part): part for part in range(len(windows))}
+        for future in as_completed(futures):
+            try:
+                candidates.extend(future.result())
+            except Exception as e:
+                failures += 1
+                print(f"Window {futures[future] + 1}/{len(windows)} failed: {str(e)}")
+
+    if failures == len(windows):
+        raise Exception("Every transcript window failed in chunked reasoning")
+    print(f"Merging {len(candidates)} candidates from {len(windows) - failures} windows")
+    return merge_candidates(candidates, num_videos)
+
+def candidate_excerpt(cue_lines, theme, num_videos, video_length, cache=None):
+    """(excerpt listing, report) of the candidate regions CASCADE_MODEL proposes, or (None, None).
+
+    The excerpt keeps the global cue ids, so the reasoning model's answer
+    is rebuilt against the full transcript as usual. Any failure of the
+    cheap pass falls back to the full listing.
+    """
+    count = max(int(num_videos) * CASCADE_OVERSAMPLE, 10)
+    prompt = build_candidate_prompt("\n".join(cue_lines), theme, count, video_length)
+    adapter = get_adapter(CASCADE_MODEL)
+    if estimate_tokens(prompt) + count * 100 > adapter.context_tokens:
+        print(f"Transcript too long for {CASCADE_MODEL}, skipping the candidate pass")
+        return None, None
+
+    system_prompt = f"You shortlist {theme}-focused passages of video transcripts for short-form content."
+    request = adapter.request(prompt, system_prompt, max_tokens=min(adapter.max_output_tokens, count * 100 + 1000))
+
+    def parse(response):
+        text, _ = adapter.response_text(response["output"]["message"]["content"])
+        result = json.loads(text[text.find('{'):text.rfind('}') + 1])
+        ranges = [
+            cue_range
+            for candidate in result['candidates']
+            for cue_range in parse_cue_ranges(candidate.get('cues', []), len(cue_lines))
+        ]
+        if not ranges:
+            raise ValueError("No valid cue ranges among the candidates")
+        return ranges, {} if response.get('fromCache') else response.get('usage') or {}
+
+    start = time.monotonic()
+    try:
+        if cache is not None:
+            ranges, usage = cache.converse(bedrock_runtime, parse, **request)
+        else:
+            ranges, usage = parse(bedrock_runtime.converse(**request))
+    except Exception as e:
+        print(f"Candidate pass with {CASCADE_MODEL} failed, using the full transcript: {str(e)}")
+        return None, None
+
+    regions = expand_regions(ranges, len(cue_lines), CASCADE_MARGIN_CUES)
+    covered = sum(last - first + 1 for first, last in regions)
+    print(f"{CASCADE_MODEL} proposed {len(ranges)} cue ranges; {len(regions)} regions cover {covered}/{len(cue_lines)} cues")
+    if not regions or covered > CASCADE_MAX_SHARE * len(cue_lines):
+        return None, None
+
+    return excerpt_listing(cue_lines, regions), {
+        'seconds': time.monotonic() - start,
+        'inputTokens': usage.get('inputTokens', 0),
+        'outputTokens': usage.get('outputTokens', 0),
+        'coveredCues': covered,
+        'totalCues': len(cue_lines),
+    }
+
+def build_candidate_prompt(cue_listing, theme, count, video_length):
+    """Prompt for the cheap pass: a generous shortlist of cue ranges, no reasoning."""
+    return f"""
+Video transcript, one subtitle cue per line as "cue_id|start_time|text":
+{cue_listing}
+
+Theme focus: {theme}
+Target short-form video length: {video_length} seconds
 
+TASK:
+List {count} candidate passages that could become engaging, self-contained short-form videos
+about the theme. Cover the whole transcript; include borderline passages rather than missing good ones.
+Refer to passages only by cue id ranges [first_cue_id, last_cue_id], both inclusive.
+
+OUTPUT FORMAT (JSON only, no other text):
+{{"candidates": [{{"cues": [[first_cue_id, last_cue_id], ...], "score": 1-10}}, ...]}}
+"""
+
+def log_cascade(report, modelID, full_prompt, refine_prompt, num_videos, video_length, refine_seconds):
+    """Log what the cascade saved in this run, in CloudWatch embedded metric format.
+
+    The single-pass latency is the router's estimate for the full listing;
+    saved prompt tokens are those the reasoning model did not read, next to
+    the (cheaper) tokens the candidate pass used.
+    """
+    adapter = get_adapter(modelID)
+    full_tokens = estimate_tokens(full_prompt)
+    refine_tokens = estimate_tokens(refine_prompt)
+    single_seconds = router.estimate_seconds(adapter, full_tokens, num_videos, video_length,
+                                             routing=REASONING_ROUTING == 'auto')
+    cascade_seconds = report['seconds'] + refine_seconds
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ShortsGenerator/Cascade',
+                'Dimensions': [['Model']],
+                'Metrics': [
+                    {'Name': 'CandidateSeconds', 'Unit': 'Seconds'},
+                    {'Name': 'RefineSeconds', 'Unit': 'Seconds'},
+                    {'Name': 'EstimatedSecondsSaved', 'Unit': 'Seconds'},
+                    {'Name': 'PromptTokensSaved', 'Unit': 'Count'},
+                    {'Name': 'CandidateTokens', 'Unit': 'Count'},
+                ],
+            }],
+        },
+        'Model': modelID,
+        'Path': 'cascade',
+        'CascadeMode': REASONING_CASCADE,
+        'CandidateModel': CASCADE_MODEL,
+        'CandidateSeconds': report['seconds'],
+        'RefineSeconds': refine_seconds,
+        'EstimatedSinglePassSeconds': single_seconds,
+        'EstimatedSecondsSaved': single_seconds - cascade_seconds if single_seconds else 0,
+        'FullPromptTokens': full_tokens,
+        'RefinePromptTokens': refine_tokens,
+        'PromptTokensSaved': full_tokens - refine_tokens,
+        'CandidateTokens': report['inputTokens'] + report['outputTokens'],
+        'CoveredCues': report['coveredCues'],
+        'TotalCues': report['totalCues'],
+    }))
+
+def build_prompt(cue_listing, theme, num_videos, video_length, part=None, excerpt=False):
+    """Reasoning prompt over `cue_listing`.
+
+    `part` is (index, count, first cue, last cue) of a window; `excerpt`
+    marks a listing of candidate regions only.
+    """
     # Calculate word count range based on video length
     min_words = max(20, int(float(video_length) * 1.5))  # Minimum 20 words
     max_words = int(float(video_length) * 2.5)  # Allow for natural speech variations
 
+    if part:
+        index, count, first_cue, last_cue = part
+        amount = f"up to {num_videos}"
+        part_note = (
+            f"\nThis is part {index} of {count} of a longer transcript (cues {first_cue}-{last_cue}). "
+            f"Only use cues shown here. Other parts are handled separately and the best highlights are picked by score.\n"
+        )
+    elif excerpt:
+        amount = f"exactly {num_videos}"
+        part_note = (
+            "\nOnly candidate passages of a longer transcript are shown; \"...\" marks skipped parts. "
+            "Pick the best of them and only use cues shown here.\n"
+        )
+    else:
+        amount = f"exactly {num_videos}"
+        part_note = ""
+
     prompt = f"""
 INPUT FORMAT:
-Video transcript with timestamps:
-{json.dumps(vtt_segments, indent=2)}
-
+Video transcript, one subtitle cue per line as "cue_id|start_time|text":
+{cue_listing}
+{part_note}
 Theme focus: {theme}
 Number of videos to create: {num_videos}
 Target video length: {video_length} seconds
 
 TASK:
-Extract exactly {num_videos} engaging segments from the transcript that would work well as standalone short-form content.
+Extract {amount} engaging segments from the transcript that would work well as standalone short-form content.
 Focus on content that aligns with the specified theme: {theme}
-For each segment, identify the exact VTT segments that contain the content to preserve timestamps.
+For each segment, identify the ranges of cue ids that contain the content.
 Always go for the best short-form content. Revise your work. Think step by step. 
 
 CONSTRAINTS:
 1. Content Requirements:
-   - Extract exactly {num_videos} distinct segments that best match the {theme} theme
+   - Extract {amount} distinct segments that best match the {theme} theme
    - Each segment must be self-contained and strongly relate to the {theme} theme
    - Focus on high-engagement content (key insights, interesting stories, memorable moments)
    - Content must make sense without external context
@@ -120,9 +433,9 @@ CONSTRAINTS:
 
 2. Length and Format:
    - Target duration: {video_length} seconds when spoken (approximately {min_words}-{max_words} words)
+   - A cue range lasts from its first cue's start_time to the start_time of the cue after its last cue (the final cue of the transcript ends the video); the short is cut exactly there
    - Prefer segments that naturally fit the target duration
-   - Use [...] to mark non-consecutive content
-   - Preserve EXACT original wording for timestamp matching
+   - Use several cue ranges to combine non-consecutive content
 
 3. Title Creation:
    - Maximum 8 words
@@ -131,11 +444,10 @@ CONSTRAINTS:
    - Include theme-relevant keywords when possible
 
 4. Technical Requirements:
-   - Keep exact transcript wording for accurate timestamp matching
+   - Refer to content only by cue id ranges [first_cue_id, last_cue_id], both inclusive
    - Include complete sentences/thoughts
    - Maintain chronological order
    - Start and end at natural break points
-   - Include start and end timestamps for each segment
 
 OUTPUT FORMAT:
 <thought>
@@ -152,8 +464,8 @@ OUTPUT FORMAT:
   "highlights": [
     {{
       "title": "Clear, engaging title",
-      "text": "Exact text from transcript [...] with proper cuts marked",
-      "timeframes": [[start_time1, end_time1], [start_time2, end_time2], ...]
+      "cues": [[first_cue_id1, last_cue_id1], [first_cue_id2, last_cue_id2], ...],
+      "score": 1-10 rating of engagement and theme fit
     }},
     ...
   ]
@@ -161,141 +473,182 @@ OUTPUT FORMAT:
 </JSON>
 
 CRITICAL NOTES:
-- DO NOT modify any words from the original transcript
-- DO NOT correct grammar or improve phrasing
-- DO NOT combine distant segments without [...] markers
+- DO NOT copy transcript text or timestamps into the JSON, only cue ids
+- DO NOT combine distant content into one cue range
 - DO NOT include segments requiring external context
 - DO ensure each segment has clear beginning and end
-- DO include accurate timestamps for each segment
 - DO prioritize content that aligns with the {theme} theme
-- Always revise if you have the right timestamps
+- Always revise if your cue ranges cover the right content
 - Quality and theme alignment of each highlight is important
 """
-
-    messages = [
-        {
-            "role": "user",
-            "content": [{"text": prompt}]
-        }
-    ]
-
-    # Add system prompt
-    system_prompts = [{"text": f"You are an AI assistant that extracts {theme}-focused segments from video transcripts for short-form content."}]
-
+    return prompt
+
+def reasoning_request(modelID, prompt, theme, num_videos, video_length):
+    """(plan, Converse arguments) for the reasoning prompt, on `modelID` or the model routed to."""
+    plan = router.choose(modelID, prompt, num_videos, video_length, routing=REASONING_ROUTING == 'auto')
+    system_prompt = f"You are an AI assistant that extracts {theme}-focused segments from video transcripts for short-form content."
+    return plan, plan.adapter.request(prompt, system_prompt, plan.thinking_budget, plan.max_tokens)
+
+def invoke_reasoning(modelID, prompt, theme, num_videos, video_length, vtt_segments, cache=None):
+    """Run the reasoning prompt, through `cache` when given, and return the parsed highlights.
+
+    Only answers that parse into highlights are cached.
+    """
+    plan, request = reasoning_request(modelID, prompt, theme, num_videos, video_length)
+    start = time.monotonic()
+
+    def parse(response):
+        text = response_text(plan.adapter, response)
+        if not response.get('fromCache'):
+            router.record(plan.adapter.model_id, time.monotonic() - start, response.get('usage'))
+            log_reasoning_usage(plan, num_videos, video_length, text, response.get('usage'), response.get('stopReason'))
+        return parse_highlights(text, vtt_segments)
+
+    if cache is not None:
+        return cache.converse(bedrock_runtime, parse, **request)
+    return parse(bedrock_runtime.converse(**request))
+
+def response_text(adapter, response):
+    """Text of a Converse response as `adapter` reads it; reasoning is only logged."""
+    text, reasoning = adapter.response_text(response["output"]["message"]["content"])
+
+    print(f"Response text: {text}")
+    print(f"Reasoning: {reasoning}")
+
+    return text
+
+def log_reasoning_usage(plan, num_videos, video_length, text, usage, stop_reason):
+    """Log budget and reasoning tokens used in CloudWatch embedded metric format, with the sizing inputs.
+
+    Converse does not report thinking tokens separately; they are the output
+    tokens minus the estimated size of the answer text.
+    """
+    output_tokens = (usage or {}).get('outputTokens', 0)
+    reasoning_tokens = max(output_tokens - estimate_tokens(text), 0)
+    print(json.dumps({
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': 'ShortsGenerator/Reasoning',
+                'Dimensions': [['Model']],
+                'Metrics': [
+                    {'Name': 'ThinkingBudget', 'Unit': 'Count'},
+                    {'Name': 'MaxTokens', 'Unit': 'Count'},
+                    {'Name': 'ReasoningTokens', 'Unit': 'Count'},
+                    {'Name': 'OutputTokens', 'Unit': 'Count'},
+                ],
+            }],
+        },
+        'Model': plan.adapter.model_id,
+        'ThinkingBudget': plan.thinking_budget,
+        'MaxTokens': plan.max_tokens,
+        'ReasoningTokens': reasoning_tokens,
+        'OutputTokens': output_tokens,
+        'PromptTokens': plan.input_tokens,
+        'NumVideos': int(num_videos),
+        'VideoLength': float(video_length),
+        'StopReason': stop_reason,
+    }))
+    if stop_reason == 'max_tokens':
+        print(f"Reasoning hit max_tokens {plan.max_tokens} (thinking budget {plan.thinking_budget})")
+
+def stream_reasoning(modelID, prompt, theme, vtt_segments, num_videos, video_length, on_highlight, cache=None):
+    """Run the reasoning prompt with converse_stream, handing each highlight to `on_highlight` as it closes.
+
+    Returns the highlights in the order they were handed over. A cached
+    response is replayed at once; a complete streamed one is stored in `cache`.
+    """
+    plan, request = reasoning_request(modelID, prompt, theme, num_videos, video_length)
+    key = request_key(request)
+    parser = HighlightStreamParser()
+    highlights = []
+
+    def take(text):
+        for highlight in parser.feed(text):
+            rebuilt = rebuild_highlight(highlight, vtt_segments)
+            if rebuilt is None:
+                print(f"Skipping highlight without valid cue ranges: {highlight}")
+            elif len(highlights) < num_videos:
+                highlights.append(rebuilt)
+                print(f"Streamed highlight {len(highlights) - 1}: {rebuilt['title']}")
+                on_highlight(rebuilt)
+
+    cached = cache.get(key) if cache is not None else None
+    if cached is not None:
+        text = response_text(plan.adapter, cached)
+        take(text)
+    else:
+        start = time.monotonic()
+        text, stop_reason, usage = read_stream(bedrock_runtime.converse_stream(**request), take)
+        router.record(plan.adapter.model_id, time.monotonic() - start, usage)
+        log_reasoning_usage(plan, num_videos, video_length, text, usage, stop_reason)
+        # Only complete answers are worth replaying; put() also checks the stop reason
+        if cache is not None and parser.closed and highlights:
+            cache.put(key, {
+                "output": {"message": {"role": "assistant", "content": [{"text": text}]}},
+                "stopReason": stop_reason,
+                "usage": usage
+            })
+        elif cache is not None:
+            cache.drop(key)
+
+    if not parser.closed and not highlights:
+        print(f"No JSON found in response: {text}")
+        raise Exception("No valid JSON found in model response")
+    return highlights
+
+def read_stream(response, on_text):
+    """Pass each text delta of a converse_stream response to `on_text`; returns (text, stop reason, usage)."""
+    text = []
+    reasoning_chars = 0
+    stop_reason = None
+    usage = {}
+
+    for event in response["stream"]:
+        if "contentBlockDelta" in event:
+            delta = event["contentBlockDelta"]["delta"]
+            if "reasoningContent" in delta:
+                reasoning_chars += len(delta["reasoningContent"].get("text", ""))
+            elif "text" in delta:
+                text.append(delta["text"])
+                on_text(delta["text"])
+        elif "messageStop" in event:
+            stop_reason = event["messageStop"].get("stopReason")
+        elif "metadata" in event:
+            usage = event["metadata"].get("usage", {})
+            print(f"Usage: {usage}")
+
+    text = "".join(text)
+    print(f"Response text: {text}")
+    print(f"Reasoning characters: {reasoning_chars}")
+    return text, stop_reason, usage
+
+def parse_highlights(text, vtt_segments):
+    """Highlights of a model response, with text and timeframes rebuilt from their cue ranges."""
+    # Extract JSON from the response text
+    start_idx = text.find('{')
+    end_idx = text.rfind('}')
+    if start_idx == -1 or end_idx == -1:
+        print(f"No JSON found in response: {text}")
+        raise Exception("No valid JSON found in model response")
+
+    json_str = text[start_idx:end_idx+1]
     try:
-        if modelID == 'us.anthropic.claude-3-7-sonnet-20250219-v1:0':
-            config = {
-                "max_tokens": 64000,
-                "thinking": {
-                    "type": "enabled",
-                    "budget_tokens": 60000
-                }
-            }
-            response = bedrock_runtime.converse(
-                modelId=modelID,
-                messages=messages,
-                additionalModelRequestFields=config
-            )
-
-            print(response)
-            content_blocks = response["output"]["message"]["content"]
-
-            reasoning = ''
-            text = ''
-
-            print(content_blocks)
-            
-            for chunk in content_blocks:
-                if "text" in chunk:
-                    text = chunk["text"]
-
-            print(f"Response text: {text}")
-
-        elif modelID == "us.deepseek.r1-v1:0":
-            config = {
-                "temperature": 0,
-                "maxTokens": 32768
-            }
-            response = bedrock_runtime.converse(
-                modelId=modelID,
-                messages=messages,
-                system=system_prompts,
-                inferenceConfig=config
-            )
-
-            content_blocks = response['output']["message"]["content"]
-
-            reasoning = ''
-            text = ''
-            
-            for chunk in content_blocks:
-                if "text" in chunk:
-                    text = chunk["text"]
-                elif "reasoningContent" in chunk:
-                    reasoning = chunk["reasoningContent"]["reasoningText"]
-
-            print(f"Response text: {text}")
-            print(f"Reasoning: {reasoning}")
-
-        # Extract JSON from the response text
-        start_idx = text.find('{')
-        end_idx = text.rfind('}')
-        if start_idx != -1 and end_idx != -1:
-            json_str = text[start_idx:end_idx+1]
-            try:
-                result = json.loads(json_str)
-                # Sort timeframes for each highlight
-                for highlight in result['highlights']:
-                    highlight['timeframes'].sort(key=lambda x: x[0])  # Sort by start time
-                return result['highlights'][:num_videos]  # Ensure we only return the requested number of videos
-            except json.JSONDecodeError as e:
-                print(f"Failed to parse JSON from response: {json_str}")
-                raise Exception(f"JSON parsing error: {str(e)}")
-        else:
-            print(f"No JSON found in response: {text}")
-            raise Exception("No valid JSON found in model response")
-
-    except Exception as e:
-        print(f"Error in unified_reasoning: {str(e)}")
-        raise
-
-def parse_vtt(vtt_content):
-    """VTT 파일을 파싱하여 전체 스크립트와 타임스탬프가 있는 세그먼트 목록을 반환합니다."""
-    lines = vtt_content.split('\n')
-    segments = []
-    full_script = []
-    current_segment = None
-    
-    for line in lines:
-        line = line.strip()
-        if not line or line == 'WEBVTT':
+        result = json.loads(json_str)
+    except json.JSONDecodeError as e:
+        print(f"Failed to parse JSON from response: {json_str}")
+        raise Exception(f"JSON parsing error: {str(e)}")
+
+    highlights = []
+    for highlight in result['highlights']:
+        rebuilt = rebuild_highlight(highlight, vtt_segments)
+        if rebuilt is None:
+            print(f"Skipping highlight without valid cue ranges: {highlight}")
             continue
-            
-        # 타임스탬프 라인 체크 (00:00:00.000 --> 00:00:00.000)
-        if ' --> ' in line:
-            if current_segment:
-                segments.append(current_segment)
-            start, end = line.split(' --> ')
-            current_segment = {
-                'start': convert_timestamp_to_seconds(start),
-                'end': convert_timestamp_to_seconds(end),
-                'text': []
-            }
-        elif current_segment is not None:
-            current_segment['text'].append(line)
-            full_script.append(line)
-    
-    if current_segment:
-        segments.append(current_segment)
-    
-    return ' '.join(full_script), segments
-
-def convert_timestamp_to_seconds(timestamp):
-    """VTT 타임스탬프를 초 단위로 변환합니다."""
-    # 00:00:00.000 형식의 타임스탬프를 파싱
-    h, m, s = timestamp.split(':')
-    seconds = float(h) * 3600 + float(m) * 60 + float(s)
-    return seconds
+        highlights.append(rebuilt)
+    if not highlights:
+        raise Exception("No highlight with valid cue ranges in model response")
+    return highlights
 
 def convert_seconds_to_timecode(seconds):
     """초 단위 시간을 타임코드 형식으로 변환합니다."""
@@ -0,0 +1,248 @@
+"""Reasoning model adapters and a router that picks the fastest adequate one.
+
+An adapter knows how to build the Converse request for its model (thinking
+fields, output limit, system prompt) and how to read the text out of the
+response blocks. It also declares the context window, the largest output
+and a prior output speed, which the router uses until it has observed the
+model itself.
+
+The router estimates each candidate's latency for a prompt (reading the
+prompt, then generating thinking and answer) and keeps those whose context
+and output limits fit. Long transcripts additionally need a model that
+reasons; short ones can skip thinking altogether. The requested
+model wins unless another one is clearly faster. Thinking budget and output
+limit are sized to the job by `ThinkingBudget` rather than set to the
+model's maximum, which also keeps Bedrock from reserving quota for tokens
+that are never generated.
+"""
+import threading
+from collections import namedtuple
+
+# Transcripts are often Korean, which takes fewer characters per token than English
+CHARS_PER_TOKEN = 3
+# Output per highlight (title, cue ranges, score and a short thought), plus the <thought> section
+TOKENS_PER_HIGHLIGHT = 400
+THOUGHT_TOKENS = 600
+# Longer shorts are cut from more cue ranges
+TOKENS_PER_HIGHLIGHT_SECOND = 2
+# Output limit over the expected answer, and never below MIN_OUTPUT_TOKENS
+OUTPUT_HEADROOM = 2.0
+MIN_OUTPUT_TOKENS = 4096
+SMOOTHING = 0.3
+# Prompt tokens read per second before the first output token, for models without their own figure
+PREFILL_TOKENS_PER_SECOND = 2000
+
+# Model, thinking budget and output limit chosen for a prompt, with the estimates behind them
+Plan = namedtuple('Plan', ['adapter', 'thinking_budget', 'max_tokens', 'input_tokens', 'seconds'])
+
+
+class ModelAdapter:
+    """A model called through Converse with inferenceConfig; no thinking."""
+
+    thinking = False          # Supports a thinking budget that can be switched off
+    always_reasons = False    # Reasons on every call, whatever the request says
+
+    def __init__(self, model_id, context_tokens, max_output_tokens, tokens_per_second,
+                 first_token_seconds=2.0, reasoning_tokens=0,
+                 prefill_tokens_per_second=PREFILL_TOKENS_PER_SECOND):
+        self.model_id = model_id
+        self.context_tokens = context_tokens
+        self.max_output_tokens = max_output_tokens
+        self.tokens_per_second = tokens_per_second
+        self.first_token_seconds = first_token_seconds
+        # Time to read the prompt grows with its length on top of first_token_seconds
+        self.prefill_tokens_per_second = prefill_tokens_per_second
+        # Reasoning a model produces on its own, for latency estimates
+        self.reasoning_tokens = reasoning_tokens
+
+    def request(self, prompt, system_prompt, thinking_budget=0, max_tokens=None):
+        return {
+            "modelId": self.model_id,
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
+            "system": [{"text": system_prompt}],
+            "inferenceConfig": {"temperature": 0, "maxTokens": max_tokens or self.max_output_tokens},
+        }
+
+    def response_text(self, content_blocks):
+        """(text, reasoning) of the content blocks of a Converse response."""
+        text = ''
+        reasoning = ''
+        for block in content_blocks:
+            if "text" in block:
+                text = block["text"]
+            elif "reasoningContent" in block:
+                reasoning = block["reasoningContent"].get("reasoningText", {}).get("text", "")
+        return text, reasoning
+
+
+class ClaudeAdapter(ModelAdapter):
+    """Claude with extended thinking, set through additionalModelRequestFields."""
+
+    thinking = True
+
+    def request(self, prompt, system_prompt, thinking_budget=0, max_tokens=None):
+        if not thinking_budget:
+            return super().request(prompt, system_prompt, max_tokens=max_tokens)
+        # Thinking requires the default temperature; the budget counts against max_tokens
+        return {
+            "modelId": self.model_id,
+            "messages": [{"role": "user", "content": [{"text": prompt}]}],
+            "additionalModelRequestFields": {
+                "max_tokens": max_tokens or self.max_output_tokens,
+                "thinking": {"type": "enabled", "budget_tokens": thinking_budget},
+            },
+        }
+
+
+class DeepSeekR1Adapter(ModelAdapter):
+    always_reasons = True
+
+    def response_text(self, content_blocks):
+        text, reasoning = super().response_text(content_blocks)
+        # Reasoning sometimes arrives inline instead of in its own block
+        if '</think>' in text:
+            inline, text = text.rsplit('</think>', 1)
+            reasoning = reasoning or inline.replace('<think>', '').strip()
+        return text.strip(), reasoning
+
+
+ADAPTERS = {adapter.model_id: adapter for adapter in [
+    ClaudeAdapter("us.anthropic.claude-3-7-sonnet-20250219-v1:0", 200000, 64000, 60),
+    ModelAdapter("us.anthropic.claude-3-5-sonnet-20241022-v2:0", 200000, 8192, 55),
+    ModelAdapter("us.anthropic.claude-3-5-sonnet-20240620-v1:0", 200000, 8192, 50),
+    ModelAdapter("us.anthropic.claude-3-5-haiku-20241022-v1:0", 200000, 8192, 65, first_token_seconds=1.0),
+    DeepSeekR1Adapter("us.deepseek.r1-v1:0", 128000, 32768, 40, reasoning_tokens=4000),
+    ModelAdapter("us.amazon.nova-pro-v1:0", 300000, 5000, 90, first_token_seconds=1.0),
+    ModelAdapter("us.amazon.nova-lite-v1:0", 300000, 5000, 150, first_token_seconds=0.5),
+]}
+
+
+def get_adapter(model_id):
+    """Adapter of `model_id`; unknown models get plain Converse with conservative limits."""
+    adapter = ADAPTERS.get(model_id)
+    if adapter is None:
+        print(f"No adapter registered for {model_id}, using plain Converse")
+        adapter = ModelAdapter(model_id, 100000, 4096, 40)
+    return adapter
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def expected_output_tokens(num_videos, video_length):
+    per_highlight = TOKENS_PER_HIGHLIGHT + TOKENS_PER_HIGHLIGHT_SECOND * float(video_length)
+    return int(THOUGHT_TOKENS + per_highlight * int(num_videos))
+
+
+class ThinkingBudget:
+    """Thinking tokens for a job: base + per 1k prompt tokens + per minute of shorts, within bounds.
+
+    The coefficients are meant to be refitted from the `ShortsGenerator/Reasoning`
+    metrics, which log the reasoning tokens actually used next to these inputs.
+    """
+
+    def __init__(self, base, per_1k_tokens, per_short_minute, minimum, maximum):
+        self.base = base
+        self.per_1k_tokens = per_1k_tokens
+        self.per_short_minute = per_short_minute
+        self.minimum = minimum
+        self.maximum = maximum
+
+    def tokens(self, input_tokens, num_videos, video_length):
+        minutes = int(num_videos) * float(video_length) / 60
+        budget = self.base + self.per_1k_tokens * input_tokens / 1000 + self.per_short_minute * minutes
+        return int(min(max(budget, self.minimum), self.maximum))
+
+
+class ModelRouter:
+    def __init__(self, candidates, thinking_min_tokens, budget, slack=1.5):
+        self.candidates = list(candidates)
+        # Prompts from this size on go to a model that reasons
+        self.thinking_min_tokens = thinking_min_tokens
+        self.budget = budget
+        # The requested model is kept while it is at most this much slower than the fastest
+        self.slack = slack
+        self.speeds = {}  # Observed output tokens per second
+        self._lock = threading.Lock()
+
+    def plan(self, adapter, input_tokens, output_tokens, thinking_budget):
+        """Plan of `adapter` for the prompt, or None if inadequate.
+
+        `thinking_budget` is what the job needs when it needs reasoning, else 0.
+        """
+        need_reasoning = thinking_budget > 0
+        if need_reasoning and not (adapter.thinking or adapter.always_reasons):
+            return None
+        budget = thinking_budget if adapter.thinking else 0
+        # The budget shrinks to what the output limit and context window leave
+        budget = max(0, min(budget, adapter.max_output_tokens - output_tokens,
+                            adapter.context_tokens - input_tokens - output_tokens))
+        if need_reasoning and adapter.thinking and budget < 1024:
+            return None
+        max_tokens = min(adapter.max_output_tokens,
+                         budget + max(int(output_tokens * OUTPUT_HEADROOM), MIN_OUTPUT_TOKENS))
+        if output_tokens + budget > max_tokens or input_tokens + max_tokens > adapter.context_tokens:
+            return None
+
+        speed = self.speeds.get(adapter.model_id, adapter.tokens_per_second)
+        # Thinking rarely uses its whole budget
+        generated = output_tokens + budget / 2 + adapter.reasoning_tokens
+        prefill = input_tokens / adapter.prefill_tokens_per_second
+        seconds = adapter.first_token_seconds + prefill + generated / speed
+        return Plan(adapter, budget, max_tokens, input_tokens, seconds)
+
+    def estimate_seconds(self, adapter, input_tokens, num_videos, video_length, routing=True):
+        """Estimated latency of `adapter` for a prompt of `input_tokens`, or None if it does not fit."""
+        thinking_budget = 0
+        if not routing:
+            thinking_budget = self.budget.maximum if adapter.thinking else 0
+        elif input_tokens >= self.thinking_min_tokens:
+            thinking_budget = self.budget.tokens(input_tokens, num_videos, video_length)
+        plan = self.plan(adapter, input_tokens, expected_output_tokens(num_videos, video_length), thinking_budget)
+        return plan.seconds if plan else None
+
+    def choose(self, requested_id, prompt, num_videos, video_length, routing=True):
+        """Plan for `prompt`, preferring `requested_id`."""
+        requested = get_adapter(requested_id)
+        input_tokens = estimate_tokens(prompt)
+
+        if not routing:
+            # The requested model as configured before routing existed
+            budget = self.budget.maximum if requested.thinking else 0
+            return Plan(requested, budget, requested.max_output_tokens, input_tokens, None)
+
+        output_tokens = expected_output_tokens(num_videos, video_length)
+        thinking_budget = 0
+        if input_tokens >= self.thinking_min_tokens:
+            thinking_budget = self.budget.tokens(input_tokens, num_videos, video_length)
+
+        plans = {}
+        for adapter in [requested] + [get_adapter(model_id) for model_id in self.candidates
+                                      if model_id != requested_id]:
+            plan = self.plan(adapter, input_tokens, output_tokens, thinking_budget)
+            if plan is not None:
+                plans[adapter.model_id] = plan
+        if not plans:
+            print(f"No adequate model for {input_tokens} prompt tokens, using {requested_id}")
+            budget = self.budget.maximum if requested.thinking else 0
+            return Plan(requested, budget, requested.max_output_tokens, input_tokens, None)
+
+        fastest = min(plans.values(), key=lambda plan: plan.seconds)
+        chosen = plans.get(requested_id)
+        if chosen is None or chosen.seconds > fastest.seconds * self.slack:
+            chosen = fastest
+        print(f"Routing {input_tokens} prompt tokens to {chosen.adapter.model_id} "
+              f"(thinking budget {chosen.thinking_budget}, max tokens {chosen.max_tokens}, "
+              f"about {chosen.seconds:.0f}s; requested {requested_id})")
+        return chosen
+
+    def record(self, model_id, seconds, usage):
+        """Update the observed speed of `model_id` from a finished call."""
+        output_tokens = (usage or {}).get('outputTokens', 0)
+        if seconds <= 0 or not output_tokens:
+            return
+        speed = output_tokens / seconds
+        with self._lock:
+            previous = self.speeds.get(model_id)
+            self.speeds[model_id] = speed if previous is None else previous + SMOOTHING * (speed - previous)
@@ -0,0 +1,200 @@
+"""Content-addressed cache of Bedrock Converse responses.
+
+A response is stored under the sha256 of its whole request (model id,
+system prompt, messages and inference configuration), so Step Functions
+retries and re-runs of the same video, theme and length reuse the earlier
+answer instead of paying for the same call again. Only complete answers
+(`stopReason` end_turn) that the caller could parse are stored; anything
+else would be replayed and fail the same way until the entry expires.
+
+Entries live in the DynamoDB table `BEDROCK_CACHE_TABLE_NAME` with a TTL
+attribute; responses too large for an item are written to
+`bedrock-cache/{key}.json` in the bucket and the item points at them.
+Without a table name every call goes straight to Bedrock.
+"""
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# Version 2 drops entries stored before answers were validated
+CACHE_VERSION = 2
+# Below the 400 KB DynamoDB item limit, leaving room for the other attributes
+MAX_ITEM_BYTES = 350 * 1024
+S3_PREFIX = 'bedrock-cache'
+# Response fields worth keeping; ResponseMetadata and metrics belong to the original call
+CACHED_FIELDS = ('output', 'stopReason', 'usage')
+
+
+def request_key(request):
+    """Hash of a Converse request; key order and client-side objects do not matter."""
+    payload = json.dumps([CACHE_VERSION, request], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class BedrockCache:
+    def __init__(self, table=None, s3=None, bucket=None, ttl_seconds=7 * 24 * 3600, bypass=False):
+        self.table = table
+        self.s3 = s3
+        self.bucket = bucket
+        self.ttl_seconds = ttl_seconds
+        # Skip reads but still store fresh responses, e.g. to replace a bad answer
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.saved_input_tokens = 0
+        self.saved_output_tokens = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, dynamodb, s3, bypass=False):
+        """Cache configured by BEDROCK_CACHE_* variables; `bypass` adds to BEDROCK_CACHE_BYPASS."""
+        table_name = os.environ.get('BEDROCK_CACHE_TABLE_NAME')
+        return cls(
+            table=dynamodb.Table(table_name) if table_name else None,
+            s3=s3,
+            bucket=os.environ.get('BUCKET_NAME'),
+            ttl_seconds=int(os.environ.get('BEDROCK_CACHE_TTL_SECONDS', str(7 * 24 * 3600))),
+            bypass=bool(bypass) or os.environ.get('BEDROCK_CACHE_BYPASS', 'false').lower() == 'true',
+        )
+
+    @property
+    def enabled(self):
+        return self.table is not None
+
+    def get(self, key):
+        """Cached response for `key`, or None on a miss or bypass (counted as a miss)."""
+        if not self.enabled:
+            return None
+        response = self._read(key)
+        self._count(response)
+        return response
+
+    def _read(self, key):
+        response = None
+        try:
+            item = None if self.bypass else self.table.get_item(Key={'key': key}).get('Item')
+            # TTL deletion lags behind, so expired items can still be returned
+            if item and int(item['expiresAt']) > time.time():
+                response = self._read_body(item)
+        except (ClientError, ValueError, KeyError) as e:
+            logger.warning(f"Could not read Bedrock cache entry {key}: {str(e)}")
+        return response
+
+    def _count(self, response):
+        with self._lock:
+            if response is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                usage = response.get('usage', {})
+                self.saved_input_tokens += usage.get('inputTokens', 0)
+                self.saved_output_tokens += usage.get('outputTokens', 0)
+
+    def put(self, key, response):
+        """Store `response` under `key` if it is a complete answer; otherwise drop the entry."""
+        if not self.enabled:
+            return
+        if response.get('stopReason') != 'end_turn':
+            logger.warning(f"Not caching response {key} that stopped with {response.get('stopReason')}")
+            self.drop(key)
+            return
+        body = json.dumps({field: response[field] for field in CACHED_FIELDS if field in response},
+                          ensure_ascii=False, default=str)
+        item = {'key': key, 'expiresAt': int(time.time()) + self.ttl_seconds}
+        try:
+            if len(body.encode('utf-8')) <= MAX_ITEM_BYTES:
+                item['response'] = body
+            else:
+                s3_key = f'{S3_PREFIX}/{key}.json'
+                self.s3.put_object(Bucket=self.bucket, Key=s3_key, Body=body.encode('utf-8'),
+                                   ContentType='application/json')
+                item['s3Key'] = s3_key
+            self.table.put_item(Item=item)
+        except ClientError as e:
+            logger.warning(f"Could not write Bedrock cache entry {key}: {str(e)}")
+
+    def drop(self, key):
+        """Delete the entry of `key`; an S3 body is overwritten by the next put."""
+        if not self.enabled:
+            return
+        try:
+            self.table.delete_item(Key={'key': key})
+        except ClientError as e:
+            logger.warning(f"Could not delete Bedrock cache entry {key}: {str(e)}")
+
+    def converse(self, client, parse, **request):
+        """`parse(response)` of `client.converse(**request)`, answered from the cache when possible.
+
+        `parse` raises on an answer it cannot use; such an answer is not
+        stored, and a cached one is dropped and asked again. Cached
+        responses carry `fromCache: True`; their usage was paid for earlier.
+        """
+        key = request_key(request)
+        response = self._read(key) if self.enabled else None
+        if response is not None:
+            response['fromCache'] = True
+            try:
+                result = parse(response)
+            except Exception as e:
+                logger.warning(f"Dropping cached response {key} that does not parse: {str(e)}")
+                self.drop(key)
+            else:
+                self._count(response)
+                return result
+
+        if self.enabled:
+            self._count(None)
+        response = client.converse(**request)
+        try:
+            result = parse(response)
+        except Exception:
+            self.drop(key)
+            raise
+        self.put(key, response)
+        return result
+
+    def _read_body(self, item):
+        if 'response' in item:
+            return json.loads(item['response'])
+        data = self.s3.get_object(Bucket=self.bucket, Key=item['s3Key'])['Body'].read()
+        return json.loads(data.decode('utf-8'))
+
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'savedInputTokens': self.saved_input_tokens,
+            'savedOutputTokens': self.saved_output_tokens,
+        }
+
+    def log_metrics(self, function_name):
+        """Log the counters in CloudWatch embedded metric format, so they show up as metrics."""
+        if not self.enabled:
+            return
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': 'ShortsGenerator/BedrockCache',
+                    'Dimensions': [['Function']],
+                    'Metrics': [
+                        {'Name': 'Hits', 'Unit': 'Count'},
+                        {'Name': 'Misses', 'Unit': 'Count'},
+                        {'Name': 'SavedInputTokens', 'Unit': 'Count'},
+                        {'Name': 'SavedOutputTokens', 'Unit': 'Count'},
+                    ],
+                }],
+            },
+            'Function': function_name,
+            'Hits': self.hits,
+            'Misses': self.misses,
+            'SavedInputTokens': self.saved_input_tokens,
+            'SavedOutputTokens': self.saved_output_tokens,
+        }))
@@ -0,0 +1,379 @@
+"""Deadlines, hedged requests and a circuit breaker around Bedrock calls.
+
+The clients keep long socket timeouts because some answers take minutes,
+so a stuck connection used to hold a Map iteration until the Lambda timed
+out. `HedgedClient` runs each call on a worker thread and waits at most the
+call's deadline, which grows with the tokens the call may generate. A
+streamed answer may in addition not stall for longer than the idle timeout
+between two events.
+
+Latencies of successful calls go into a histogram per operation and model;
+when a call is still running after that histogram's p95, one duplicate is
+sent and whichever answers first wins. The loser is ignored, boto3 calls
+cannot be cancelled. Calls with extended thinking or a large output limit
+are never hedged, a duplicate would double the most expensive requests.
+Each duplicate takes its request and tokens from the rate limiter and is
+skipped when the limiter has no capacity left; its tokens are settled
+against its own usage once it finishes, whether it won or not.
+
+A loser or an overrun call that is already running keeps its worker thread
+until Bedrock answers. Once half of the workers are held like that, new
+calls go to a fresh pool and the stuck threads are left to finish on their
+own, so a warm container cannot run out of workers.
+
+After repeated failures or deadline overruns of a model the breaker opens
+and calls fail fast until the cooldown has passed; then a single trial
+call decides whether it closes again. Throttling is left to the rate
+limiter and does not count as a failure.
+"""
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from botocore.exceptions import ClientError
+
+from bedrock_limiter import estimate_tokens, is_throttling, used_tokens
+
+logger = logging.getLogger()
+
+# Seconds a call may take, hedge included, before BedrockDeadlineExceeded: a fixed part plus
+# one second per DEADLINE_TOKENS_PER_SECOND tokens of its output limit (0 keeps it fixed)
+CALL_DEADLINE_SECONDS = float(os.environ.get('BEDROCK_CALL_DEADLINE_SECONDS', '120'))
+DEADLINE_TOKENS_PER_SECOND = float(os.environ.get('BEDROCK_DEADLINE_TOKENS_PER_SECOND', '20'))
+# Longest pause between two events of a streamed answer
+STREAM_IDLE_SECONDS = float(os.environ.get('BEDROCK_STREAM_IDLE_SECONDS', '60'))
+# 'false' keeps deadlines and the breaker but never sends duplicates
+HEDGE_ENABLED = os.environ.get('BEDROCK_HEDGE', 'true').lower() == 'true'
+# Calls that may generate more tokens than this, or think, are not hedged
+HEDGE_MAX_OUTPUT_TOKENS = int(os.environ.get('BEDROCK_HEDGE_MAX_OUTPUT_TOKENS', '8192'))
+# Quantile of the latency histogram after which the duplicate is sent
+HEDGE_QUANTILE = float(os.environ.get('BEDROCK_HEDGE_QUANTILE', '0.95'))
+# Until a histogram has this many samples, hedge at half the deadline instead
+HEDGE_MIN_SAMPLES = int(os.environ.get('BEDROCK_HEDGE_MIN_SAMPLES', '20'))
+# Consecutive failures that open the breaker, and how long it stays open
+BREAKER_FAILURES = int(os.environ.get('BEDROCK_BREAKER_FAILURES', '5'))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get('BEDROCK_BREAKER_COOLDOWN_SECONDS', '60'))
+
+# Bucket bounds grow by 20 % from 50 ms, past the longest Lambda timeout
+BUCKET_BASE = 0.05
+BUCKET_GROWTH = 1.2
+BUCKET_COUNT = 60
+# Counts are halved beyond this many samples, so old latencies fade out
+HISTOGRAM_HALF_LIFE = 500
+COUNTERS = ('Calls', 'Hedged', 'HedgeWins', 'HedgeSkipped', 'DeadlineExceeded', 'StreamIdle', 'CircuitOpen')
+
+# Errors that say the model is unhealthy; validation errors and throttling do not
+UNHEALTHY_ERRORS = {'InternalServerException', 'ServiceUnavailableException',
+                    'ModelNotReadyException', 'ModelTimeoutException'}
+
+
+def is_unhealthy(error):
+    """Whether `error` should count towards opening the breaker; connection errors do."""
+    if isinstance(error, ClientError):
+        return error.response['Error']['Code'] in UNHEALTHY_ERRORS
+    return error is not None
+
+
+def output_tokens(request):
+    """Most tokens a Converse request may generate, thinking included; 0 when it sets no limit."""
+    return (request.get('additionalModelRequestFields', {}).get('max_tokens')
+            or request.get('inferenceConfig', {}).get('maxTokens') or 0)
+
+
+def thinks(request):
+    return 'thinking' in request.get('additionalModelRequestFields', {})
+
+
+class BedrockDeadlineExceeded(TimeoutError):
+    pass
+
+
+class CircuitOpen(RuntimeError):
+    pass
+
+
+class LatencyHistogram:
+    """Log-bucketed latencies; quantiles are read as bucket upper bounds."""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.total = 0
+
+    @staticmethod
+    def bucket(seconds):
+        if seconds <= BUCKET_BASE:
+            return 0
+        return min(int(math.log(seconds / BUCKET_BASE, BUCKET_GROWTH)) + 1, BUCKET_COUNT - 1)
+
+    def add(self, seconds):
+        self.counts[self.bucket(seconds)] += 1
+        self.total += 1
+        if self.total > HISTOGRAM_HALF_LIFE:
+            self.counts = [count // 2 for count in self.counts]
+            self.total = sum(self.counts)
+
+    def quantile(self, q):
+        if not self.total:
+            return None
+        seen = 0
+        for position, count in enumerate(self.counts):
+            seen += count
+            if seen >= q * self.total:
+                return BUCKET_BASE * BUCKET_GROWTH ** position
+        return BUCKET_BASE * BUCKET_GROWTH ** (BUCKET_COUNT - 1)
+
+
+class CircuitBreaker:
+    def __init__(self, failures=BREAKER_FAILURES, cooldown=BREAKER_COOLDOWN_SECONDS, clock=time.monotonic):
+        self.failures = failures
+        self.cooldown = cooldown
+        self.clock = clock
+        self.consecutive = 0
+        self.opened = None
+        self.trial = False
+
+    def allow(self):
+        """Whether a call may go out; after the cooldown only one trial call at a time."""
+        if self.opened is None:
+            return True
+        if self.trial or self.clock() - self.opened < self.cooldown:
+            return False
+        self.trial = True
+        return True
+
+    def succeeded(self):
+        self.consecutive = 0
+        self.opened = None
+        self.trial = False
+
+    def release(self):
+        """End a trial call that said nothing about the model's health."""
+        self.trial = False
+
+    def failed(self):
+        self.consecutive += 1
+        if self.trial or self.consecutive >= self.failures:
+            self.opened = self.clock()
+        self.trial = False
+
+
+class HedgedClient:
+    """bedrock-runtime client whose converse/converse_stream get deadlines, hedging and a breaker.
+
+    For converse_stream the hedge and deadline cover the call that opens
+    the stream; reading it is bounded by `stream_idle` between events.
+    `limiter` (a RateLimiter) is charged for every duplicate.
+    """
+
+    def __init__(self, client, deadline=CALL_DEADLINE_SECONDS, hedge=HEDGE_ENABLED, max_workers=16,
+                 limiter=None, tokens_per_second=DEADLINE_TOKENS_PER_SECOND, stream_idle=STREAM_IDLE_SECONDS):
+        self.client = client
+        self.deadline = deadline
+        self.hedge = hedge
+        self.limiter = limiter
+        self.tokens_per_second = tokens_per_second
+        self.stream_idle = stream_idle
+        self.histograms = {}
+        self.breakers = {}
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.max_workers = max_workers
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        # Futures still running although their call already returned or failed
+        self._abandoned = set()
+        self._lock = threading.Lock()
+
+    def converse(self, **request):
+        return self._invoke('converse', self.client.converse, request)
+
+    def converse_stream(self, **request):
+        response = self._invoke('converse_stream', self.client.converse_stream, request)
+        if self.stream_idle:
+            response['stream'] = self._idle_limited(response['stream'], request['modelId'])
+        return response
+
+    def call_deadline(self, request):
+        """Seconds `request` may take: the fixed deadline plus time for its output limit."""
+        if not self.tokens_per_second:
+            return self.deadline
+        return self.deadline + output_tokens(request) / self.tokens_per_second
+
+    def hedges(self, request):
+        return self.hedge and not thinks(request) and output_tokens(request) <= HEDGE_MAX_OUTPUT_TOKENS
+
+    def hedge_delay(self, key, call_deadline):
+        histogram = self.histograms.get(key)
+        if histogram is None or histogram.total < HEDGE_MIN_SAMPLES:
+            return call_deadline / 2
+        return histogram.quantile(HEDGE_QUANTILE)
+
+    def _invoke(self, operation, method, request):
+        model = request['modelId']
+        key = (operation, model)
+        call_deadline = self.call_deadline(request)
+        with self._lock:
+            breaker = self.breakers.setdefault(model, CircuitBreaker())
+            if not breaker.allow():
+                self.counters['CircuitOpen'] += 1
+                raise CircuitOpen(f"Circuit for {model} is open after {breaker.consecutive} failures")
+            self.counters['Calls'] += 1
+            self._replace_stuck_workers()
+
+        start = time.monotonic()
+        deadline = start + call_deadline
+        hedge_at = start + self.hedge_delay(key, call_deadline) if self.hedges(request) else deadline
+        first = self._executor.submit(method, **request)
+        pending = {first}
+        duplicate = None
+        hedged = False
+        error = None
+
+        while pending and time.monotonic() < deadline:
+            until = deadline if hedged or error is not None else min(hedge_at, deadline)
+            done, pending = wait(pending, timeout=max(until - time.monotonic(), 0), return_when=FIRST_COMPLETED)
+
+            for future in done:
+                try:
+                    response = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                self._abandon(pending)
+                self._record(key, model, time.monotonic() - start, hedge_won=future is duplicate)
+                return response
+
+            if not done and not hedged and error is None and time.monotonic() < deadline:
+                # Still running after the p95: send one duplicate, if the rate limit has room for it
+                hedged = True
+                taken = None
+                if self.limiter is not None:
+                    taken = self.limiter.acquire(model, estimate_tokens(request), block=False)
+                    if taken is None:
+                        logger.warning(f"No rate limit capacity to hedge {operation} to {model}")
+                        with self._lock:
+                            self.counters['HedgeSkipped'] += 1
+                        continue
+                logger.warning(f"Hedging {operation} to {model} after {time.monotonic() - start:.1f}s")
+                duplicate = self._executor.submit(method, **request)
+                if taken is not None:
+                    duplicate.add_done_callback(lambda future: self._settle(model, taken, future))
+                pending.add(duplicate)
+                with self._lock:
+                    self.counters['Hedged'] += 1
+
+        self._abandon(pending)
+        with self._lock:
+            if pending or is_unhealthy(error):
+                breaker.failed()
+            else:
+                breaker.release()
+            if pending:
+                self.counters['DeadlineExceeded'] += 1
+        if pending:
+            raise BedrockDeadlineExceeded(f"{operation} to {model} took over {call_deadline:.0f}s")
+        raise error
+
+    def _abandon(self, futures):
+        """Stop waiting for `futures`: cancel those not started, track the running ones."""
+        for future in futures:
+            if future.cancel():
+                continue
+            with self._lock:
+                self._abandoned.add(future)
+            future.add_done_callback(self._release_worker)
+
+    def _release_worker(self, future):
+        with self._lock:
+            self._abandoned.discard(future)
+
+    def _replace_stuck_workers(self):
+        """Move to a fresh pool once half the workers hang on abandoned calls; call under `_lock`."""
+        if len(self._abandoned) < max(self.max_workers // 2, 1):
+            return
+        logger.warning(f"{len(self._abandoned)} Bedrock workers still wait on abandoned calls, starting new ones")
+        self._executor.shutdown(wait=False)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        self._abandoned = set()
+
+    def _settle(self, model, taken, future):
+        """Settle the rate limit tokens of a finished duplicate against its own usage."""
+        try:
+            if future.cancelled():
+                self.limiter.refund(model, taken)
+                return
+            error = future.exception()
+            if error is not None:
+                if is_throttling(error):
+                    self.limiter.throttled(model)
+                return
+            usage = future.result().get('usage')
+            # Streams report usage in their last event; their estimate stays charged
+            if usage:
+                self.limiter.succeeded(model, taken, used_tokens(usage))
+        except Exception as e:
+            logger.warning(f"Could not settle the hedged call to {model}: {str(e)}")
+
+    def _idle_limited(self, stream, model):
+        """Events of `stream`, read on a thread; BedrockDeadlineExceeded after `stream_idle` without one."""
+        events = queue.Queue()
+
+        def pump():
+            try:
+                for event in stream:
+                    events.put((event, None))
+            except Exception as e:
+                events.put((None, e))
+            events.put((None, None))
+
+        threading.Thread(target=pump, daemon=True).start()
+        while True:
+            try:
+                event, error = events.get(timeout=self.stream_idle)
+            except queue.Empty:
+                with self._lock:
+                    self.counters['StreamIdle'] += 1
+                    self.breakers[model].failed()
+                # Closing the connection ends the blocked read of the pump thread
+                try:
+                    stream.close()
+                except Exception as e:
+                    logger.warning(f"Could not close the stalled stream of {model}: {str(e)}")
+                raise BedrockDeadlineExceeded(f"converse_stream of {model} sent nothing for {self.stream_idle:.0f}s")
+            if error is not None:
+                raise error
+            if event is None:
+                return
+            yield event
+
+    def _record(self, key, model, seconds, hedge_won):
+        with self._lock:
+            self.histograms.setdefault(key, LatencyHistogram()).add(seconds)
+            self.breakers[model].succeeded()
+            if hedge_won:
+                self.counters['HedgeWins'] += 1
+
+    def log_metrics(self, function_name):
+        """Log the counters since the last call in CloudWatch embedded metric format."""
+        with self._lock:
+            counters, self.counters = self.counters, dict.fromkeys(COUNTERS, 0)
+        if not counters['Calls'] and not counters['CircuitOpen']:
+            return
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': 'ShortsGenerator/BedrockHedging',
+                    'Dimensions': [['Function']],
+                    'Metrics': [{'Name': name, 'Unit': 'Count'} for name in COUNTERS],
+                }],
+            },
+            'Function': function_name,
+            **counters,
+        }))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
@@ -0,0 +1,309 @@
+"""Token-bucket rate limiting of Bedrock calls shared by all Lambdas.
+
+Every model has a request and a token budget per minute. Both buckets of a
+model live in one DynamoDB item and are refilled lazily from the time of the
+last update; taking from them is a conditional put on the item's version, so
+concurrent Lambdas never spend the same capacity twice. Settling a finished
+call (tokens given back, share increased) needs no read: it is one atomic
+ADD, which also bumps the version so a racing put is retried.
+
+The usable share of the budget adapts (AIMD): every ThrottlingException
+halves it, every successful call adds a little back, so throughput follows
+the account quota instead of a guessed constant. `LocalBucketStore` keeps
+the buckets in memory for offline tests and for Lambdas without a table.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# Budgets per minute; BEDROCK_RATE_LIMITS (JSON, same shape) overrides single models
+DEFAULT_LIMITS = {
+    'default': {'requestsPerMinute': 50, 'tokensPerMinute': 400000},
+    'anthropic.claude-3-sonnet-20240229-v1:0': {'requestsPerMinute': 5, 'tokensPerMinute': 200000},
+}
+
+MIN_FACTOR = 0.05       # Lowest share of the budget AIMD goes down to
+INCREASE_STEP = 0.05    # Share added back per successful call
+DECREASE_RATIO = 0.5    # Share kept after a ThrottlingException
+DECREASE_COOLDOWN = 10  # Seconds in which further throttles of the same burst do not decrease again
+CHARS_PER_TOKEN = 4     # Rough input size estimate before the call
+THROTTLE_RETRIES = 6
+
+
+class BucketState:
+    def __init__(self, requests, tokens, updated, factor=1.0, decreased=0.0):
+        self.requests = requests
+        self.tokens = tokens
+        self.updated = updated
+        self.factor = factor
+        self.decreased = decreased
+
+
+class LocalBucketStore:
+    """In-memory stand-in for the DynamoDB table, for one process."""
+
+    def __init__(self):
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def read(self, model):
+        """(state, version) of `model`, or (None, 0) before its first write."""
+        with self._lock:
+            return self.items.get(model, (None, 0))
+
+    def write(self, model, state, version):
+        """Store `state` unless another writer got there first; returns success."""
+        with self._lock:
+            if self.items.get(model, (None, 0))[1] != version:
+                return False
+            self.items[model] = (state, version + 1)
+            return True
+
+    def settle(self, model, tokens, factor_step):
+        """Add `tokens` and `factor_step` to the stored state of `model`, if there is one."""
+        with self._lock:
+            if model not in self.items:
+                return
+            state, version = self.items[model]
+            state = BucketState(state.requests, state.tokens + tokens, state.updated,
+                                state.factor + factor_step, state.decreased)
+            self.items[model] = (state, version + 1)
+
+
+class DynamoBucketStore:
+    """Buckets in a DynamoDB table keyed on `model`, written with optimistic locking."""
+
+    def __init__(self, table):
+        self.table = table
+
+    def read(self, model):
+        item = self.table.get_item(Key={'model': model}, ConsistentRead=True).get('Item')
+        if not item:
+            return None, 0
+        state = BucketState(float(item['requests']), float(item['tokens']), float(item['updated']),
+                            float(item['factor']), float(item.get('decreased', 0)))
+        return state, int(item['version'])
+
+    def write(self, model, state, version):
+        item = {
+            'model': model,
+            'requests': Decimal(str(round(state.requests, 4))),
+            'tokens': Decimal(str(round(state.tokens, 1))),
+            'updated': Decimal(str(round(state.updated, 3))),
+            'factor': Decimal(str(round(state.factor, 4))),
+            'decreased': Decimal(str(round(state.decreased, 3))),
+            'version': version + 1,
+        }
+        try:
+            if version == 0:
+                self.table.put_item(Item=item, ConditionExpression='attribute_not_exists(model)')
+            else:
+                self.table.put_item(Item=item, ConditionExpression='version = :version',
+                                    ExpressionAttributeValues={':version': version})
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+                return False
+            raise
+
+    def settle(self, model, tokens, factor_step):
+        try:
+            self.table.update_item(
+                Key={'model': model},
+                UpdateExpression='ADD tokens :tokens, factor :step, version :one',
+                ConditionExpression='attribute_exists(model)',
+                ExpressionAttributeValues={
+                    ':tokens': Decimal(str(round(tokens, 1))),
+                    ':step': Decimal(str(round(factor_step, 4))),
+                    ':one': 1,
+                },
+            )
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+
+
+class RateLimiter:
+    def __init__(self, store, limits=None, max_wait=120, clock=time.time, sleep=time.sleep):
+        self.store = store
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        # Longest wait for capacity before calling anyway and letting AIMD react
+        self.max_wait = max_wait
+        self.clock = clock
+        self.sleep = sleep
+
+    @classmethod
+    def from_env(cls, dynamodb):
+        """Limiter on BEDROCK_RATE_LIMIT_TABLE_NAME, or local to this container without it."""
+        table_name = os.environ.get('BEDROCK_RATE_LIMIT_TABLE_NAME')
+        store = DynamoBucketStore(dynamodb.Table(table_name)) if table_name else LocalBucketStore()
+        return cls(
+            store,
+            limits=json.loads(os.environ.get('BEDROCK_RATE_LIMITS', '{}')),
+            max_wait=float(os.environ.get('BEDROCK_RATE_LIMIT_MAX_WAIT_SECONDS', '120')),
+        )
+
+    def budget(self, model):
+        limits = self.limits.get(model, self.limits['default'])
+        return float(limits['requestsPerMinute']), float(limits['tokensPerMinute'])
+
+    def _refilled(self, model, state, now):
+        """`state` with the capacity accrued since its last update, capped at one minute of budget."""
+        requests_per_minute, tokens_per_minute = self.budget(model)
+        if state is None:
+            return BucketState(requests_per_minute, tokens_per_minute, now)
+        elapsed = max(now - state.updated, 0) / 60
+        # Settlements add to the share without reading it first
+        factor = min(1.0, state.factor)
+        request_capacity = requests_per_minute * factor
+        token_capacity = tokens_per_minute * factor
+        return BucketState(
+            min(request_capacity, state.requests + elapsed * request_capacity),
+            min(token_capacity, state.tokens + elapsed * token_capacity),
+            now, factor, state.decreased,
+        )
+
+    def acquire(self, model, tokens, block=True):
+        """Wait for one request and `tokens` tokens of `model`; returns the tokens taken.
+
+        With `block` false nothing is waited for: None when the capacity is not there.
+        """
+        waited = 0.0
+        while True:
+            state, version = self.store.read(model)
+            state = self._refilled(model, state, self.clock())
+            requests_per_minute, tokens_per_minute = self.budget(model)
+            # A call larger than the whole bucket only has to wait for a full one
+            needed = min(tokens, tokens_per_minute * state.factor)
+
+            if state.requests >= 1 and state.tokens >= needed:
+                state.requests -= 1
+                state.tokens -= needed
+                if self.store.write(model, state, version):
+                    return needed
+                continue
+
+            wait = max(
+                (1 - state.requests) * 60 / (requests_per_minute * state.factor),
+                (needed - state.tokens) * 60 / (tokens_per_minute * state.factor),
+            )
+            if not block:
+                return None
+            if waited + wait > self.max_wait:
+                logger.warning(f"Rate limit wait for {model} over {self.max_wait}s, calling anyway")
+                return 0
+            # Short naps, so capacity refunded by other Lambdas is seen early
+            nap = min(wait, 5.0) * random.uniform(0.8, 1.2)
+            self.sleep(nap)
+            waited += nap
+
+    def _update(self, model, change, attempts=5):
+        """Apply `change(state)` with optimistic locking; best effort."""
+        for _ in range(attempts):
+            state, version = self.store.read(model)
+            state = self._refilled(model, state, self.clock())
+            change(state)
+            if self.store.write(model, state, version):
+                return state
+        return None
+
+    def succeeded(self, model, taken, used):
+        """Additive increase, and settle the estimated token cost against the actual `used`.
+
+        The next refill caps tokens and share, so this is a single write.
+        """
+        self.store.settle(model, taken - used, INCREASE_STEP)
+
+    def refund(self, model, taken):
+        """Give back the tokens of a call that was never sent."""
+        if taken:
+            self.store.settle(model, taken, 0)
+
+    def throttled(self, model):
+        """Multiplicative decrease and an empty request bucket after a ThrottlingException.
+
+        Concurrent calls of one burst are throttled together; they decrease
+        the share once per DECREASE_COOLDOWN.
+        """
+        def change(state):
+            if state.updated - state.decreased >= DECREASE_COOLDOWN:
+                state.factor = max(MIN_FACTOR, state.factor * DECREASE_RATIO)
+                state.decreased = state.updated
+            state.requests = 0
+            state.tokens = min(state.tokens, self.budget(model)[1] * state.factor)
+        state = self._update(model, change)
+        if state is not None:
+            logger.warning(f"Bedrock throttled {model}, budget share now {state.factor:.2f}")
+
+
+def estimate_tokens(request):
+    """Input and maximum output tokens of a Converse request, as Bedrock reserves them."""
+    chars = 0
+    for message in request.get('messages', []):
+        for block in message.get('content', []):
+            chars += len(block.get('text', ''))
+    for block in request.get('system', []):
+        chars += len(block.get('text', ''))
+    output = request.get('inferenceConfig', {}).get('maxTokens') \
+        or request.get('additionalModelRequestFields', {}).get('max_tokens') or 4096
+    return chars // CHARS_PER_TOKEN + output
+
+
+def used_tokens(usage):
+    return (usage.get('inputTokens', 0) + usage.get('outputTokens', 0)
+            + usage.get('cacheWriteInputTokens', 0))
+
+
+def is_throttling(error):
+    return isinstance(error, ClientError) and error.response['Error']['Code'] == 'ThrottlingException'
+
+
+class RateLimitedClient:
+    """bedrock-runtime client whose converse/converse_stream go through a RateLimiter."""
+
+    def __init__(self, client, limiter, retries=THROTTLE_RETRIES):
+        self.client = client
+        self.limiter = limiter
+        self.retries = retries
+
+    def _call(self, method, request):
+        model = request['modelId']
+        estimate = estimate_tokens(request)
+        for attempt in range(self.retries + 1):
+            taken = self.limiter.acquire(model, estimate)
+            try:
+                return method(**request), taken
+            except ClientError as e:
+                if not is_throttling(e) or attempt == self.retries:
+                    raise
+                # The emptied request bucket makes the next acquire wait
+                self.limiter.throttled(model)
+
+    def converse(self, **request):
+        response, taken = self._call(self.client.converse, request)
+        self.limiter.succeeded(request['modelId'], taken, used_tokens(response.get('usage', {})))
+        return response
+
+    def converse_stream(self, **request):
+        response, taken = self._call(self.client.converse_stream, request)
+        response['stream'] = self._settled(response['stream'], request['modelId'], taken)
+        return response
+
+    def _settled(self, stream, model, taken):
+        usage = {}
+        for event in stream:
+            if 'metadata' in event:
+                usage = event['metadata'].get('usage', {})
+            yield event
+        self.limiter.succeeded(model, taken, used_tokens(usage))
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
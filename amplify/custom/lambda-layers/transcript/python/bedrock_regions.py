@@ -0,0 +1,173 @@
+"""Spread Bedrock calls over a pool of regions.
+
+`RegionPoolClient` holds one bedrock-runtime client per region of
+BEDROCK_REGIONS, created once per container so their connection pools stay
+warm between invocations. Every call picks a region at random, weighted by
+each region's recent latency and throttle rate (exponential moving
+averages), and fails over to the next region on ThrottlingException or
+ServiceUnavailableException. A region where a model is not enabled is
+skipped for that model from then on. Cross-region inference profiles
+("us.", "eu.", "apac." model ids) are only sent to regions of their
+geography.
+
+Calls, throttles, errors, failovers and the mean latency of successful
+calls are logged per region as embedded metrics, to size the quota each
+region needs.
+"""
+import json
+import logging
+import os
+import random
+import threading
+import time
+
+from botocore.exceptions import ClientError
+
+logger = logging.getLogger()
+
+# Regions with a bedrock-runtime client, the Lambda's own by default; untried regions get the average weight
+BEDROCK_REGIONS = [
+    region.strip()
+    for region in (os.environ.get('BEDROCK_REGIONS') or os.environ.get('AWS_REGION', 'us-west-2')).split(',')
+    if region.strip()
+]
+
+FAILOVER_ERRORS = {'ThrottlingException', 'ServiceUnavailableException'}
+# Errors of a model that is not enabled or offered in a region
+UNAVAILABLE_ERRORS = {'AccessDeniedException', 'ResourceNotFoundException'}
+# Geography prefixes of cross-region inference profiles and the regions they start from
+PROFILE_GEOGRAPHIES = {'us.': ('us-',), 'eu.': ('eu-',), 'apac.': ('ap-',)}
+COUNTERS = ('Calls', 'Throttles', 'Errors', 'Failovers')
+
+SMOOTHING = 0.2          # Weight of the newest sample in the moving averages
+MIN_WEIGHT_SHARE = 0.02  # Throttled regions keep a little traffic, so recovery is noticed
+
+
+def serves(region, model_id):
+    """Whether `model_id` can be called from `region`."""
+    for prefix, region_prefixes in PROFILE_GEOGRAPHIES.items():
+        if model_id.startswith(prefix):
+            return region.startswith(region_prefixes)
+    return True
+
+
+class RegionStats:
+    def __init__(self):
+        self.latency = None   # Seconds per successful call
+        self.throttle = 0.0   # Share of recent calls throttled or unavailable
+        self.unavailable = set()
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.latency_total = 0.0
+        self.latency_count = 0
+
+    def record(self, seconds=None, throttled=False):
+        self.throttle += SMOOTHING * (float(throttled) - self.throttle)
+        if seconds is not None:
+            self.latency = seconds if self.latency is None else \
+                self.latency + SMOOTHING * (seconds - self.latency)
+            self.latency_total += seconds
+            self.latency_count += 1
+
+
+class RegionPoolClient:
+    """bedrock-runtime client over `clients` ({region: client}) with weighted routing and failover."""
+
+    def __init__(self, clients):
+        self.clients = clients
+        self.stats = {region: RegionStats() for region in clients}
+        self._lock = threading.Lock()
+
+    def converse(self, **request):
+        return self._invoke('converse', request)
+
+    def converse_stream(self, **request):
+        return self._invoke('converse_stream', request)
+
+    def weight(self, region):
+        stats = self.stats[region]
+        known = [s.latency for s in self.stats.values() if s.latency is not None]
+        # Untried regions count as average, so they get tried
+        latency = stats.latency or (sum(known) / len(known) if known else 1.0)
+        return max((1 - stats.throttle) ** 2, MIN_WEIGHT_SHARE) / max(latency, 0.001)
+
+    def order(self, model_id):
+        """Regions for `model_id`, sampled without replacement by weight."""
+        with self._lock:
+            candidates = [region for region in self.clients
+                          if serves(region, model_id) and model_id not in self.stats[region].unavailable]
+            weights = [self.weight(region) for region in candidates]
+        ordered = []
+        while candidates:
+            region = random.choices(candidates, weights)[0]
+            position = candidates.index(region)
+            ordered.append(candidates.pop(position))
+            weights.pop(position)
+        return ordered
+
+    def _invoke(self, operation, request):
+        model_id = request['modelId']
+        regions = self.order(model_id)
+        if not regions:
+            raise ValueError(f"No region in {list(self.clients)} serves {model_id}")
+
+        error = None
+        for attempt, region in enumerate(regions):
+            stats = self.stats[region]
+            start = time.monotonic()
+            try:
+                response = getattr(self.clients[region], operation)(**request)
+            except ClientError as e:
+                code = e.response['Error']['Code']
+                with self._lock:
+                    stats.counters['Calls'] += 1
+                    if code in FAILOVER_ERRORS:
+                        stats.counters['Throttles' if code == 'ThrottlingException' else 'Errors'] += 1
+                        stats.record(throttled=True)
+                    elif code in UNAVAILABLE_ERRORS:
+                        stats.counters['Errors'] += 1
+                        stats.unavailable.add(model_id)
+                        logger.warning(f"{model_id} is not available in {region}: {str(e)}")
+                    else:
+                        stats.counters['Errors'] += 1
+                if code not in FAILOVER_ERRORS and code not in UNAVAILABLE_ERRORS:
+                    raise
+                error = e
+                if attempt + 1 < len(regions):
+                    with self._lock:
+                        stats.counters['Failovers'] += 1
+                continue
+
+            with self._lock:
+                stats.counters['Calls'] += 1
+                stats.record(time.monotonic() - start)
+            return response
+        raise error
+
+    def log_metrics(self, function_name):
+        """Log the counters of every region since the last call in CloudWatch embedded metric format."""
+        for region, stats in self.stats.items():
+            with self._lock:
+                counters, stats.counters = stats.counters, dict.fromkeys(COUNTERS, 0)
+                latency_total, stats.latency_total = stats.latency_total, 0.0
+                latency_count, stats.latency_count = stats.latency_count, 0
+            if not counters['Calls']:
+                continue
+            print(json.dumps({
+                '_aws': {
+                    'Timestamp': int(time.time() * 1000),
+                    'CloudWatchMetrics': [{
+                        'Namespace': 'ShortsGenerator/BedrockRegions',
+                        'Dimensions': [['Function', 'Region']],
+                        'Metrics': [{'Name': name, 'Unit': 'Count'} for name in COUNTERS] +
+                                   ([{'Name': 'LatencySeconds', 'Unit': 'Seconds'}] if latency_count else []),
+                    }],
+                },
+                'Function': function_name,
+                'Region': region,
+                **counters,
+                # Mean over the successful calls since the last flush
+                **({'LatencySeconds': latency_total / latency_count} if latency_count else {}),
+            }))
+
+    def __getattr__(self, name):
+        return getattr(next(iter(self.clients.values())), name)
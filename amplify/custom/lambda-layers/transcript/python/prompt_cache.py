@@ -0,0 +1,86 @@
+"""Bedrock prompt caching for prompts that share a long prefix.
+
+Prompts are split into a stable prefix (transcript and instructions) and a
+variable suffix (the target topic, say). For models with prompt caching a
+`cachePoint` block is placed between the two, so retries and the other
+requests of a fan-out read the prefix from Bedrock's cache instead of
+encoding the whole transcript again. `TokenUsage` adds up the `usage` of the
+responses, including the cache read and write token counts.
+"""
+import json
+import os
+import threading
+import time
+
+# Model id fragments of models that accept cachePoint blocks
+PROMPT_CACHE_MODELS = [
+    fragment.strip()
+    for fragment in os.environ.get(
+        'PROMPT_CACHE_MODELS',
+        'claude-3-7-sonnet,claude-3-5-haiku,claude-sonnet-4,claude-opus-4,nova-micro,nova-lite,nova-pro'
+    ).split(',')
+    if fragment.strip()
+]
+
+CACHE_POINT = {'cachePoint': {'type': 'default'}}
+USAGE_FIELDS = ('inputTokens', 'outputTokens', 'cacheReadInputTokens', 'cacheWriteInputTokens')
+
+
+def supports_prompt_cache(model_id):
+    return any(fragment in model_id for fragment in PROMPT_CACHE_MODELS)
+
+
+def prompt_content(prefix, suffix, model_id):
+    """Message content of `prefix` + `suffix`, with a cache point after the prefix when supported."""
+    if not supports_prompt_cache(model_id):
+        return [{'text': prefix + suffix}]
+    return [{'text': prefix}, CACHE_POINT, {'text': suffix}]
+
+
+class TokenUsage:
+    """Token counts of the Bedrock calls of one invocation; thread-safe."""
+
+    def __init__(self):
+        self.calls = 0
+        self.totals = dict.fromkeys(USAGE_FIELDS, 0)
+        self._lock = threading.Lock()
+
+    def add(self, response):
+        """Count the usage of `response`; answers from the response cache cost nothing."""
+        if response.get('fromCache'):
+            return
+        usage = response.get('usage') or {}
+        with self._lock:
+            self.calls += 1
+            for field in USAGE_FIELDS:
+                self.totals[field] += usage.get(field, 0) or 0
+        print(f"Usage: {usage}")
+
+    def cache_hit_rate(self):
+        """Share of prompt-cache tokens read from the cache rather than written to it."""
+        read = self.totals['cacheReadInputTokens']
+        written = self.totals['cacheWriteInputTokens']
+        return read / (read + written) if read + written else None
+
+    def log_metrics(self, function_name):
+        """Log the totals in CloudWatch embedded metric format."""
+        if not self.calls:
+            return
+        names = {field: field[0].upper() + field[1:] for field in USAGE_FIELDS}
+        print(json.dumps({
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                'CloudWatchMetrics': [{
+                    'Namespace': 'ShortsGenerator/Bedrock',
+                    'Dimensions': [['Function']],
+                    'Metrics': [{'Name': 'Calls', 'Unit': 'Count'}] +
+                               [{'Name': name, 'Unit': 'Count'} for name in names.values()],
+                }],
+            },
+            'Function': function_name,
+            'Calls': self.calls,
+            **{name: self.totals[field] for field, name in names.items()},
+        }))
+        hit_rate = self.cache_hit_rate()
+        if hit_rate is not None:
+            print(f"Prompt cache hit rate: {hit_rate:.0%}")
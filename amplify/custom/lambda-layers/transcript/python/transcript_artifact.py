@@ -0,0 +1,257 @@
+"""Preprocessed transcript artifact stored next to the Transcribe output.
+
+`videos/{uuid}/Transcript.bin` holds a serialized `Transcript` (token arrays,
+flat script text, VTT cues and sentence boundaries) so the Lambdas skip
+downloading and parsing `Transcript.json`/`Transcript.vtt`. Loads go through
+an ETag-validated cache in /tmp; a missing artifact is built on the fly.
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import sys
+import zlib
+from array import array
+
+from botocore.exceptions import ClientError
+
+from transcript_model import Transcript
+from transcript_stream import read_transcribe
+
+logger = logging.getLogger()
+
+MAGIC = b'SFTR'
+FORMAT_VERSION = 1
+CACHE_DIR = os.environ.get('TRANSCRIPT_CACHE_DIR', '/tmp/transcripts')
+CACHE_ENTRIES = 8
+
+ARRAY_FIELDS = (
+    'token_ids', 'start_times', 'end_times', 'pronunciation_ids',
+    'pronunciation_items', 'punctuation_items', 'sentence_ends',
+    'cue_starts', 'cue_ends',
+)
+
+# Parsed transcripts of this container, keyed by artifact key: (etag, transcript)
+_loaded = {}
+
+
+def artifact_key(uuid):
+    return f'videos/{uuid}/Transcript.bin'
+
+
+def dumps(transcript):
+    arrays = [getattr(transcript, name) for name in ARRAY_FIELDS]
+    header = json.dumps({
+        'version': FORMAT_VERSION,
+        'byteorder': sys.byteorder,
+        'text': transcript.text,
+        'vocab': transcript.vocab,
+        'kinds': len(transcript.kinds),
+        'cue_texts': transcript.cue_texts,
+        'arrays': [[name, values.typecode, len(values)] for name, values in zip(ARRAY_FIELDS, arrays)],
+    }, ensure_ascii=False).encode('utf-8')
+
+    body = [struct.pack('<I', len(header)), header, bytes(transcript.kinds)]
+    body.extend(values.tobytes() for values in arrays)
+    return MAGIC + zlib.compress(b''.join(body))
+
+
+def loads(data):
+    if data[:len(MAGIC)] != MAGIC:
+        raise ValueError('Not a transcript artifact')
+    body = zlib.decompress(data[len(MAGIC):])
+    (header_length,) = struct.unpack_from('<I', body)
+    offset = 4 + header_length
+    header = json.loads(body[4:offset].decode('utf-8'))
+    if header['version'] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported transcript artifact version {header['version']}")
+
+    transcript = Transcript(header['text'])
+    transcript.vocab = header['vocab']
+    transcript._lookup = {content: token_id for token_id, content in enumerate(transcript.vocab)}
+    transcript.cue_texts = header['cue_texts']
+    transcript.kinds = bytearray(body[offset:offset + header['kinds']])
+    offset += header['kinds']
+
+    for name, typecode, length in header['arrays']:
+        values = array(typecode)
+        size = values.itemsize * length
+        values.frombytes(body[offset:offset + size])
+        if header['byteorder'] != sys.byteorder:
+            values.byteswap()
+        setattr(transcript, name, values)
+        offset += size
+
+    return transcript
+
+
+def build_transcript(s3, bucket, uuid):
+    """Parse the Transcribe output of a video; cues come from VTT when present.
+
+    `Transcript.json` is streamed, keeping only its items and transcript text.
+    """
+    vtt_content = _get_text(s3, bucket, f'videos/{uuid}/Transcript.vtt')
+    json_body = _get_body(s3, bucket, f'videos/{uuid}/Transcript.json')
+
+    if json_body is not None:
+        try:
+            transcript = read_transcribe(json_body)
+        finally:
+            json_body.close()
+        if vtt_content is not None:
+            transcript.load_cues(vtt_content)
+    elif vtt_content is not None:
+        transcript = Transcript.from_vtt(vtt_content)
+    else:
+        raise ValueError(f"No transcript found for UUID {uuid}")
+
+    return transcript
+
+
+def publish_transcript(s3, bucket, uuid, current_etag=None):
+    """Build the artifact for a video, upload it and return (etag, transcript).
+
+    Nothing is uploaded when the build matches `current_etag`, the ETag of
+    the artifact already in the bucket.
+    """
+    transcript = build_transcript(s3, bucket, uuid)
+    data = dumps(transcript)
+    # Single-part uploads get the MD5 of their body as ETag
+    etag = f'"{hashlib.md5(data).hexdigest()}"'
+    if etag == current_etag:
+        logger.info(f"Transcript artifact for UUID {uuid} is up to date")
+    else:
+        etag = s3.put_object(Bucket=bucket, Key=artifact_key(uuid), Body=data)['ETag']
+        logger.info(f"Published transcript artifact for UUID {uuid}: {len(transcript)} items, {len(data)} bytes")
+    _store(artifact_key(uuid), etag, data, transcript)
+    return etag, transcript
+
+
+def load_transcript(s3, bucket, uuid, with_cues=False):
+    """Return the `Transcript` of a video, reusing this container's cached copy
+    while the artifact's ETag is unchanged."""
+    key = artifact_key(uuid)
+    etag, transcript = _cached(key)
+
+    try:
+        request = {'Bucket': bucket, 'Key': key}
+        if etag:
+            request['IfNoneMatch'] = etag
+        response = s3.get_object(**request)
+    except ClientError as e:
+        status = e.response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if status == 304:
+            logger.debug(f"Transcript artifact cache hit for {key}")
+            transcript = transcript or _read_cache_file(key)
+            if transcript is None:
+                transcript = _fetch(s3, bucket, key)
+        elif e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            logger.info(f"Transcript artifact missing for UUID {uuid}, building it")
+            _, transcript = publish_transcript(s3, bucket, uuid)
+        else:
+            raise
+    else:
+        transcript = _load_response(key, response)
+
+    # Without Transcript.vtt a rebuild would have no cues either
+    if with_cues and not transcript.cue_texts and _exists(s3, bucket, f'videos/{uuid}/Transcript.vtt'):
+        logger.info(f"Transcript artifact for UUID {uuid} has no cues, rebuilding it")
+        _, transcript = publish_transcript(s3, bucket, uuid, loaded_etag(uuid))
+
+    return transcript
+
+
+def loaded_etag(uuid):
+    """ETag of the artifact last loaded or published for `uuid` in this container."""
+    etag, _ = _loaded.get(artifact_key(uuid), (None, None))
+    return etag
+
+
+def _fetch(s3, bucket, key):
+    return _load_response(key, s3.get_object(Bucket=bucket, Key=key))
+
+
+def _load_response(key, response):
+    data = response['Body'].read()
+    transcript = loads(data)
+    _store(key, response['ETag'], data, transcript)
+    return transcript
+
+
+def _get_body(s3, bucket, key):
+    try:
+        response = s3.get_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return None
+        raise
+    return response['Body']
+
+
+def _exists(s3, bucket, key):
+    try:
+        s3.head_object(Bucket=bucket, Key=key)
+    except ClientError as e:
+        if e.response['Error']['Code'] in ('NoSuchKey', '404'):
+            return False
+        raise
+    return True
+
+
+def _get_text(s3, bucket, key):
+    body = _get_body(s3, bucket, key)
+    if body is None:
+        return None
+    return body.read().decode('utf-8')
+
+
+def _cache_path(key):
+    return os.path.join(CACHE_DIR, key.replace('/', '_'))
+
+
+def _cached(key):
+    if key in _loaded:
+        return _loaded[key]
+    try:
+        with open(_cache_path(key) + '.etag') as f:
+            return f.read(), None
+    except OSError:
+        return None, None
+
+
+def _read_cache_file(key):
+    try:
+        with open(_cache_path(key), 'rb') as f:
+            transcript = loads(f.read())
+        with open(_cache_path(key) + '.etag') as f:
+            _loaded[key] = (f.read(), transcript)
+    except (OSError, ValueError, zlib.error) as e:
+        logger.warning(f"Discarding cached transcript artifact {key}: {str(e)}")
+        return None
+    return transcript
+
+
+def _store(key, etag, data, transcript):
+    _loaded.clear()
+    _loaded[key] = (etag, transcript)
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        path = _cache_path(key)
+        with open(path, 'wb') as f:
+            f.write(data)
+        with open(path + '.etag', 'w') as f:
+            f.write(etag)
+        _evict()
+    except OSError as e:
+        logger.warning(f"Could not cache transcript artifact {key} in {CACHE_DIR}: {str(e)}")
+
+
+def _evict():
+    """Keep only the most recently written artifacts in /tmp."""
+    paths = [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR) if not name.endswith('.etag')]
+    paths.sort(key=os.path.getmtime, reverse=True)
+    for path in paths[CACHE_ENTRIES:]:
+        for stale in (path, path + '.etag'):
+            if os.path.exists(stale):
+                os.remove(stale)
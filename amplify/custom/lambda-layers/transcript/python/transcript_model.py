@@ -0,0 +1,159 @@
+"""Compact struct-of-arrays model of a video transcript.
+
+Built once per invocation from either the Transcribe `Transcript.json` output or
+its `Transcript.vtt` subtitles, and shared by the Python Lambdas instead of
+walking the raw `results.items` dicts.
+"""
+from array import array
+
+PRONUNCIATION = 0
+PUNCTUATION = 1
+
+PUNCTUATION_MARKS = '.,?!'
+SENTENCE_END_MARKS = '.?!'
+
+NAN = float('nan')
+
+
+class Transcript:
+    """Transcript items stored as parallel arrays.
+
+    Item i has content `vocab[token_ids[i]]`, kind `kinds[i]` and times
+    `start_times[i]`/`end_times[i]` (NaN for punctuation). Pronunciation items
+    are also projected into `pronunciation_ids`, with `pronunciation_items`
+    mapping each one back to its item index, and `sentence_ends` lists the
+    items that close a sentence. Cues loaded from VTT are kept in
+    `cue_starts`, `cue_ends` and `cue_texts`.
+    """
+
+    __slots__ = (
+        'vocab', 'token_ids', 'kinds', 'start_times', 'end_times',
+        'pronunciation_ids', 'pronunciation_items', 'punctuation_items',
+        'sentence_ends', 'text', 'cue_starts', 'cue_ends', 'cue_texts', '_lookup',
+    )
+
+    def __init__(self, text=''):
+        self.vocab = []
+        self._lookup = {}
+        self.token_ids = array('I')
+        self.kinds = bytearray()
+        self.start_times = array('d')
+        self.end_times = array('d')
+        self.pronunciation_ids = array('I')
+        self.pronunciation_items = array('I')
+        self.punctuation_items = array('I')
+        self.sentence_ends = array('I')
+        self.text = text
+        self.cue_starts = array('d')
+        self.cue_ends = array('d')
+        self.cue_texts = []
+
+    def __len__(self):
+        return len(self.token_ids)
+
+    def intern(self, content):
+        token_id = self._lookup.get(content)
+        if token_id is None:
+            token_id = len(self.vocab)
+            self._lookup[content] = token_id
+            self.vocab.append(content)
+        return token_id
+
+    def append(self, content, kind, start_time=NAN, end_time=NAN):
+        token_id = self.intern(content)
+        index = len(self.token_ids)
+        self.token_ids.append(token_id)
+        self.kinds.append(kind)
+        self.start_times.append(start_time)
+        self.end_times.append(end_time)
+        if kind == PRONUNCIATION:
+            self.pronunciation_ids.append(token_id)
+            self.pronunciation_items.append(index)
+        else:
+            self.punctuation_items.append(index)
+            if content in SENTENCE_END_MARKS:
+                self.sentence_ends.append(index)
+
+    def content(self, index):
+        return self.vocab[self.token_ids[index]]
+
+    def is_pronunciation(self, index):
+        return self.kinds[index] == PRONUNCIATION
+
+    def pronunciation_words(self):
+        vocab = self.vocab
+        return [vocab[token_id] for token_id in self.pronunciation_ids]
+
+    def segments(self):
+        """Cues in the `{'start', 'end', 'text': [lines]}` shape used for prompts."""
+        return [
+            {'start': start, 'end': end, 'text': text.split('\n') if text else []}
+            for start, end, text in zip(self.cue_starts, self.cue_ends, self.cue_texts)
+        ]
+
+    def append_transcribe_item(self, item):
+        """Append one entry of Transcribe's `results.items`."""
+        content = item['alternatives'][0]['content']
+        if item['type'] == 'pronunciation':
+            self.append(content, PRONUNCIATION, float(item['start_time']), float(item['end_time']))
+        else:
+            self.append(content, PUNCTUATION)
+
+    @classmethod
+    def from_transcribe(cls, json_content):
+        results = json_content['results']
+        transcript = cls(results['transcripts'][0]['transcript'])
+        for item in results['items']:
+            transcript.append_transcribe_item(item)
+        return transcript
+
+    @classmethod
+    def from_vtt(cls, vtt_content):
+        """Parse WebVTT subtitles; words inherit the times of their cue."""
+        transcript = cls()
+        transcript.text = transcript.load_cues(vtt_content)
+        for start, end, text in zip(transcript.cue_starts, transcript.cue_ends, transcript.cue_texts):
+            for word in text.split():
+                stripped = word.rstrip(PUNCTUATION_MARKS)
+                if stripped:
+                    transcript.append(stripped, PRONUNCIATION, start, end)
+                for mark in word[len(stripped):]:
+                    transcript.append(mark, PUNCTUATION)
+        return transcript
+
+    def load_cues(self, vtt_content):
+        """Replace the cues with those of `vtt_content` and return their joined text."""
+        self.cue_starts = array('d')
+        self.cue_ends = array('d')
+        self.cue_texts = []
+        lines = []
+        cue_lines = None
+
+        for line in vtt_content.split('\n'):
+            line = line.strip()
+            if not line or line == 'WEBVTT':
+                continue
+
+            # 타임스탬프 라인 체크 (00:00:00.000 --> 00:00:00.000)
+            if ' --> ' in line:
+                if cue_lines is not None:
+                    self.cue_texts.append('\n'.join(cue_lines))
+                start, end = line.split(' --> ')
+                self.cue_starts.append(convert_timestamp_to_seconds(start))
+                self.cue_ends.append(convert_timestamp_to_seconds(end))
+                cue_lines = []
+            elif cue_lines is not None:
+                cue_lines.append(line)
+                lines.append(line)
+
+        if cue_lines is not None:
+            self.cue_texts.append('\n'.join(cue_lines))
+
+        return ' '.join(lines)
+
+
+def convert_timestamp_to_seconds(timestamp):
+    """VTT 타임스탬프를 초 단위로 변환합니다."""
+    # 00:00:00.000 형식의 타임스탬프를 파싱
+    h, m, s = timestamp.split(':')
+    return float(h) * 3600 + float(m) * 60 + float(s)
@@ -0,0 +1,112 @@
+"""BM25 retrieval of the transcript region a topic comes from.
+
+Sentences are the documents. For a topic, the contiguous run of sentences
+with the highest total BM25 score within a character budget is returned,
+widened by a few sentences on both sides. Confidence is the share of the
+topic's total score that falls inside that run; a topic whose terms are
+spread over the whole video gets a low confidence and callers should fall
+back to the full script.
+"""
+import math
+import re
+from collections import Counter, defaultdict
+
+from transcript_windows import split_sentences
+
+WORD = re.compile(r'\w+')
+
+
+def singular(word):
+    """Crude English plural folding, so "volcanoes" in a topic matches "volcano"."""
+    if len(word) <= 3 or not word.endswith('s') or word.endswith('ss'):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'xes', 'ches', 'shes', 'sses')):
+        return word[:-2]
+    return word[:-1]
+
+
+def tokenize(text):
+    """Lowercased words; words in non-Latin scripts also add their character bigrams.
+
+    Bigrams let Korean or Japanese topics match words that carry different
+    particles or endings in the transcript.
+    """
+    tokens = []
+    for word in WORD.findall(text.lower()):
+        if word.isascii():
+            tokens.append(singular(word))
+        else:
+            tokens.append(word)
+            if len(word) > 2:
+                tokens.extend(word[i:i + 2] for i in range(len(word) - 1))
+    return tokens
+
+
+class SentenceIndex:
+    def __init__(self, sentences, k1=1.5, b=0.75):
+        self.sentences = sentences
+        self.k1 = k1
+        self.b = b
+        self.lengths = []
+        self.postings = defaultdict(list)  # term -> [(sentence, term frequency)]
+        for position, sentence in enumerate(sentences):
+            counts = Counter(tokenize(sentence))
+            self.lengths.append(sum(counts.values()))
+            for term, frequency in counts.items():
+                self.postings[term].append((position, frequency))
+        self.average_length = sum(self.lengths) / len(self.lengths) if self.lengths else 0
+
+    @classmethod
+    def from_text(cls, text):
+        return cls(split_sentences(text))
+
+    def scores(self, query):
+        """BM25 score of every sentence for `query`."""
+        count = len(self.sentences)
+        scores = [0.0] * count
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            # Terms in half of the sentences or more ("and", "the") carry no weight
+            idf = math.log((count - len(postings) + 0.5) / (len(postings) + 0.5))
+            if idf <= 0:
+                continue
+            for position, frequency in postings:
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[position] / self.average_length)
+                scores[position] += idf * frequency * (self.k1 + 1) / (frequency + norm)
+        return scores
+
+    def best_region(self, query, max_chars, margin=0):
+        """((first, end), confidence) of the best run of at most `max_chars`, `end` exclusive.
+
+        The run is widened by `margin` sentences on both sides. Returns
+        (None, 0.0) when no sentence shares a term with `query`.
+        """
+        scores = self.scores(query)
+        total = sum(scores)
+        if total == 0:
+            return None, 0.0
+
+        best, best_range = -1.0, (0, 0)
+        window_score = 0.0
+        window_chars = 0
+        first = 0
+        for end, sentence in enumerate(self.sentences):
+            window_score += scores[end]
+            window_chars += len(sentence) + 1
+            while window_chars > max_chars and first < end:
+                window_score -= scores[first]
+                window_chars -= len(self.sentences[first]) + 1
+                first += 1
+            if window_score > best:
+                best, best_range = window_score, (first, end + 1)
+
+        first, end = best_range
+        first, end = max(first - margin, 0), min(end + margin, len(self.sentences))
+        return (first, end), best / total
+
+    def text(self, first, end):
+        return " ".join(self.sentences[first:end])
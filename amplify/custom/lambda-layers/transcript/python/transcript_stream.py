@@ -0,0 +1,157 @@
+"""Incremental reader for Amazon Transcribe `Transcript.json` output.
+
+With speaker labels enabled most of the document is `speaker_labels` and
+`audio_segments`, which the Lambdas never use. `read_transcribe` streams the
+S3 body in chunks and keeps only `results.items` and the transcript string,
+decoding one item at a time, so peak memory follows the `Transcript` arrays
+rather than the size of the JSON document.
+"""
+import codecs
+import json
+import re
+
+from transcript_model import Transcript
+
+CHUNK_SIZE = 1 << 16
+WHITESPACE = ' \t\n\r'
+NUMBER_START = '-0123456789'
+NUMBER_END = re.compile(r'[,\]}\s]')
+
+
+class JsonStreamReader:
+    """Pull parser over a binary stream of JSON text.
+
+    `members()` and `elements()` walk objects and arrays; every member or
+    element they yield must be consumed with `value()` or `skip()` before the
+    iteration continues.
+    """
+
+    def __init__(self, stream, chunk_size=CHUNK_SIZE):
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.decoder = codecs.getincrementaldecoder('utf-8')()
+        self.json = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def _fill(self, size=None):
+        """Append the next chunk to the unread part of the buffer; False at the end."""
+        if self.eof:
+            return False
+        data = self.stream.read(size or self.chunk_size)
+        text = self.decoder.decode(data or b'', final=not data)
+        self.eof = not data
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return bool(data)
+
+    def peek(self):
+        """Next non-whitespace character without consuming it, '' at the end."""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise ValueError(f"Expected {char!r} in JSON stream, found {found!r}")
+        self.pos += 1
+
+    def value(self):
+        """Decode the whole value at the cursor."""
+        if self.peek() in NUMBER_START:
+            # A number only ends at a delimiter, which may be in a later chunk
+            while not NUMBER_END.search(self.buffer, self.pos) and self._fill():
+                pass
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.json.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if not self._fill(size):
+                    raise
+                # Grow the reads so a long value is not re-decoded once per chunk
+                size *= 2
+                continue
+            self.pos = end
+            return value
+
+    def members(self):
+        """Yield the keys of the object at the cursor."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            if self._close('}'):
+                return
+
+    def elements(self):
+        """Yield the positions of the elements of the array at the cursor."""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        position = 0
+        while True:
+            yield position
+            position += 1
+            if self._close(']'):
+                return
+
+    def skip(self):
+        """Consume the value at the cursor.
+
+        Objects are walked member by member; array elements are decoded whole
+        one at a time, which is much faster for the small objects Transcribe
+        puts in its arrays.
+        """
+        char = self.peek()
+        if char == '{':
+            for _ in self.members():
+                self.skip()
+        elif char == '[':
+            for _ in self.elements():
+                self.value()
+        else:
+            self.value()
+
+    def _close(self, closing):
+        char = self.peek()
+        self.pos += 1
+        if char == closing:
+            return True
+        if char != ',':
+            raise ValueError(f"Expected ',' or {closing!r} in JSON stream, found {char!r}")
+        return False
+
+
+def read_transcribe(stream, chunk_size=CHUNK_SIZE):
+    """Build a `Transcript` from a Transcribe JSON stream (e.g. an S3 `Body`)."""
+    reader = JsonStreamReader(stream, chunk_size)
+    transcript = Transcript()
+    for key in reader.members():
+        if key != 'results':
+            reader.skip()
+            continue
+        for field in reader.members():
+            if field == 'transcripts':
+                for position in reader.elements():
+                    if position == 0:
+                        transcript.text = reader.value()['transcript']
+                    else:
+                        reader.skip()
+            elif field == 'items':
+                for _ in reader.elements():
+                    transcript.append_transcribe_item(reader.value())
+            else:
+                reader.skip()
+    return transcript
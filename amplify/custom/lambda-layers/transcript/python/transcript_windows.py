@@ -0,0 +1,48 @@
+"""Overlapping windows over transcript units for chunked model calls.
+
+Units are cues or sentences; windows never split one, hold at most
+`max_chars` characters (a single longer unit gets a window of its own) and
+repeat about `overlap_chars` characters of the previous window so content on
+a boundary is seen whole at least once.
+"""
+import re
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.?!])\s+')
+
+
+def window_ranges(lengths, max_chars, overlap_chars=0):
+    """(first, end) unit ranges, `end` exclusive, covering all units in order."""
+    ranges = []
+    first = 0
+    count = len(lengths)
+    while first < count:
+        end = first
+        size = 0
+        while end < count and (end == first or size + lengths[end] <= max_chars):
+            size += lengths[end]
+            end += 1
+        ranges.append((first, end))
+        if end == count:
+            break
+
+        # Step back over at most `overlap_chars`, always moving forward
+        next_first = end
+        overlap = 0
+        while next_first - 1 > first and overlap + lengths[next_first - 1] <= overlap_chars:
+            next_first -= 1
+            overlap += lengths[next_first]
+        first = next_first
+    return ranges
+
+
+def split_sentences(text):
+    return [sentence for sentence in SENTENCE_BOUNDARY.split(text) if sentence]
+
+
+def text_windows(text, max_chars, overlap_chars=0):
+    """Overlapping chunks of `text` cut at sentence boundaries."""
+    sentences = split_sentences(text)
+    return [
+        " ".join(sentences[first:end])
+        for first, end in window_ranges([len(s) + 1 for s in sentences], max_chars, overlap_chars)
+    ]
@@ -2,9 +2,13 @@ export { ExtractTopics } from './ExtractTopics/resource';
 export { DetectShotChanges } from './DetectShotChanges/resource';
 export { ProcessTopics } from './ProcessTopics/resource';
 export { ExtractTimeframe } from './ExtractTimeframe/resource';
+export { PrepareTranscript } from './PrepareTranscript/resource';
 export { MakeShortTemplate } from './MakeShortTemplate/resource';
 export { CreateBackground } from './CreateBackground/resource';
 export { VideoUploadStateMachine } from './step-functions/VideoUploadStateMachine';
 export { GenerateShortStateMachine } from './step-functions/GenerateShortStateMachine';
 export { UnifiedReasoningStateMachine } from './step-functions/UnifiedReasoningStateMachine';
 export { UnifiedReasoning } from './UnifiedReasoning/resource';
+export { BedrockCache } from './BedrockCache/resource';
+export { BedrockRateLimit } from './BedrockRateLimit/resource';
+export { TranscriptLayer } from './TranscriptLayer/resource';
@@ -4,14 +4,18 @@ import * as tasks from 'aws-cdk-lib/aws-stepfunctions-tasks'
 import { Construct } from 'constructs';
 import { Duration } from 'aws-cdk-lib/core';
 import { ITable } from 'aws-cdk-lib/aws-dynamodb';
+import { ILayerVersion } from 'aws-cdk-lib/aws-lambda';
 import { Role, ServicePrincipal, PolicyDocument, PolicyStatement } from 'aws-cdk-lib/aws-iam'
 
-import { UnifiedReasoning } from '../resource';
+import { UnifiedReasoning, PrepareTranscript } from '../resource';
 
 type UnifiedReasoningStateMachineProps = {
   bucket: IBucket,
+  transcriptLayer: ILayerVersion,
   historyTable: ITable,
-  highlightTable: ITable
+  highlightTable: ITable,
+  cacheTable: ITable,
+  rateLimitTable: ITable
 };
 
 export class UnifiedReasoningStateMachine extends Construct {
@@ -34,8 +38,16 @@ export class UnifiedReasoningStateMachine extends Construct {
     // Lambda functions
     const unifiedReasoning = new UnifiedReasoning(this, "UnifiedReasoningFunc", {
       bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer,
       highlightTable: props.highlightTable,
-      historyTable: props.historyTable
+      historyTable: props.historyTable,
+      cacheTable: props.cacheTable,
+      rateLimitTable: props.rateLimitTable
+    });
+
+    const prepareTranscript = new PrepareTranscript(this, "PrepareTranscriptFunc", {
+      bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer
     });
 
     // Helper functions
@@ -125,6 +137,15 @@ export class UnifiedReasoningStateMachine extends Construct {
 
     const checkTranscriptionJobStatus = new sfn.Choice(this, 'CheckTranscriptionJobStatus');
 
+    const prepareTranscriptTask = new tasks.LambdaInvoke(this, 'PrepareTranscript', {
+      lambdaFunction: prepareTranscript.handler,
+      payload: sfn.TaskInput.fromObject({
+        "uuid.$": "$.uuid",
+        "bucket_name.$": "$.bucket_name"
+      }),
+      resultPath: sfn.JsonPath.DISCARD
+    });
+
     const unifiedReasoningTask = new tasks.LambdaInvoke(this, 'UnifiedReasoning', {
       lambdaFunction: unifiedReasoning.handler,
       payload: sfn.TaskInput.fromJsonPathAt("$"),
@@ -286,6 +307,7 @@ export class UnifiedReasoningStateMachine extends Construct {
       )
       .next(sharedUpdateDDB1)
       .next(updateEvent(1))
+      .next(prepareTranscriptTask)
       .next(unifiedReasoningTask)
       .next(updateDDB(2))
       .next(updateEvent(2))
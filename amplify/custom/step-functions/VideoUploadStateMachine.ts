@@ -4,14 +4,18 @@ import * as tasks from 'aws-cdk-lib/aws-stepfunctions-tasks'
 import { Construct } from 'constructs';
 import { Duration } from 'aws-cdk-lib/core';
 import { ITable } from 'aws-cdk-lib/aws-dynamodb';
+import { ILayerVersion } from 'aws-cdk-lib/aws-lambda';
 import { Role, ServicePrincipal, PolicyDocument, PolicyStatement } from 'aws-cdk-lib/aws-iam'
 
-import { ExtractTopics, ProcessTopics, ExtractTimeframe, DetectShotChanges } from '../resource';
+import { ExtractTopics, ProcessTopics, ExtractTimeframe, DetectShotChanges, PrepareTranscript } from '../resource';
 
 type VideoUploadStateMachineProps = {
   bucket: IBucket,
+  transcriptLayer: ILayerVersion,
   historyTable: ITable,
-  highlightTable: ITable
+  highlightTable: ITable,
+  cacheTable: ITable,
+  rateLimitTable: ITable
 };
 
 export class VideoUploadStateMachine extends Construct {
@@ -34,21 +38,33 @@ export class VideoUploadStateMachine extends Construct {
     // Lambda functions
     const extractTopics = new ExtractTopics(this, "ExtractTopicsFunc", {
       bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer,
       highlightTable: props.highlightTable,
-      historyTable: props.historyTable
+      historyTable: props.historyTable,
+      cacheTable: props.cacheTable,
+      rateLimitTable: props.rateLimitTable
     });
 
     const processTopic = new ProcessTopics(this, "ProcessTopicFunc", {
       bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer,
       highlightTable: props.highlightTable,
-      historyTable: props.historyTable
+      historyTable: props.historyTable,
+      cacheTable: props.cacheTable,
+      rateLimitTable: props.rateLimitTable
     });
 
     const extractTimeframe = new ExtractTimeframe(this, "ExtractTimeframeFunc", {
       bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer,
       highlightTable: props.highlightTable
     });
     
+    const prepareTranscript = new PrepareTranscript(this, "PrepareTranscriptFunc", {
+      bucket: props.bucket,
+      transcriptLayer: props.transcriptLayer
+    });
+
     const detectShotChanges = new DetectShotChanges(this, "DetectShotChangesFunc", {
       bucket: props.bucket,
       historyTable: props.historyTable
@@ -162,20 +178,29 @@ export class VideoUploadStateMachine extends Construct {
 
     const checkTranscriptionJobStatus = new sfn.Choice(this, 'CheckTranscriptionJobStatus');
 
+    const prepareTranscriptTask = new tasks.LambdaInvoke(this, 'PrepareTranscript', {
+      lambdaFunction: prepareTranscript.handler,
+      payload: sfn.TaskInput.fromObject({
+        "uuid.$": "$.uuid",
+        "bucket_name.$": "$.bucket_name"
+      }),
+      resultPath: sfn.JsonPath.DISCARD
+    });
+
     const extractTopicsTask = new tasks.LambdaInvoke(this, 'ExtractTopics', {
       lambdaFunction: extractTopics.handler,
       payload: sfn.TaskInput.fromJsonPathAt("$"),
       resultPath: "$.TopicsResult"
     });
 
+    // One item per group of topics; each group is extracted in a single Bedrock request
     const processTopicsMap = new sfn.Map(this, 'ProcessTopicsMap', {
-      itemsPath: "$.TopicsResult.Payload.topics",
+      itemsPath: "$.TopicsResult.Payload.topicGroups",
       maxConcurrency: 5,
       itemSelector:{
-        "topic.$": "$$.Map.Item.Value",
+        "group.$": "$$.Map.Item.Value",
         "topics.$": "$.TopicsResult.Payload.topics",
         "uuid.$": "$.uuid",
-        "index.$": "$$.Map.Item.Index",
         "script.$": "$.TopicsResult.Payload.script",
         "modelID.$": "$.TopicsResult.Payload.modelID",
         "owner.$": "$.TopicsResult.Payload.owner",
@@ -190,32 +215,29 @@ export class VideoUploadStateMachine extends Construct {
       resultPath: sfn.JsonPath.DISCARD
     });
 
+    const extractTimeframesTask = new tasks.LambdaInvoke(this, 'ExtractTimeframes', {
+      lambdaFunction: extractTimeframe.batchHandler,
+      payload: sfn.TaskInput.fromObject({
+        "uuid.$": "$.uuid",
+        "bucket_name.$": "$.bucket_name"
+      }),
+      resultSelector: {
+        "results.$": "$.Payload.results"
+      },
+      resultPath: "$.TimeframesResult",
+    }).addRetry({ maxAttempts: 3, interval: Duration.seconds(5) });
+
     const highlightExtractMap = new sfn.Map(this, 'HighlightExtractMap', {
-      itemsPath: "$.TopicsResult.Payload.topics",
+      itemsPath: "$.TimeframesResult.results",
       itemSelector: {
-        "topic.$": "$$.Map.Item.Value",
+        "timeframe_extracted.$": "$$.Map.Item.Value",
         "uuid.$": "$.uuid",
-        "index.$": "$$.Map.Item.Index",
+        "index.$": "$$.Map.Item.Value.index",
         "bucket_name.$": "$.bucket_name",
       },
       resultPath: sfn.JsonPath.DISCARD
     });
 
-    const extractTimeframeTask = new tasks.LambdaInvoke(this, 'ExtractTimeframe', {
-      lambdaFunction: extractTimeframe.handler,
-      payload: sfn.TaskInput.fromJsonPathAt("$"),
-      resultSelector: {
-        "statusCode.$": "$.Payload.statusCode",
-        "duration.$": "$.Payload.duration",
-        "index.$": "$.Payload.index",
-        "uuid.$": "$.Payload.uuid",
-        "raw_file_path.$": "$.Payload.raw_file_path",
-        "timeframes.$": "$.Payload.timeframes",
-        "output_destination.$": "$.Payload.output_destination"
-      },
-      resultPath: "$.timeframe_extracted",
-    });
-
     const checkExtractionJobStatus = new sfn.Choice(this, 'CheckExtractionJobStatus');
 
     const mediaConvertExtractJob = new tasks.MediaConvertCreateJob(this, 'MediaConvertExtractJob', {
@@ -364,36 +386,36 @@ export class VideoUploadStateMachine extends Construct {
       )
       .next(sharedUpdateDDB1)
       .next(updateEvent(1))
+      .next(prepareTranscriptTask)
       .next(extractTopicsTask)
       .next(processTopicsMap
         .itemProcessor(processTopicTask)
       )
       .next(updateDDB(2))
       .next(updateEvent(2))
+      .next(extractTimeframesTask)
       .next(highlightExtractMap
-        .itemProcessor(extractTimeframeTask
-          .next(checkExtractionJobStatus
-            .when(sfn.Condition.numberEquals("$.timeframe_extracted.statusCode", 200),
-              mediaConvertExtractJob
-                .next(mediaConvertExtractJobParam)
-                .next(startHighlightTranscriptionJob)
-                .next(waitForHighlightTranscriptionJob)
-                .next(getHighlightTranscriptionJobStatus)
-                .next(checkHighlightTranscriptionJobStatus
-                  .when(sfn.Condition.stringEquals("$.highlightJobStatus.TranscriptionJob.TranscriptionJobStatus", "COMPLETED"),
-                    new sfn.Succeed(this, 'HighlightTranscriptionSucceeded')
-                  )
-                  .when(sfn.Condition.stringEquals("$.highlightJobStatus.TranscriptionJob.TranscriptionJobStatus", "FAILED"),
-                    new sfn.Fail(this, 'HighlightTranscriptionFailed', {
-                      cause: "Highlight transcription job failed",
-                      error: "HighlightTranscriptionJobFailed"
-                    })
-                  )
-                  .otherwise(waitForHighlightTranscriptionJob)
+        .itemProcessor(checkExtractionJobStatus
+          .when(sfn.Condition.numberEquals("$.timeframe_extracted.statusCode", 200),
+            mediaConvertExtractJob
+              .next(mediaConvertExtractJobParam)
+              .next(startHighlightTranscriptionJob)
+              .next(waitForHighlightTranscriptionJob)
+              .next(getHighlightTranscriptionJobStatus)
+              .next(checkHighlightTranscriptionJobStatus
+                .when(sfn.Condition.stringEquals("$.highlightJobStatus.TranscriptionJob.TranscriptionJobStatus", "COMPLETED"),
+                  new sfn.Succeed(this, 'HighlightTranscriptionSucceeded')
+                )
+                .when(sfn.Condition.stringEquals("$.highlightJobStatus.TranscriptionJob.TranscriptionJobStatus", "FAILED"),
+                  new sfn.Fail(this, 'HighlightTranscriptionFailed', {
+                    cause: "Highlight transcription job failed",
+                    error: "HighlightTranscriptionJobFailed"
+                  })
                 )
-            )
-            .otherwise(new sfn.Pass(this, 'ExtractionFailed', {}))
+                .otherwise(waitForHighlightTranscriptionJob)
+              )
           )
+          .otherwise(new sfn.Pass(this, 'ExtractionFailed', {}))
         )
       )
       .next(new tasks.LambdaInvoke(this, 'DetectShotChangesTask', {
@@ -0,0 +1,23 @@
+"""Put the Lambda sources and the transcript layer on the path, as the Lambda runtime does.
+
+    python -m pytest -q amplify/custom/tests
+
+Tests of modules that import boto3 or botocore are skipped where those are
+not installed.
+"""
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+for path in (
+    os.path.join('lambda-functions', 'unified-reasoning'),
+    os.path.join('lambda-functions', 'extract-timeframe'),
+    os.path.join('lambda-layers', 'transcript', 'python'),
+):
+    sys.path.insert(0, os.path.join(ROOT, path))
+
+# extract-timeframe's lambda_function reads these at import time; nothing is sent to AWS
+os.environ.setdefault('BUCKET_NAME', 'tests')
+os.environ.setdefault('HIGHLIGHT_TABLE_NAME', 'tests')
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-west-2')
@@ -0,0 +1,98 @@
+"""Random Transcribe output and the original sliding-window alignment, for comparisons."""
+import difflib
+from random import Random
+
+WORDS = (
+    "the a of and to in is that it was for on are as with they at be this from have or by "
+    "one had not but what all were when we there can an your which their said if do will each "
+    "about how up out them then she many some so these would other into has more her two like"
+).split()
+
+MATCH_THRESHOLD = 0.70
+
+
+def make_transcribe_json(word_count, seed=0, rare_share=0.3):
+    """`Transcript.json` content of `word_count` words, common and rare, with some punctuation."""
+    rng = Random(seed)
+    items = []
+    time = 0.0
+    for _ in range(word_count):
+        word = rng.choice(WORDS) if rng.random() > rare_share else f"w{rng.randrange(word_count // 3 + 1)}"
+        if rng.random() < 0.05:
+            word = word.capitalize()
+        items.append({'type': 'pronunciation', 'start_time': f"{time:.3f}", 'end_time': f"{time + 0.3:.3f}",
+                      'alternatives': [{'content': word}]})
+        time += 0.35
+        if rng.random() < 0.08:
+            items.append({'type': 'punctuation', 'alternatives': [{'content': rng.choice('.,?')}]})
+    text = ' '.join(item['alternatives'][0]['content'] for item in items)
+    return {'results': {'transcripts': [{'transcript': text}], 'items': items}}
+
+
+def make_script(json_content, seed=0, segments=3, segment_words=25, noise=0.1):
+    """Highlight script of `segments` transcript spans in order, with words dropped or replaced."""
+    rng = Random(seed)
+    words = [item['alternatives'][0]['content'] for item in json_content['results']['items']
+             if item['type'] == 'pronunciation']
+    parts = []
+    position = 0
+    for remaining in range(segments, 0, -1):
+        start = rng.randrange(position, max(position + 1, len(words) - segment_words * remaining))
+        span = words[start:start + segment_words]
+        position = start + segment_words
+        edited = []
+        for word in span:
+            roll = rng.random()
+            if roll < noise / 2:
+                continue
+            edited.append(rng.choice(WORDS) if roll < noise else word)
+        parts.append(' '.join(edited))
+    return ' [...] '.join(parts)
+
+
+def string_similarity(s1, s2):
+    words1 = s1.lower().strip().split()
+    words2 = s2.lower().strip().split()
+    return difflib.SequenceMatcher(None, words1, words2).ratio()
+
+
+def sliding_window_match(segment, items):
+    """(ratio, start, end) of the original scan: every item position, best ratio, earliest first."""
+    cleaned_segment = segment.lower()
+    window_size = min(int(len(cleaned_segment.split()) * 1.1), len(items))
+    best_ratio, best_start, best_end = 0, 0, 0
+    for j in range(len(items)):
+        current_window_size = min(window_size, len(items) - j)
+        window = ' '.join(item['alternatives'][0]['content']
+                          for item in items[j:j + current_window_size]
+                          if item['type'] == 'pronunciation')
+        ratio = string_similarity(cleaned_segment, window)
+        if ratio > best_ratio:
+            best_ratio, best_start, best_end = ratio, j, j + current_window_size
+    return best_ratio, best_start, best_end
+
+
+def sliding_window_timeframes(highlight_script, json_content):
+    """Timeframes of the original extract-timeframe `find_timeframes_for_script`."""
+    items = json_content['results']['items']
+    segments = [segment.strip() for segment in highlight_script.split("[...]") if segment.strip()]
+    timeframes = []
+    for i, segment in enumerate(segments):
+        ratio, start, end = sliding_window_match(segment, items)
+        if ratio <= MATCH_THRESHOLD:
+            continue
+        end -= 1
+        while start < end and items[start]['type'] != 'pronunciation':
+            start += 1
+        while end > start and items[end]['type'] != 'pronunciation':
+            end -= 1
+        timeframes.append((float(items[start]['start_time']), float(items[end]['end_time']), i))
+
+    merged = []
+    for start, end, index in sorted(timeframes, key=lambda t: t[0]):
+        if not merged or start > merged[-1][1]:
+            merged.append([start, end, index])
+        else:
+            merged[-1][1] = max(merged[-1][1], end)
+            merged[-1][2] = min(merged[-1][2], index)
+    return [(start, end) for start, end, _ in merged]
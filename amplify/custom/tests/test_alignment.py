@@ -0,0 +1,93 @@
+import time
+
+import pytest
+
+from alignment import (Deadline, TranscriptIndex, find_best_window, find_best_window_vectorized,
+                       min_matches_for_ratio, window_candidates)
+from helpers import MATCH_THRESHOLD, make_script, make_transcribe_json, sliding_window_match
+from transcript_model import PRONUNCIATION, Transcript
+
+
+def segments_of(script):
+    return [segment.strip() for segment in script.split("[...]") if segment.strip()]
+
+
+def window_size_of(segment, item_count):
+    return min(int(len(segment.lower().split()) * 1.1), item_count)
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_index_scorer_matches_sliding_window(seed):
+    json_content = make_transcribe_json(600, seed)
+    index = TranscriptIndex(Transcript.from_transcribe(json_content))
+    script = make_script(json_content, seed, noise=0.1 + 0.02 * (seed % 10))
+    # A segment made up of unrelated words must stay unmatched
+    script += ' [...] ' + ' '.join(f"x{k}" for k in range(20))
+
+    for segment in segments_of(script):
+        expected = sliding_window_match(segment, json_content['results']['items'])
+        ratio, start, end, _ = find_best_window(index, segment.lower().split(),
+                                                window_size_of(segment, index.item_count), MATCH_THRESHOLD)
+        if expected[0] > MATCH_THRESHOLD:
+            assert (ratio, start, end) == expected
+        else:
+            assert ratio <= MATCH_THRESHOLD
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_vectorized_scorer_matches_sliding_window(seed):
+    pytest.importorskip('numpy')
+    json_content = make_transcribe_json(400, seed)
+    index = TranscriptIndex(Transcript.from_transcribe(json_content))
+
+    for segment in segments_of(make_script(json_content, seed)):
+        expected = sliding_window_match(segment, json_content['results']['items'])
+        ratio, start, end, _ = find_best_window_vectorized(index, segment.lower().split(),
+                                                           window_size_of(segment, index.item_count),
+                                                           MATCH_THRESHOLD)
+        if expected[0] > MATCH_THRESHOLD:
+            assert (ratio, start, end) == expected
+
+
+def words_transcript(words):
+    transcript = Transcript()
+    for k, word in enumerate(words):
+        transcript.append(word, PRONUNCIATION, k * 0.4, k * 0.4 + 0.3)
+    return transcript
+
+
+def test_window_candidates_are_disjoint_and_start_after_min_start():
+    words = Transcript.from_transcribe(make_transcribe_json(500, seed=3)).pronunciation_words()
+    # The same passage spoken twice
+    index = TranscriptIndex(words_transcript(words[:300] + words[100:120] + words[300:]))
+    segment = [word.lower() for word in words[100:120]]
+
+    candidates = window_candidates(index, segment, 22, MATCH_THRESHOLD)
+    assert len(candidates) >= 2
+    assert all(ratio > MATCH_THRESHOLD for ratio, _, _ in candidates)
+    placed = sorted((start, end) for _, start, end in candidates)
+    assert all(end <= next_start for (_, end), (next_start, _) in zip(placed, placed[1:]))
+
+    later = window_candidates(index, segment, 22, MATCH_THRESHOLD, min_start=200)
+    assert later and all(start >= 200 for _, start, _ in later)
+
+
+def test_expired_deadline_keeps_exact_matches():
+    words = Transcript.from_transcribe(make_transcribe_json(300, seed=1)).pronunciation_words()
+    index = TranscriptIndex(words_transcript(words))
+    segment = [word.lower() for word in words[50:70]]
+    deadline = Deadline(time.monotonic() - 1)
+
+    ratio, start, end, _ = find_best_window(index, segment, 22, MATCH_THRESHOLD, deadline)
+    assert ratio > MATCH_THRESHOLD
+    assert start <= 50 and end >= 70
+    assert deadline.stages == ['exact']
+    assert deadline.quality() == 'exact'
+
+
+@pytest.mark.parametrize('length', [1, 5, 20, 80])
+def test_min_matches_for_ratio_bounds_the_ratio(length):
+    need = min_matches_for_ratio(length, MATCH_THRESHOLD)
+    # With one match fewer even a window of exactly those words stays below the ratio
+    assert 2 * (need - 1) / (length + need - 1) < MATCH_THRESHOLD or need == 1
+    assert 2 * need / (length + need) >= MATCH_THRESHOLD - 1e-9
@@ -0,0 +1,69 @@
+import hashlib
+import io
+
+import pytest
+
+pytest.importorskip('botocore')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from alignment_cache import AlignmentCache, segment_key  # noqa: E402
+
+
+def client_error(code, operation):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, operation)
+
+
+class ConditionalS3:
+    """Just enough S3 for the cache: objects with ETags and conditional puts."""
+
+    def __init__(self):
+        self.objects = {}
+
+    def etag(self, key):
+        return '"%s"' % hashlib.md5(self.objects[key]).hexdigest()
+
+    def get_object(self, Bucket, Key):
+        if Key not in self.objects:
+            raise client_error('NoSuchKey', 'GetObject')
+        return {'Body': io.BytesIO(self.objects[Key]), 'ETag': self.etag(Key)}
+
+    def put_object(self, Bucket, Key, Body, ContentType=None, IfMatch=None, IfNoneMatch=None):
+        exists = Key in self.objects
+        if (IfNoneMatch == '*' and exists) or (IfMatch is not None and (not exists or self.etag(Key) != IfMatch)):
+            raise client_error('PreconditionFailed', 'PutObject')
+        self.objects[Key] = Body
+        return {'ETag': self.etag(Key)}
+
+
+def test_segment_key_depends_on_text_and_settings():
+    words = ['hello', 'world']
+    assert segment_key(words, 'joint', 'index') == segment_key(list(words), 'joint', 'index')
+    assert segment_key(words, 'joint', 'index') != segment_key(words, 'independent', 'index')
+    assert segment_key(words, 'joint') != segment_key(['hello'], 'joint')
+
+
+def test_entries_survive_a_reload():
+    s3 = ConditionalS3()
+    cache = AlignmentCache.load(s3, 'bucket', 'video', 'etag-1')
+    assert cache.get('a') is None
+    cache.put('a', [0.9, 1, 5])
+    cache.save(s3, 'bucket', 'video')
+
+    reloaded = AlignmentCache.load(s3, 'bucket', 'video', 'etag-1')
+    assert reloaded.get('a') == [0.9, 1, 5]
+    # Entries of another transcript are dropped
+    assert AlignmentCache.load(s3, 'bucket', 'video', 'etag-2').get('a') is None
+
+
+def test_overlapping_runs_merge_their_entries():
+    s3 = ConditionalS3()
+    first = AlignmentCache.load(s3, 'bucket', 'video', 'etag')
+    second = AlignmentCache.load(s3, 'bucket', 'video', 'etag')
+    first.put('a', 1)
+    second.put('b', 2)
+    first.save(s3, 'bucket', 'video')
+    second.save(s3, 'bucket', 'video')
+
+    merged = AlignmentCache.load(s3, 'bucket', 'video', 'etag')
+    assert merged.entries == {'a': 1, 'b': 2}
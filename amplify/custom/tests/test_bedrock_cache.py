@@ -0,0 +1,79 @@
+import json
+
+import pytest
+
+pytest.importorskip('botocore')
+
+from bedrock_cache import BedrockCache, request_key  # noqa: E402
+
+
+class Table:
+    def __init__(self):
+        self.items = {}
+
+    def get_item(self, Key):
+        item = self.items.get(Key['key'])
+        return {'Item': item} if item else {}
+
+    def put_item(self, Item):
+        self.items[Item['key']] = Item
+
+    def delete_item(self, Key):
+        self.items.pop(Key['key'], None)
+
+
+class Bedrock:
+    def __init__(self, text):
+        self.text = text
+        self.calls = 0
+
+    def converse(self, **request):
+        self.calls += 1
+        return {
+            'output': {'message': {'content': [{'text': self.text}]}},
+            'stopReason': 'end_turn',
+            'usage': {'inputTokens': 100, 'outputTokens': 20},
+            'ResponseMetadata': {'RequestId': str(self.calls)},
+        }
+
+
+def parse(response):
+    return json.loads(response['output']['message']['content'][0]['text'])
+
+
+REQUEST = {'modelId': 'model', 'messages': [{'role': 'user', 'content': [{'text': 'hi'}]}],
+           'inferenceConfig': {'temperature': 0, 'maxTokens': 100}}
+
+
+def test_request_key_ignores_key_order():
+    reordered = {'inferenceConfig': {'maxTokens': 100, 'temperature': 0}, 'messages': REQUEST['messages'],
+                 'modelId': 'model'}
+    assert request_key(REQUEST) == request_key(reordered)
+    assert request_key(REQUEST) != request_key(dict(REQUEST, modelId='other'))
+
+
+def test_repeated_request_is_answered_from_the_cache():
+    bedrock = Bedrock('{"ok": true}')
+    cache = BedrockCache(table=Table())
+    assert cache.converse(bedrock, parse, **REQUEST) == {'ok': True}
+    assert cache.converse(bedrock, parse, **REQUEST) == {'ok': True}
+    assert bedrock.calls == 1
+    assert cache.stats()['hits'] == 1
+
+
+def test_unparsable_answer_is_not_stored():
+    bedrock = Bedrock('not json')
+    cache = BedrockCache(table=Table())
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            cache.converse(bedrock, parse, **REQUEST)
+    assert bedrock.calls == 2
+    assert cache.table.items == {}
+
+
+def test_without_a_table_every_call_goes_to_bedrock():
+    bedrock = Bedrock('{"ok": true}')
+    cache = BedrockCache()
+    cache.converse(bedrock, parse, **REQUEST)
+    cache.converse(bedrock, parse, **REQUEST)
+    assert bedrock.calls == 2
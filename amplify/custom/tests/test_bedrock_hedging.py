@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+pytest.importorskip('botocore')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bedrock_hedging import (BedrockDeadlineExceeded, CircuitBreaker, CircuitOpen, HedgedClient,  # noqa: E402
+                             LatencyHistogram)
+
+MODEL = 'model'
+
+
+def test_histogram_quantiles_are_bucket_bounds():
+    histogram = LatencyHistogram()
+    assert histogram.quantile(0.95) is None
+    for _ in range(95):
+        histogram.add(1.0)
+    for _ in range(5):
+        histogram.add(30.0)
+    assert 1.0 <= histogram.quantile(0.5) < 1.3
+    assert 30.0 <= histogram.quantile(0.99) < 40.0
+
+
+def test_breaker_opens_and_allows_one_trial_after_the_cooldown():
+    now = [0.0]
+    breaker = CircuitBreaker(failures=2, cooldown=10, clock=lambda: now[0])
+    breaker.failed()
+    assert breaker.allow()
+    breaker.failed()
+    assert not breaker.allow()
+    now[0] = 11
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.succeeded()
+    assert breaker.allow()
+
+
+class SlowFirstCall:
+    """Bedrock whose first call hangs until released; later calls answer at once."""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def converse(self, **request):
+        with self._lock:
+            self.calls += 1
+            call = self.calls
+        if call == 1:
+            self.release.wait(5)
+            return {'call': 'first'}
+        return {'call': 'duplicate'}
+
+
+def test_duplicate_answers_for_a_stuck_call():
+    bedrock = SlowFirstCall()
+    client = HedgedClient(bedrock, deadline=2, hedge=True, tokens_per_second=0, stream_idle=0)
+    try:
+        response = client.converse(modelId=MODEL, messages=[], inferenceConfig={'maxTokens': 100})
+        assert response == {'call': 'duplicate'}
+        assert client.counters['Hedged'] == 1 and client.counters['HedgeWins'] == 1
+    finally:
+        bedrock.release.set()
+
+
+def test_deadline_and_breaker_without_hedging():
+    bedrock = SlowFirstCall()
+    client = HedgedClient(bedrock, deadline=0.2, hedge=False, tokens_per_second=0, stream_idle=0)
+    client.breakers[MODEL] = CircuitBreaker(failures=1)
+    try:
+        with pytest.raises(BedrockDeadlineExceeded):
+            client.converse(modelId=MODEL, messages=[])
+        with pytest.raises(CircuitOpen):
+            client.converse(modelId=MODEL, messages=[])
+    finally:
+        bedrock.release.set()
+
+
+def test_validation_errors_pass_through():
+    class Invalid:
+        def converse(self, **request):
+            raise ClientError({'Error': {'Code': 'ValidationException', 'Message': 'bad'}}, 'Converse')
+
+    client = HedgedClient(Invalid(), deadline=5, hedge=False, tokens_per_second=0, stream_idle=0)
+    with pytest.raises(ClientError):
+        client.converse(modelId=MODEL, messages=[])
+    assert client.breakers[MODEL].allow()
@@ -0,0 +1,92 @@
+import pytest
+
+pytest.importorskip('botocore')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bedrock_limiter import (LocalBucketStore, RateLimitedClient, RateLimiter, estimate_tokens,  # noqa: E402
+                             is_throttling)
+
+MODEL = 'model'
+LIMITS = {MODEL: {'requestsPerMinute': 2, 'tokensPerMinute': 1000}}
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def limiter(clock):
+    return RateLimiter(LocalBucketStore(), LIMITS, max_wait=120, clock=clock, sleep=clock.sleep)
+
+
+def test_acquire_waits_for_the_bucket_to_refill():
+    clock = Clock()
+    rate = limiter(clock)
+    assert rate.acquire(MODEL, 100) == 100
+    assert rate.acquire(MODEL, 100) == 100
+    # Both requests of the minute are spent
+    assert rate.acquire(MODEL, 100, block=False) is None
+    assert rate.acquire(MODEL, 100) == 100
+    assert clock.now - 1000.0 >= 20
+
+
+def test_throttles_of_one_burst_halve_the_share_once():
+    clock = Clock()
+    rate = limiter(clock)
+    rate.acquire(MODEL, 100)
+    rate.throttled(MODEL)
+    rate.throttled(MODEL)
+    state, _ = rate.store.read(MODEL)
+    assert state.factor == 0.5
+    assert state.requests == 0
+
+
+def test_settlement_refunds_unused_tokens_and_caps_the_share():
+    clock = Clock()
+    rate = limiter(clock)
+    taken = rate.acquire(MODEL, 600)
+    rate.succeeded(MODEL, taken, 100)
+    state, _ = rate.store.read(MODEL)
+    assert state.tokens == pytest.approx(900)
+
+    refilled = rate._refilled(MODEL, state, clock())
+    assert refilled.factor == 1.0
+    assert refilled.tokens == pytest.approx(900)
+
+
+def test_estimate_counts_prompt_and_output_limit():
+    request = {
+        'messages': [{'role': 'user', 'content': [{'text': 'x' * 400}]}],
+        'system': [{'text': 'y' * 40}],
+        'inferenceConfig': {'maxTokens': 500},
+    }
+    assert estimate_tokens(request) == 110 + 500
+
+
+class FlakyBedrock:
+    def __init__(self, throttles):
+        self.throttles = throttles
+        self.calls = 0
+
+    def converse(self, **request):
+        self.calls += 1
+        if self.calls <= self.throttles:
+            raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'Converse')
+        return {'usage': {'inputTokens': 10, 'outputTokens': 5}}
+
+
+def test_client_retries_throttled_calls():
+    clock = Clock()
+    bedrock = FlakyBedrock(throttles=2)
+    client = RateLimitedClient(bedrock, limiter(clock))
+    response = client.converse(modelId=MODEL, messages=[], inferenceConfig={'maxTokens': 10})
+    assert response['usage']['outputTokens'] == 5
+    assert bedrock.calls == 3
+    assert is_throttling(ClientError({'Error': {'Code': 'ThrottlingException'}}, 'Converse'))
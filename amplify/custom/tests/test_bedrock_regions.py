@@ -0,0 +1,54 @@
+import pytest
+
+pytest.importorskip('botocore')
+
+from botocore.exceptions import ClientError  # noqa: E402
+
+from bedrock_regions import RegionPoolClient, serves  # noqa: E402
+
+
+def client_error(code):
+    return ClientError({'Error': {'Code': code, 'Message': code}}, 'Converse')
+
+
+class RegionClient:
+    def __init__(self, region, error=None):
+        self.region = region
+        self.error = error
+        self.calls = 0
+
+    def converse(self, **request):
+        self.calls += 1
+        if self.error:
+            raise client_error(self.error)
+        return {'region': self.region}
+
+
+def test_inference_profiles_stay_in_their_geography():
+    assert serves('us-west-2', 'us.anthropic.claude-3-7-sonnet-20250219-v1:0')
+    assert not serves('eu-west-1', 'us.anthropic.claude-3-7-sonnet-20250219-v1:0')
+    assert serves('eu-west-1', 'anthropic.claude-3-5-sonnet-20240620-v1:0')
+
+
+def test_throttled_region_fails_over():
+    clients = {'us-east-1': RegionClient('us-east-1', 'ThrottlingException'), 'us-west-2': RegionClient('us-west-2')}
+    pool = RegionPoolClient(clients)
+    for _ in range(5):
+        assert pool.converse(modelId='model', messages=[]) == {'region': 'us-west-2'}
+    assert pool.stats['us-east-1'].counters['Throttles'] == clients['us-east-1'].calls
+    assert pool.stats['us-east-1'].throttle > 0
+
+
+def test_region_without_the_model_is_skipped_from_then_on():
+    clients = {'us-east-1': RegionClient('us-east-1', 'AccessDeniedException'), 'us-west-2': RegionClient('us-west-2')}
+    pool = RegionPoolClient(clients)
+    for _ in range(5):
+        pool.converse(modelId='model', messages=[])
+    assert clients['us-east-1'].calls <= 1
+    assert pool.order('model') == ['us-west-2']
+
+
+def test_other_errors_are_raised():
+    pool = RegionPoolClient({'us-west-2': RegionClient('us-west-2', 'ValidationException')})
+    with pytest.raises(ClientError):
+        pool.converse(modelId='model', messages=[])
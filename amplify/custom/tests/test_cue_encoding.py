@@ -0,0 +1,49 @@
+from cue_encoding import (excerpt_listing, expand_regions, format_cue_lines, format_time, merge_candidates,
+                          parse_cue_ranges, rebuild_highlight)
+
+SEGMENTS = [
+    {'start': 0.0, 'end': 1.5, 'text': ['Hello', 'there', '2']},
+    {'start': 2.0, 'end': 3.0, 'text': ['general  kenobi']},
+    {'start': 4.0, 'end': 5.0, 'text': ['you are']},
+    {'start': 6.5, 'end': 8.0, 'text': ['a bold one']},
+]
+
+
+def test_format_time():
+    assert format_time(65.9) == '01:05'
+    assert format_time(3725) == '1:02:05'
+
+
+def test_cue_lines_drop_trailing_identifiers():
+    assert format_cue_lines(SEGMENTS[:2]) == ['0|00:00|Hello there', '1|00:02|general kenobi']
+
+
+def test_parse_cue_ranges_validates_and_merges():
+    assert parse_cue_ranges([[3, 2], 0, [1, 1], [9, 12], [-4, -1]], 4) == [(0, 3)]
+    assert parse_cue_ranges([[0, 0], [2, 3]], 4) == [(0, 0), (2, 3)]
+
+
+def test_rebuild_highlight_ends_ranges_at_the_next_cue():
+    highlight = rebuild_highlight({'title': 'T', 'cues': [[0, 0], [2, 3]], 'score': '8'}, SEGMENTS)
+    assert highlight['text'] == 'Hello there [...] you are a bold one'
+    # A range lasts until the next cue starts; the last cue of the transcript ends at its own end
+    assert highlight['timeframes'] == [[0.0, 2.0], [4.0, 8.0]]
+    assert highlight['score'] == 8.0
+    assert rebuild_highlight({'cues': [[7, 9]]}, SEGMENTS) is None
+
+
+def test_merge_candidates_drops_overlaps_and_keeps_order():
+    candidates = [
+        {'cues': [[10, 12]], 'score': 7.0},
+        {'cues': [[0, 3]], 'score': 9.0},
+        {'cues': [[2, 5]], 'score': 8.0},
+        {'cues': [[20, 22]], 'score': 6.0},
+    ]
+    assert merge_candidates(candidates, 2) == [candidates[1], candidates[0]]
+
+
+def test_excerpt_marks_skipped_stretches():
+    lines = [str(k) for k in range(10)]
+    regions = expand_regions([(2, 2), (5, 5)], 10, 1)
+    assert regions == [(1, 6)]
+    assert excerpt_listing(lines, [(0, 1), (5, 6)]).split('\n') == ['0', '1', '...', '5', '6', '...']
@@ -0,0 +1,34 @@
+import pytest
+
+pytest.importorskip('boto3')
+
+import lambda_function  # noqa: E402
+from helpers import make_script, make_transcribe_json, sliding_window_timeframes  # noqa: E402
+from transcript_model import Transcript  # noqa: E402
+
+
+@pytest.fixture
+def in_process(monkeypatch):
+    monkeypatch.setattr(lambda_function, 'ALIGNMENT_WORKERS', 1)
+    monkeypatch.setattr(lambda_function, 'ALIGNMENT_SCORER', 'index')
+
+
+@pytest.mark.parametrize('seed', range(10))
+def test_independent_order_matches_sliding_window(seed, in_process, monkeypatch):
+    monkeypatch.setattr(lambda_function, 'ALIGNMENT_ORDER', 'independent')
+    json_content = make_transcribe_json(800, seed)
+    script = lambda_function.preprocess_highlight_script(make_script(json_content, seed, segments=4))
+
+    timeframes = lambda_function.find_timeframes_for_script(script, Transcript.from_transcribe(json_content))
+    assert timeframes == sliding_window_timeframes(script, json_content)
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_joint_order_keeps_segments_in_order(seed, in_process, monkeypatch):
+    monkeypatch.setattr(lambda_function, 'ALIGNMENT_ORDER', 'joint')
+    json_content = make_transcribe_json(800, seed)
+    script = lambda_function.preprocess_highlight_script(make_script(json_content, seed, segments=4, noise=0.05))
+
+    timeframes = lambda_function.find_timeframes_for_script(script, Transcript.from_transcribe(json_content))
+    assert timeframes
+    assert all(end < next_start for (_, end), (next_start, _) in zip(timeframes, timeframes[1:]))
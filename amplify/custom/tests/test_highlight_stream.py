@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from highlight_stream import HighlightStreamParser
+
+HIGHLIGHTS = [
+    {'title': 'Braces {and} [brackets]', 'cues': [[1, 4]], 'score': 8},
+    {'title': 'Quote \" and backslash \\', 'cues': [[7, 9], [12, 12]], 'score': 7},
+]
+RESPONSE = ('<thought>Maybe {"highlights": not yet}</thought>\n'
+            + json.dumps({'highlights': HIGHLIGHTS, 'note': {'x': 1}}))
+
+
+@pytest.mark.parametrize('chunk', [1, 3, 17, len(RESPONSE)])
+def test_highlights_complete_as_they_stream(chunk):
+    parser = HighlightStreamParser()
+    found = []
+    for k in range(0, len(RESPONSE), chunk):
+        found.extend(parser.feed(RESPONSE[k:k + chunk]))
+    assert found == HIGHLIGHTS
+    assert parser.closed
+
+
+def test_each_highlight_is_returned_when_its_brace_closes():
+    parser = HighlightStreamParser()
+    first = json.dumps(HIGHLIGHTS[0])
+    assert parser.feed('{"highlights": [' + first[:-1]) == []
+    assert parser.feed('}, ') == [HIGHLIGHTS[0]]
+
+
+def test_unparsable_highlight_is_skipped():
+    parser = HighlightStreamParser()
+    assert parser.feed('{"highlights": [{"title": oops}, {"title": "ok"}]}') == [{'title': 'ok'}]
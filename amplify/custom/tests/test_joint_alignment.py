@@ -0,0 +1,44 @@
+from joint_alignment import align_segments_in_order, best_disjoint
+
+
+def test_best_disjoint_skips_overlaps_and_prefers_earlier_ties():
+    candidates = [(0.9, 10, 20), (0.95, 15, 25), (0.9, 30, 40), (0.9, 0, 5), (0.5, 50, 60)]
+    assert best_disjoint(candidates, 0.7, 5) == [(0.95, 15, 25), (0.9, 0, 5), (0.9, 30, 40)]
+    assert best_disjoint(candidates, 0.7, 1) == [(0.95, 15, 25)]
+
+
+def fixed_candidates(table):
+    """find_candidates over a fixed table, honouring `min_start` the way the scorers do."""
+    def find_candidates(segment_words, min_start):
+        return [c for c in table[segment_words[0]] if c[1] >= min_start]
+    return find_candidates
+
+
+def test_placements_are_chronological_and_disjoint():
+    table = {
+        'a': [(0.95, 50, 60), (0.9, 0, 10)],
+        'b': [(0.9, 10, 20)],
+        'c': [(0.9, 25, 35), (0.8, 55, 65)],
+    }
+    placements = align_segments_in_order([['a'], ['b'], ['c']], fixed_candidates(table))
+    # The best window of `a` would leave no room for `b` and `c`
+    assert placements == [(0, 0.9, 0, 10), (1, 0.9, 10, 20), (2, 0.9, 25, 35)]
+
+
+def test_overlapping_placements_are_not_combined():
+    table = {
+        'a': [(0.9, 0, 12)],
+        'b': [(0.9, 10, 20)],
+    }
+    placements = align_segments_in_order([['a'], ['b']], fixed_candidates(table))
+    assert len(placements) == 1
+
+
+def test_segment_without_candidates_is_skipped():
+    table = {'a': [(0.9, 0, 10)], 'b': [], 'c': [(0.8, 30, 40)]}
+    placements = align_segments_in_order([['a'], ['b'], ['c']], fixed_candidates(table))
+    assert [i for i, _, _, _ in placements] == [0, 2]
+
+
+def test_no_candidates_at_all():
+    assert align_segments_in_order([['a']], lambda words, min_start: []) == []
@@ -0,0 +1,43 @@
+from alignment import TranscriptIndex
+from helpers import MATCH_THRESHOLD, make_transcribe_json
+from local_alignment import banded_local_alignment, find_best_span, span_candidates
+from transcript_model import PRONUNCIATION, Transcript
+
+
+def words_transcript(words):
+    transcript = Transcript()
+    for k, word in enumerate(words):
+        transcript.append(word, PRONUNCIATION, k * 0.4, k * 0.4 + 0.3)
+    return transcript
+
+
+def test_banded_alignment_finds_a_verbatim_run():
+    tokens = "x y z the quick brown fox jumps w v".split()
+    segment = "the quick brown fox jumps".split()
+    score, first, last = banded_local_alignment(segment, tokens, diagonal=3, band=4)
+    assert (first, last) == (3, 7)
+    assert score == 2 * len(segment)
+    assert banded_local_alignment(segment, tokens, diagonal=3, band=4, score_to_beat=score) is None
+
+
+def test_best_span_covers_an_edited_passage():
+    words = Transcript.from_transcribe(make_transcribe_json(400, seed=2)).pronunciation_words()
+    index = TranscriptIndex(words_transcript(words))
+    segment = [word.lower() for word in words[200:230]]
+    del segment[10]
+
+    ratio, start, end, _ = find_best_span(index, segment, 0, MATCH_THRESHOLD)
+    assert ratio > 0.9
+    assert abs(start - 200) <= 1 and abs(end - 230) <= 1
+
+
+def test_span_candidates_start_after_min_start():
+    words = Transcript.from_transcribe(make_transcribe_json(300, seed=4)).pronunciation_words()
+    passage = words[40:60]
+    index = TranscriptIndex(words_transcript(words[:150] + passage + words[150:]))
+    segment = [word.lower() for word in passage]
+
+    everywhere = span_candidates(index, segment, 0, MATCH_THRESHOLD)
+    assert sorted(start for _, start, _ in everywhere)[:2] == [40, 150]
+    later = span_candidates(index, segment, 0, MATCH_THRESHOLD, min_start=100)
+    assert [start for _, start, _ in later] == [150]
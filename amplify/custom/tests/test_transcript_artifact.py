@@ -0,0 +1,41 @@
+import pytest
+
+pytest.importorskip('botocore')
+
+import transcript_artifact  # noqa: E402
+from helpers import make_transcribe_json  # noqa: E402
+from transcript_model import Transcript  # noqa: E402
+
+VTT = """WEBVTT
+
+1
+00:00:00.000 --> 00:00:02.500
+Hello there
+
+2
+00:00:02.500 --> 00:00:04.000
+안녕하세요
+"""
+
+
+def test_round_trip_keeps_every_field():
+    transcript = Transcript.from_transcribe(make_transcribe_json(200, seed=5))
+    transcript.load_cues(VTT)
+
+    loaded = transcript_artifact.loads(transcript_artifact.dumps(transcript))
+    assert loaded.text == transcript.text
+    assert loaded.vocab == transcript.vocab
+    assert loaded.kinds == transcript.kinds
+    assert loaded.cue_texts == transcript.cue_texts
+    for name in transcript_artifact.ARRAY_FIELDS:
+        # Bytes, as punctuation times are NaN
+        assert getattr(loaded, name).tobytes() == getattr(transcript, name).tobytes(), name
+    assert loaded.pronunciation_words() == transcript.pronunciation_words()
+    assert loaded.segments() == transcript.segments()
+    # Interning keeps working on a loaded transcript
+    assert loaded.intern(transcript.vocab[0]) == 0
+
+
+def test_other_data_is_rejected():
+    with pytest.raises(ValueError):
+        transcript_artifact.loads(b'{"results": {}}')
@@ -49,12 +49,16 @@ const schema = a.schema({
   StageChanged: a.customType({
     videoId: a.string().required(),
     stage: a.integer().required(),
+    highlight: a.string(),
+    title: a.string(),
   }),
 
   publish: a.mutation()
     .arguments({
       videoId: a.string().required(),
-      stage: a.integer().required()
+      stage: a.integer().required(),
+      highlight: a.string(),
+      title: a.string()
     })
     .returns(a.ref("StageChanged"))
     .authorization((allow) => [allow.authenticated(), allow.guest()])
@@ -20,6 +20,8 @@ const VideoShortify: React.FC<VideoShortifyProps> = () => {
   const [ stage, setStage ] = useState(-1);
   const [ selectedTab, setSelectedTab ] = useState(0);
   const [ highlightTitle, setHighlightTitle ] = useState("")
+  // Titles of highlights saved while reasoning is still running, by highlight index
+  const [ earlyHighlights, setEarlyHighlights ] = useState<{ [index: string]: string }>({});
   const [ isLoadingNextStep, setIsLoadingNextStep ] = useState(false);
   const childRef = useRef<{ submit: () => void }>(null);
 
@@ -38,6 +40,11 @@ const VideoShortify: React.FC<VideoShortifyProps> = () => {
     const sub = subscribe(id!).subscribe({
       next: (event) => {
         console.log(event);
+        if (event.highlight != null) {
+          // A highlight saved mid-step; it does not change the stage
+          setEarlyHighlights((titles) => ({ ...titles, [event.highlight!]: event.title ?? "" }));
+          return;
+        }
         setStage(event.stage);
       },
       error: (err) => {
@@ -105,7 +112,9 @@ const VideoShortify: React.FC<VideoShortifyProps> = () => {
           content: (
             stage > 1 ?
             <HighlightComponent id={id!} onTabChange={onTabChangeHandler}/>
-            : <InProgressComponent />
+            : <InProgressComponent items={Object.keys(earlyHighlights)
+                .sort((a, b) => Number(a) - Number(b))
+                .map((index) => `Highlight ${Number(index) + 1}: ${earlyHighlights[index]}`)} />
           ),
         },
         {
@@ -1,8 +1,12 @@
 import React, {} from 'react';
 import {Flashbar } from '@cloudscape-design/components';
 
+interface InProgressProps {
+  // Results that are already known while the step is still running
+  items?: string[];
+}
 
-const InProgressComponent: React.FC = () => {
+const InProgressComponent: React.FC<InProgressProps> = ({ items = [] }) => {
 
   return (
 
@@ -12,7 +16,12 @@ const InProgressComponent: React.FC = () => {
               type: "in-progress",
               loading: true,
               content: "in progresss",
-          }
+          },
+          ...items.map((item, index) => ({
+              id: `item-${index}`,
+              type: "info" as const,
+              content: item,
+          }))
           ]}
         />
 